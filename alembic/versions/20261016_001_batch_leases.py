@@ -0,0 +1,43 @@
+"""batch leases + per-project batch progress
+
+Revision ID: 20261016_001
+Revises: cdbbe8148cee
+Create Date: 2026-10-16 10:00 UTC
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+revision = "20261016_001"
+down_revision = "cdbbe8148cee"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("batches", sa.Column("lease_owner", sa.Text))
+    op.add_column("batches", sa.Column("lease_until", sa.DateTime))
+    op.create_index(
+        "batches_lease_until_idx",
+        "batches",
+        ["lease_until"],
+        postgresql_where=sa.text("status = 'process'"),
+    )
+
+    op.create_table(
+        "batch_results",
+        sa.Column("batch_id", sa.Integer,
+                  sa.ForeignKey("batches.id", ondelete="CASCADE"),
+                  primary_key=True),
+        sa.Column("idx", sa.Integer, primary_key=True),
+        sa.Column("result", JSONB, nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("batch_results")
+    op.drop_index("batches_lease_until_idx", table_name="batches")
+    op.drop_column("batches", "lease_until")
+    op.drop_column("batches", "lease_owner")
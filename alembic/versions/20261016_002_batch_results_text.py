@@ -0,0 +1,23 @@
+"""batch_results.text — raw model answer for the bulk judgement merge
+
+Revision ID: 20261016_002
+Revises: 20261016_001
+Create Date: 2026-10-16 12:00 UTC
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261016_002"
+down_revision = "20261016_001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("batch_results", sa.Column("text", sa.Text))
+
+
+def downgrade() -> None:
+    op.drop_column("batch_results", "text")
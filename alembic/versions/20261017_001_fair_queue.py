@@ -0,0 +1,47 @@
+"""fair queuing: batches.submitter/priority/vtime + queue_tenants
+
+Revision ID: 20261017_001
+Revises: 20261016_002
+Create Date: 2026-10-17 10:00 UTC
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261017_001"
+down_revision = "20261016_002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("batches", sa.Column("submitter", sa.Text, nullable=False,
+                                       server_default="anon"))
+    op.add_column("batches", sa.Column("priority", sa.SmallInteger, nullable=False,
+                                       server_default="10"))
+    op.add_column("batches", sa.Column("vtime", sa.BigInteger, nullable=False,
+                                       server_default="0"))
+    op.create_index(
+        "batches_fair_queue_idx",
+        "batches",
+        ["priority", "vtime", "id"],
+        postgresql_where=sa.text("status = 'new'"),
+    )
+
+    op.create_table(
+        "queue_tenants",
+        sa.Column("submitter", sa.Text, primary_key=True),
+        sa.Column("weight", sa.Integer, nullable=False, server_default="1"),
+        sa.Column("last_finish", sa.BigInteger, nullable=False,
+                  server_default="0"),
+        sa.CheckConstraint("weight > 0", name="queue_tenants_weight_check"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("queue_tenants")
+    op.drop_index("batches_fair_queue_idx", table_name="batches")
+    op.drop_column("batches", "vtime")
+    op.drop_column("batches", "priority")
+    op.drop_column("batches", "submitter")
@@ -0,0 +1,33 @@
+"""eval_cache — content-hash dedup of project evaluations
+
+Revision ID: 20261017_002
+Revises: 20261017_001
+Create Date: 2026-10-17 12:00 UTC
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261017_002"
+down_revision = "20261017_001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "eval_cache",
+        sa.Column("content_hash", sa.Text, primary_key=True),
+        sa.Column("owner", sa.Text),
+        sa.Column("verdict", sa.Text),
+        sa.Column("explanation", sa.Text),
+        sa.Column("text", sa.Text),
+        sa.Column("tokens", sa.Integer),
+        sa.Column("created_at", sa.DateTime, nullable=False,
+                  server_default=sa.text("NOW()")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("eval_cache")
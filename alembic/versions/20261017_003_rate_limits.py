@@ -0,0 +1,32 @@
+"""rate_limits — shared OpenAI RPM/TPM token buckets
+
+Revision ID: 20261017_003
+Revises: 20261017_002
+Create Date: 2026-10-17 14:00 UTC
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261017_003"
+down_revision = "20261017_002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "rate_limits",
+        sa.Column("key", sa.Text, primary_key=True),
+        sa.Column("rpm", sa.Float, nullable=False),
+        sa.Column("tpm", sa.Float, nullable=False),
+        sa.Column("req_level", sa.Float, nullable=False),
+        sa.Column("tok_level", sa.Float, nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False,
+                  server_default=sa.text("clock_timestamp()")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("rate_limits")
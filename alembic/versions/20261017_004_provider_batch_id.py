@@ -0,0 +1,23 @@
+"""batches.provider_batch_id — OpenAI Batch API job id
+
+Revision ID: 20261017_004
+Revises: 20261017_003
+Create Date: 2026-10-17 15:00 UTC
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261017_004"
+down_revision = "20261017_003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("batches", sa.Column("provider_batch_id", sa.Text, nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("batches", "provider_batch_id")
@@ -0,0 +1,30 @@
+"""token_ledger — process-safe monthly GPT token budget
+
+Revision ID: 20261017_005
+Revises: 20261017_004
+Create Date: 2026-10-17 16:00 UTC
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261017_005"
+down_revision = "20261017_004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "token_ledger",
+        sa.Column("month", sa.Text, primary_key=True),
+        sa.Column("model", sa.Text, primary_key=True),
+        sa.Column("used", sa.BigInteger, nullable=False, server_default="0"),
+        sa.Column("reserved", sa.BigInteger, nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime, nullable=False, server_default=sa.func.now()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("token_ledger")
@@ -0,0 +1,32 @@
+"""response_cache — persistent tier of the GPT response cache
+
+Revision ID: 20261017_006
+Revises: 20261017_005
+Create Date: 2026-10-17 17:00 UTC
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261017_006"
+down_revision = "20261017_005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "response_cache",
+        sa.Column("key", sa.Text, primary_key=True),
+        sa.Column("model", sa.Text, nullable=False),
+        sa.Column("answer", sa.Text, nullable=False),
+        sa.Column("tokens", sa.Integer, nullable=True),
+        sa.Column("created_at", sa.DateTime, nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index("response_cache_created_at_idx", "response_cache", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("response_cache_created_at_idx", table_name="response_cache")
+    op.drop_table("response_cache")
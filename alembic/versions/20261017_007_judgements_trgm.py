@@ -0,0 +1,29 @@
+"""pg_trgm GIN index on gpt_judgements.project — near-duplicate name lookup
+
+Revision ID: 20261017_007
+Revises: 20261017_006
+Create Date: 2026-10-17 21:00 UTC
+"""
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20261017_007"
+down_revision = "20261017_006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "gpt_judgements_project_trgm_idx",
+        "gpt_judgements",
+        ["project"],
+        postgresql_using="gin",
+        postgresql_ops={"project": "gin_trgm_ops"},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("gpt_judgements_project_trgm_idx", table_name="gpt_judgements")
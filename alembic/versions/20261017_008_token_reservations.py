@@ -0,0 +1,41 @@
+"""token_reservations — per-call budget reservations with expiry
+
+Revision ID: 20261017_008
+Revises: 20261017_007
+Create Date: 2026-10-17 22:00 UTC
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261017_008"
+down_revision = "20261017_007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "token_reservations",
+        sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+        sa.Column("month", sa.Text, nullable=False),
+        sa.Column("model", sa.Text, nullable=False),
+        sa.Column("owner", sa.Text, nullable=False),
+        sa.Column("tokens", sa.BigInteger, nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index(
+        "token_reservations_month_idx", "token_reservations", ["month", "expires_at"]
+    )
+    # агрегированный резерв терял токены навсегда, если процесс умирал до settle
+    op.drop_column("token_ledger", "reserved")
+
+
+def downgrade() -> None:
+    op.add_column(
+        "token_ledger",
+        sa.Column("reserved", sa.BigInteger, nullable=False, server_default="0"),
+    )
+    op.drop_index("token_reservations_month_idx", table_name="token_reservations")
+    op.drop_table("token_reservations")
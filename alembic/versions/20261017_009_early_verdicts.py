@@ -0,0 +1,32 @@
+"""batches.early_verdicts — streamed verdicts visible before the batch commits
+
+Revision ID: 20261017_009
+Revises: 20261017_008
+Create Date: 2026-10-17 23:00 UTC
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "20261017_009"
+down_revision = "20261017_008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "batches",
+        sa.Column(
+            "early_verdicts",
+            postgresql.JSONB,
+            nullable=False,
+            server_default=sa.text("'{}'::jsonb"),
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("batches", "early_verdicts")
@@ -7,27 +7,47 @@ FastAPI-сервер CryptoZayka.
 • /health      — probe для Docker / LB
 • /metrics     — Prometheus-метрики
 • /batch/*     — приём и статус батчей
-• /project/*   — готовый вердикт
+• /project/*   — готовый вердикт, похожие по имени (pg_trgm)
 • /stats/tokens— usage GPT-токенов по месяцам
 """
 from __future__ import annotations
 
+import hmac
+import json
 import logging
+import os
 from datetime import datetime
-from typing import List
+from typing import List, Literal
 
-from fastapi import FastAPI, HTTPException, Path, Response, status
+from fastapi import FastAPI, Header, HTTPException, Path, Query, Request, Response, status
 from pydantic import BaseModel, Field
 from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 # внутренние модули
 from .core.executor import start_worker
 from .core.gpt_client import load_usage
-from .storage.pg import add_batch, get_pool, load_month_stats
+from .core import llm_gateway, similar
+from .storage.pg import (
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    add_batch,
+    close_listener,
+    get_pool,
+    load_month_stats,
+)
 
 log = logging.getLogger(__name__)
 app = FastAPI(title="CryptoZayka API", version="0.4")
 
+# доверенные клиенты (бот) шлют X-Api-Key и сами задают submitter/priority;
+# остальным submitter = их IP, priority — по размеру batch'а
+API_KEY = os.getenv("ZAYKA_API_KEY")
+
+
+def _trusted(key: str | None) -> bool:
+    return bool(API_KEY) and key is not None and hmac.compare_digest(key, API_KEY)
+
+
 # ─────────── схемы ────────────
 class ProjectIn(BaseModel):
     name: str = Field(..., examples=["LayerZero"])
@@ -42,6 +62,8 @@ class BatchStatus(BaseModel):
     batch_id: int
     status: str
     size: int
+    # idx проекта → вердикт, пришедший стримом до завершения batch'а
+    early_verdicts: dict[int, str] = Field(default_factory=dict)
 
 
 class VerdictOut(BaseModel):
@@ -50,6 +72,12 @@ class VerdictOut(BaseModel):
     text: str
 
 
+class SimilarOut(BaseModel):
+    project: str
+    verdict: str
+    similarity: float
+
+
 class StatsOut(BaseModel):
     month: str
     tokens_used: int
@@ -68,12 +96,32 @@ async def metrics() -> Response:
 
 # ─────────── batch flow ────────────
 @app.post("/batch/submit", response_model=BatchOut, tags=["batch"])
-async def submit_batch(projects: List[ProjectIn]):
+async def submit_batch(
+    projects: List[ProjectIn],
+    request: Request,
+    submitter: str | None = Query(
+        None, max_length=64, description="Tenant for fair queuing (requires X-Api-Key)"
+    ),
+    priority: Literal["interactive", "bulk"] | None = Query(
+        None,
+        description="Requires X-Api-Key. Default: interactive for one project, bulk otherwise",
+    ),
+    x_api_key: str | None = Header(None),
+):
     """Принимает список проектов, создаёт batch со статусом 'new'."""
     if not projects:
         raise HTTPException(400, "Empty list")
-
-    bid = await add_batch([p.model_dump() for p in projects])
+    if (submitter is not None or priority is not None) and not _trusted(x_api_key):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, "submitter/priority require a valid X-Api-Key")
+    if submitter is None:
+        submitter = f"ip:{request.client.host}" if request.client else "anon"
+
+    prio = None
+    if priority is not None:
+        prio = PRIORITY_INTERACTIVE if priority == "interactive" else PRIORITY_BULK
+    bid = await add_batch(
+        [p.model_dump() for p in projects], submitter=submitter, priority=prio
+    )
     return {"batch_id": bid}
 
 
@@ -83,16 +131,39 @@ async def batch_status(batch_id: int = Path(..., ge=1)):
     pool = await get_pool()
     async with pool.acquire() as conn:
         row = await conn.fetchrow(
-            "SELECT status, jsonb_array_length(payload) AS size "
+            "SELECT status, jsonb_array_length(payload) AS size, early_verdicts "
             "FROM batches WHERE id=$1",
             batch_id,
         )
     if not row:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Batch not found")
-    return {"batch_id": batch_id, "status": row["status"], "size": row["size"]}
+    return {
+        "batch_id": batch_id,
+        "status": row["status"],
+        "size": row["size"],
+        "early_verdicts": json.loads(row["early_verdicts"]),
+    }
 
 
 # ─────────── project verdict ────────────
+@app.get("/project/similar/{name}", response_model=List[SimilarOut], tags=["projects"])
+async def project_similar(
+    name: str,
+    threshold: float = Query(similar.THRESHOLD, ge=0.05, le=1.0),
+    limit: int = Query(10, ge=1, le=100),
+):
+    """Оценённые проекты с похожим именем (опечатки, клоны) — самые похожие первыми."""
+    try:
+        matches = await similar.find(name, threshold=threshold, limit=limit)
+    except similar.MISSING_TRGM as e:
+        log.warning("similar lookup unavailable: %s", e)
+        raise HTTPException(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            "Similar-name search unavailable: pg_trgm extension is not installed",
+        ) from None
+    return [m._asdict() for m in matches]
+
+
 @app.get("/project/{name}", response_model=VerdictOut, tags=["projects"])
 async def project_verdict(name: str):
     """Готовый вердикт для проекта; 404 если ещё не оценён."""
@@ -125,6 +196,8 @@ async def _startup() -> None:
 
 @app.on_event("shutdown")
 async def _shutdown() -> None:
+    await close_listener()
+    await llm_gateway.close()
     pool = await get_pool()
     await pool.close()
     log.info("API shutdown complete")
@@ -10,7 +10,7 @@ import typer
 from rich import print as rprint
 
 from .storage import add_batch
-from .worker import worker_loop
+from .worker import LOG_FORMAT, run_procs, worker_loop
 from .treasury.eth import topup_min_reserve, collect_eth, _WALLETS
 
 app = typer.Typer(help="CryptoZayka command‑line interface")
@@ -29,9 +29,16 @@ def load(path: Path = typer.Argument(..., exists=True, readable=True)):
 
 # ─────────────────────────── worker cmd ─────────────────────────
 @app.command()
-def worker():
+def worker(
+    procs: int = typer.Option(1, "--procs", "-p", min=1, help="Number of worker processes"),
+):
     """Run endless worker loop (Ctrl+C to stop)."""
-    logging.basicConfig(level="INFO", format="%(asctime)s | %(levelname)-8s | %(name)s | %(message)s")
+    logging.basicConfig(level="INFO", format=LOG_FORMAT)
+    if procs > 1:
+        rprint(f"[bold]🚀 Supervising {procs} worker processes. Press CTRL+C to drain & exit…[/]")
+        run_procs(procs)
+        return
+
     rprint("[bold]🚀 Worker started. Press CTRL+C to exit…[/]")
     try:
         asyncio.run(worker_loop())
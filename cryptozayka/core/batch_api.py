@@ -0,0 +1,175 @@
+"""OpenAI Batch API mode for large batches.
+
+Вместо тысяч синхронных chat.completions крупный batch (≥ BATCH_API_THRESHOLD
+проектов) уходит одним файлом:
+
+  1. JSONL с custom_id = "<batch_id>:<idx>" → files.create(purpose="batch");
+  2. batches.create(endpoint="/v1/chat/completions", completion_window="24h"),
+     id провайдерского job'а сохраняется в batches.provider_batch_id —
+     после рестарта воркера продолжаем опрос, а не платим второй раз;
+  3. опрос batches.retrieve раз в BATCH_API_POLL с;
+  4. output-файл читается потоком и идёт через parsers.results.iter_replies.
+
+Базовый URL берётся клиентом из OPENAI_BASE_URL — так же работает и с
+локальной заглушкой files/batches в тестах.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, AsyncIterator
+
+from . import strategy
+from .strategy import EvaluationResult, Verdict
+from ..parsers.results import iter_replies
+from ..storage.pg import get_pool
+
+log = logging.getLogger(__name__)
+
+BATCH_API_THRESHOLD = int(os.getenv("OPENAI_BATCH_THRESHOLD", "500"))   # 0 — выкл.
+BATCH_API_POLL = float(os.getenv("OPENAI_BATCH_POLL", "30"))            # секунд
+ENDPOINT = "/v1/chat/completions"
+_FINAL = {"completed", "failed", "expired", "cancelled"}
+
+
+def enabled_for(size: int) -> bool:
+    return BATCH_API_THRESHOLD > 0 and size >= BATCH_API_THRESHOLD
+
+
+def _custom_id(bid: int, idx: int) -> str:
+    return f"{bid}:{idx}"
+
+
+def build_jsonl(bid: int, items: list[tuple[int, dict[str, Any]]]) -> bytes:
+    """Строки запроса Batch API для проектов batch'а *bid*."""
+    lines = []
+    for idx, proj in items:
+        prompt = strategy._prepare_prompt(proj.get("name", "Unnamed"), proj.get("description", ""))
+        lines.append(json.dumps({
+            "custom_id": _custom_id(bid, idx),
+            "method": "POST",
+            "url": ENDPOINT,
+            "body": {
+                "model": strategy.MODEL,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": strategy.TEMPERATURE,
+                "max_tokens": strategy.MAX_TOKENS,
+                **strategy._format_kwargs(),
+            },
+        }, ensure_ascii=False))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# ───────────────── storage helpers ────────────────────────────────────────
+async def _load_provider_id(bid: int) -> str | None:
+    pool = await get_pool()
+    async with pool.acquire() as c:
+        return await c.fetchval("SELECT provider_batch_id FROM batches WHERE id=$1", bid)
+
+
+async def _save_provider_id(bid: int, provider_id: str) -> None:
+    pool = await get_pool()
+    async with pool.acquire() as c:
+        await c.execute("UPDATE batches SET provider_batch_id=$2 WHERE id=$1", bid, provider_id)
+
+
+# ───────────────── provider calls ─────────────────────────────────────────
+async def _submit(bid: int, items: list[tuple[int, dict[str, Any]]]) -> str:
+    client = strategy.client
+    upload = await client.files.create(
+        file=(f"zayka-{bid}.jsonl", build_jsonl(bid, items), "application/jsonl"),
+        purpose="batch",
+    )
+    job = await client.batches.create(
+        input_file_id=upload.id,
+        endpoint=ENDPOINT,
+        completion_window="24h",
+        metadata={"zayka_batch": str(bid)},
+    )
+    log.info("batch %s → OpenAI batch %s (%d requests)", bid, job.id, len(items))
+    return job.id
+
+
+async def _wait(provider_id: str) -> Any:
+    while True:
+        job = await strategy.client.batches.retrieve(provider_id)
+        if job.status in _FINAL:
+            return job
+        log.debug("OpenAI batch %s: %s", provider_id, job.status)
+        await asyncio.sleep(BATCH_API_POLL)
+
+
+async def _iter_output(file_id: str) -> AsyncIterator[tuple[str, str, int | None]]:
+    """Output-файл построчно, прямо из HTTP-потока, через results-парсер."""
+    async with strategy.client.files.with_streaming_response.content(file_id) as resp:
+        async for line in resp.iter_lines():
+            for item in iter_replies((line,), file_id):
+                yield item
+
+
+# ───────────────── public API ─────────────────────────────────────────────
+async def evaluate_batch(
+    bid: int,
+    items: list[tuple[int, dict[str, Any]]],
+) -> dict[int, EvaluationResult]:
+    """
+    Оценить *items* ([(idx, project), …]) через Batch API.
+    Возвращает {idx: EvaluationResult}; не вернувшиеся — Verdict.ERROR.
+    """
+    provider_id = await _load_provider_id(bid)
+    if provider_id is None:
+        provider_id = await _submit(bid, items)
+        await _save_provider_id(bid, provider_id)
+    else:
+        log.info("batch %s: resuming OpenAI batch %s", bid, provider_id)
+
+    job = await _wait(provider_id)
+
+    names = {idx: proj.get("name", "Unnamed") for idx, proj in items}
+    out: dict[int, EvaluationResult] = {}
+    if not job.output_file_id:
+        log.warning("batch %s: OpenAI batch %s %s without output", bid, provider_id, job.status)
+        return _fill_missing(out, names, provider_id, job.status)
+
+    async for custom_id, reply, tokens in _iter_output(job.output_file_id):
+        _, _, idx_s = custom_id.partition(":")
+        if not idx_s.isdigit() or int(idx_s) not in names:
+            log.warning("batch %s: unknown custom_id %r", bid, custom_id)
+            continue
+        idx = int(idx_s)
+        try:
+            verdict, explanation = strategy._parse_answer(reply)
+        except Exception as exc:
+            verdict, explanation = Verdict.ERROR, f"Evaluation error: {exc}"
+        out[idx] = EvaluationResult(
+            project=names[idx],
+            verdict=verdict,
+            explanation=explanation,
+            raw_model_answer=reply,
+            tokens=tokens,
+        )
+
+    log.info("batch %s: OpenAI batch %s %s, %d/%d answers",
+             bid, provider_id, job.status, len(out), len(items))
+    return _fill_missing(out, names, provider_id, job.status)
+
+
+def _fill_missing(
+    out: dict[int, EvaluationResult],
+    names: dict[int, str],
+    provider_id: str,
+    status: str,
+) -> dict[int, EvaluationResult]:
+    """Проекты без ответа в output-файле → Verdict.ERROR."""
+    for idx, name in names.items():
+        if idx not in out:
+            msg = f"Evaluation error: no result in OpenAI batch {provider_id} ({status})"
+            out[idx] = EvaluationResult(
+                project=name,
+                verdict=Verdict.ERROR,
+                explanation=msg,
+                raw_model_answer=msg,
+            )
+    return out
@@ -0,0 +1,219 @@
+"""Process-safe monthly token ledger (replaces /app/data/spent_tokens.json).
+
+Счётчики живут в таблице token_ledger, строка на (месяц, модель):
+used — фактически потрачено. Резервы идущих вызовов — отдельные строки
+token_reservations (владелец хост:pid, expires_at).
+
+  • reserve(model, estimate, limit) — перед вызовом: под advisory-lock'ом
+    месяца снимаем протухшие резервы (процесс умер между reserve и settle),
+    проверяем  Σused + Σreserved + estimate ≤ limit  и вставляем резерв
+    на BUDGET_RESERVATION_TTL с. Параллельные воркеры больше не теряют
+    инкременты и не пробивают MAX_BUDGET вместе;
+  • settle(reservation, used) — после ответа: удаляем резерв, прибавляем
+    usage.total_tokens (used=0 — вызов не состоялся).
+
+Чтения (load_usage, метрики) идут из снапшота в памяти процесса, который
+обновляется из RETURNING каждой записи и refresh() — без I/O на горячем пути.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime
+from typing import Any, NamedTuple
+
+import asyncpg
+
+from ..storage.pg import _dsn, get_pool
+
+log = logging.getLogger(__name__)
+
+# резерв дольше самого медленного вызова с ретраями; после — считаем брошенным
+RESERVATION_TTL = max(60, int(os.getenv("BUDGET_RESERVATION_TTL", "900")))
+
+
+class BudgetExceeded(RuntimeError):
+    """Резерв не помещается в месячный лимит."""
+
+
+class Reservation(NamedTuple):
+    month: str
+    model: str
+    tokens: int
+    id: int | None = None      # строка token_reservations; None — резерва нет
+
+
+def current_month() -> str:
+    """Текущий месяц (UTC) в формате YYYY-MM."""
+    return datetime.utcnow().strftime("%Y-%m")
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# ───────────────── SQL (на любом соединении: из пула или разовом) ─────────
+async def _reserve(
+    c: Any, month: str, model: str, tokens: int, limit: int, owner: str, ttl: float
+) -> int | None:
+    """id нового резерва или None, если лимит не пускает."""
+    async with c.transaction():
+        await c.execute("SELECT pg_advisory_xact_lock(hashtext('token_ledger:' || $1))", month)
+        stale = await c.fetch(
+            """
+            DELETE FROM token_reservations
+            WHERE month = $1 AND expires_at < now()
+            RETURNING owner, tokens
+            """,
+            month,
+        )
+        if stale:
+            log.warning(
+                "reclaimed %d stale token reservation(s), %d tokens: %s",
+                len(stale),
+                sum(r["tokens"] for r in stale),
+                sorted({r["owner"] for r in stale}),
+            )
+        total = await c.fetchval(
+            """
+            SELECT (SELECT COALESCE(SUM(used), 0) FROM token_ledger WHERE month = $1)
+                 + (SELECT COALESCE(SUM(tokens), 0) FROM token_reservations WHERE month = $1)
+            """,
+            month,
+        )
+        if total + tokens > limit:
+            return None
+        return await c.fetchval(
+            """
+            INSERT INTO token_reservations(month, model, owner, tokens, expires_at)
+            VALUES ($1, $2, $3, $4, now() + make_interval(secs => $5))
+            RETURNING id
+            """,
+            month,
+            model,
+            owner,
+            tokens,
+            ttl,
+        )
+
+
+async def _settle(c: Any, month: str, model: str, reservation_id: int | None, used: int) -> int:
+    return await c.fetchval(
+        """
+        WITH r AS (
+          DELETE FROM token_reservations WHERE id = $3
+        )
+        INSERT INTO token_ledger(month, model, used) VALUES ($1, $2, $4)
+        ON CONFLICT (month, model) DO UPDATE
+          SET used = token_ledger.used + EXCLUDED.used,
+              updated_at = now()
+        RETURNING used
+        """,
+        month,
+        model,
+        reservation_id,
+        used,
+    )
+
+
+async def _fetch(c: Any, month: str) -> dict[str, int]:
+    rows = await c.fetch("SELECT model, used FROM token_ledger WHERE month = $1", month)
+    return {r["model"]: r["used"] for r in rows}
+
+
+async def _reset(c: Any, month: str) -> None:
+    async with c.transaction():
+        await c.execute("DELETE FROM token_ledger WHERE month = $1", month)
+        await c.execute("DELETE FROM token_reservations WHERE month = $1", month)
+
+
+# ───────────────── ledger ─────────────────────────────────────────────────
+class TokenLedger:
+    def __init__(self) -> None:
+        self._snapshot: dict[str, dict[str, int]] = {}   # month → {model: used}
+
+    # ─── snapshot (синхронные чтения) ───
+    def snapshot(self, month: str | None = None) -> dict[str, int]:
+        return dict(self._snapshot.get(month or current_month(), {}))
+
+    def used(self, month: str | None = None) -> int:
+        return sum(self.snapshot(month).values())
+
+    def _put(self, month: str, model: str, used: int) -> None:
+        self._snapshot.setdefault(month, {})[model] = used
+
+    # ─── async API ───
+    async def refresh(self, month: str | None = None) -> dict[str, int]:
+        month = month or current_month()
+        pool = await get_pool()
+        async with pool.acquire() as c:
+            self._snapshot[month] = await _fetch(c, month)
+        return self.snapshot(month)
+
+    async def reserve(self, model: str, tokens: int, limit: int) -> Reservation:
+        month = current_month()
+        pool = await get_pool()
+        async with pool.acquire() as c:
+            rid = await _reserve(c, month, model, tokens, limit, _owner(), float(RESERVATION_TTL))
+        if rid is None:
+            raise BudgetExceeded("GPT budget exceeded for current month")
+        return Reservation(month, model, tokens, rid)
+
+    async def settle(self, res: Reservation, used: int | None) -> None:
+        """used=None — usage неизвестен, списываем оценку целиком."""
+        actual = res.tokens if used is None else used
+        pool = await get_pool()
+        async with pool.acquire() as c:
+            new = await _settle(c, res.month, res.model, res.id, actual)
+        self._put(res.month, res.model, new)
+
+    async def add(self, model: str, tokens: int) -> None:
+        await self.settle(Reservation(current_month(), model, 0), tokens)
+
+    async def reset(self, month: str | None = None) -> None:
+        month = month or current_month()
+        pool = await get_pool()
+        async with pool.acquire() as c:
+            await _reset(c, month)
+        self._snapshot[month] = {}
+
+
+ledger = TokenLedger()
+
+_background: set[asyncio.Task[Any]] = set()
+
+
+def run_sync(fn: Any, *args: Any) -> None:
+    """
+    Выполнить *fn(conn, …)* из синхронного кода: внутри event loop —
+    фоновой задачей на пуле, без loop'а — на разовом соединении.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        async def _oneshot() -> None:
+            c = await asyncpg.connect(_dsn(), timeout=15)
+            try:
+                await fn(c, *args)
+            finally:
+                await c.close()
+
+        asyncio.run(_oneshot())
+        return
+
+    async def _pooled() -> None:
+        pool = await get_pool()
+        async with pool.acquire() as c:
+            await fn(c, *args)
+
+    task = asyncio.create_task(_pooled())
+    _background.add(task)
+    task.add_done_callback(_done)
+
+
+def _done(task: asyncio.Task[Any]) -> None:
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        log.warning("token ledger write failed: %s", task.exception())
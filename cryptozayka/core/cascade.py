@@ -0,0 +1,129 @@
+"""Local-LLM cascade in front of GPT.
+
+Каждый проект сначала скринится локальной моделью (llama.cpp из
+docker-compose). Одновременные скрининги склеиваются в один multi-prompt
+/completion (rag.screen_many) — до LLAMA_SLOTS проектов или
+CASCADE_BATCH_WAIT с ожидания соседей. Если P(scam) ≥
+CASCADE_RED_THRESHOLD — отдаём red сразу, OpenAI не вызывается.
+Неуверенные и «чистые» случаи, а также недоступный llama-сервер,
+эскалируются в GPT как раньше.
+
+LOCAL_CASCADE=1 включает каскад. Метрики:
+    cascade_screened_total{outcome="short_circuit"|"escalated"|"unavailable"}
+    cascade_tokens_saved_total — оценка непотраченных GPT-токенов
+Доля short-circuit = short_circuit / sum(cascade_screened_total).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable
+
+from prometheus_client import Counter
+
+from . import rag, strategy
+from .gpt_client import _count
+from .strategy import EvaluationResult, Verdict
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.getenv("LOCAL_CASCADE", "0") == "1"
+RED_THRESHOLD = float(os.getenv("CASCADE_RED_THRESHOLD", "0.9"))
+LOCAL_MODEL = os.getenv("LLAMA_MODEL", "llama.cpp")
+ANSWER_TOKENS = 60   # типичный ответ GPT на проект — для оценки экономии
+BATCH_WAIT = float(os.getenv("CASCADE_BATCH_WAIT", "0.02"))   # секунд ждём соседей в multi-prompt
+
+SCREENED = Counter("cascade_screened_total", "Projects screened by the local model", ["outcome"])
+TOKENS_SAVED = Counter("cascade_tokens_saved_total", "Estimated GPT tokens saved by the cascade")
+
+Evaluator = Callable[[str, str], Awaitable[EvaluationResult]]
+Screened = tuple[float | None, str]
+
+
+class _Screener:
+    """
+    Склеивает одиночные скрининги в пачки для rag.screen_many: отправляем,
+    когда набралось rag.LLAMA_SLOTS проектов или прошло BATCH_WAIT с
+    с первого в пачке.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self._items: list[tuple[str, str, asyncio.Future[Screened]]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def submit(self, name: str, description: str) -> Screened:
+        fut: asyncio.Future[Screened] = self.loop.create_future()
+        self._items.append((name, description, fut))
+        if len(self._items) >= rag.LLAMA_SLOTS:
+            self._flush()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(BATCH_WAIT, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._items = self._items, []
+        if items:
+            task = self.loop.create_task(self._run(items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, items: list[tuple[str, str, asyncio.Future[Screened]]]) -> None:
+        try:
+            results = await rag.screen_many([(name, descr) for name, descr, _ in items])
+            for (*_, fut), res in zip(items, results, strict=True):
+                if not fut.done():      # ждущий мог быть отменён
+                    fut.set_result(res)
+        except Exception as exc:
+            for *_, fut in items:
+                if not fut.done():
+                    fut.set_exception(exc)
+        except BaseException:
+            for *_, fut in items:
+                fut.cancel()
+            raise
+
+
+_screener: _Screener | None = None
+
+
+async def _screen(name: str, description: str) -> Screened:
+    global _screener
+    loop = asyncio.get_running_loop()
+    if _screener is None or _screener.loop is not loop:
+        _screener = _Screener(loop)
+    return await _screener.submit(name, description)
+
+
+def wrap(evaluate_fn: Evaluator) -> Evaluator:
+    """Evaluator с локальным скринингом перед *evaluate_fn*."""
+
+    async def cascaded(name: str, description: str) -> EvaluationResult:
+        p_scam, reply = await _screen(name, description)
+        if p_scam is None:
+            SCREENED.labels("unavailable").inc()
+            return await evaluate_fn(name, description)
+        if p_scam < RED_THRESHOLD:
+            SCREENED.labels("escalated").inc()
+            return await evaluate_fn(name, description)
+
+        saved = _count(strategy._prepare_prompt(name, description), strategy.MODEL) + ANSWER_TOKENS
+        SCREENED.labels("short_circuit").inc()
+        TOKENS_SAVED.inc(saved)
+        log.info("🦙 %s → red locally (p=%.2f, ~%d tokens saved)", name, p_scam, saved)
+        return EvaluationResult(
+            project=name,
+            verdict=Verdict.RED,
+            explanation=f"Local screening (p={p_scam:.2f}): {reply}",
+            raw_model_answer=reply,
+            model=f"local:{LOCAL_MODEL}",
+            tokens=0,
+            gpt=False,
+        )
+
+    return cascaded
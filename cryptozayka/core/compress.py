@@ -0,0 +1,137 @@
+"""Token-aware compression of project descriptions.
+
+Вместо среза description[:512] (символы, рез посреди слова, хвост
+теряется, маркетинговая вода остаётся):
+
+  1. нормализация — NFKC, URL → домен, повторы !!!/??? → один знак,
+     схлопнутые пробелы;
+  2. разбиение на предложения/пункты; дубликаты и короткие
+     call-to-action («Join our Telegram», «Stay tuned») выбрасываются;
+  3. если текст не влезает в бюджет (токены tiktoken той же модели,
+     что считает лимитер), жадно берём самые информативные предложения:
+     новые слова + сигналы (цифры, токеномика, аудит, доходность…) на
+     токен. Первое предложение (обычно «что это») — в приоритете;
+     порядок в выходе исходный.
+
+Результат кэшируется (packed-режим считает описание дважды).
+Метрика: description_tokens_saved — гистограмма сэкономленных токенов
+на проект (sum/count — в среднем на проект).
+"""
+from __future__ import annotations
+
+import functools
+import logging
+import re
+import unicodedata
+from typing import NamedTuple
+
+from prometheus_client import Histogram
+
+from .gpt_client import _count, count_batch
+
+log = logging.getLogger(__name__)
+
+MAX_INPUT_CHARS = 20_000   # дальше не читаем — защита от мегабайтных описаний
+CACHE_SIZE = 2048
+CTA_MAX_WORDS = 12         # длиннее — уже не «подпишись», а содержание
+
+TOKENS_SAVED = Histogram(
+    "description_tokens_saved",
+    "Input tokens removed from a project description by compression",
+    buckets=(0, 8, 16, 32, 64, 128, 256, 512, 1024, 4096),
+)
+
+_URL_RE = re.compile(r"\b(?:https?://|www\.)(?:www\.)?([^\s/?#]+)\S*", re.IGNORECASE)
+_REPEAT_PUNCT_RE = re.compile(r"([!?.])\1+")
+_SPLIT_RE = re.compile(r"\n+|(?<=[.!?…])\s+|\s*[•·|▪►]\s*")
+_SPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"\w+")
+_CTA_RE = re.compile(
+    r"\b(join (us|our)|follow us|subscribe|stay tuned|don'?t miss|read more|learn more"
+    r"|click (here|the link)|visit our|check out our|all rights reserved|coming soon)\b",
+    re.IGNORECASE,
+)
+_SIGNAL_RE = re.compile(
+    r"\d|%|\$|\b(audit\w*|team|doxx\w*|anonymous|token\w*|supply|mint\w*|lock\w*|vest\w*|tax"
+    r"|liquidity|contract|apy|apr|yield|return\w*|guarantee\w*|reward\w*|stak\w*|airdrop\w*"
+    r"|testnet|mainnet|backed|investor\w*|raised?|fund\w*|presale|whitelist)\b",
+    re.IGNORECASE,
+)
+
+
+class Compressed(NamedTuple):
+    text: str
+    tokens_before: int
+    tokens_after: int
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text[:MAX_INPUT_CHARS])
+    text = _URL_RE.sub(lambda m: m.group(1).lower(), text)
+    return _REPEAT_PUNCT_RE.sub(r"\1", text)
+
+
+def sentences(text: str) -> list[str]:
+    """Предложения/пункты без дублей и call-to-action, в исходном порядке."""
+    out: list[str] = []
+    seen: set[tuple[str, ...]] = set()
+    for raw in _SPLIT_RE.split(text):
+        s = _SPACE_RE.sub(" ", raw).strip()
+        words = tuple(w.lower() for w in _WORD_RE.findall(s))
+        if not words or words in seen:
+            continue
+        if len(words) <= CTA_MAX_WORDS and _CTA_RE.search(s):
+            continue
+        seen.add(words)
+        out.append(s)
+    return out
+
+
+def _select(parts: list[str], costs: list[int], budget: int) -> list[int]:
+    """Индексы предложений, которые берём: жадно по информативности на токен."""
+    seen: set[str] = set()
+    gains = []
+    for s in parts:
+        words = {w.lower() for w in _WORD_RE.findall(s)}
+        gains.append(len(words - seen) + 2 * len(_SIGNAL_RE.findall(s)))
+        seen |= words
+    order = sorted(range(1, len(parts)), key=lambda i: gains[i] / costs[i], reverse=True)
+
+    chosen, left = [], budget
+    for i in [0, *order]:
+        if costs[i] <= left:
+            chosen.append(i)
+            left -= costs[i] + 1   # +1 — пробел-разделитель
+    return sorted(chosen)
+
+
+def _cut_words(text: str, budget: int, model: str) -> str:
+    """Последний шанс: первое предложение само больше бюджета — режем по словам."""
+    words = text.split()
+    keep = max(1, len(words) * budget // max(1, _count(text, model)))
+    while keep > 1 and _count(" ".join(words[:keep]), model) > budget:
+        keep = keep * 9 // 10
+    return " ".join(words[:keep])
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compress(description: str, budget: int, model: str) -> Compressed:
+    """Описание ≤ *budget* токенов модели *model*; tokens_* — до и после."""
+    if not description:
+        return Compressed("", 0, 0)
+    before = _count(description, model)
+    parts = sentences(normalize(description))
+    text = " ".join(parts)
+    after = _count(text, model) if parts else 0
+
+    if after > budget:
+        costs = count_batch(parts, model)
+        chosen = _select(parts, costs, budget)
+        text = " ".join(parts[i] for i in chosen) if chosen else _cut_words(parts[0], budget, model)
+        after = _count(text, model)
+
+    saved = max(0, before - after)
+    TOKENS_SAVED.observe(saved)
+    if saved:
+        log.debug("description compressed %d → %d tokens", before, after)
+    return Compressed(text, before, after)
@@ -0,0 +1,221 @@
+"""Content-hash dedup + in-flight coalescing of project evaluations.
+
+Ключ — sha256 от нормализованных (name, description). Таблица eval_cache
+служит и кэшем вердиктов, и реестром «кто сейчас оценивает»:
+
+  • свежий вердикт (моложе DEDUP_TTL) переиспользуется без вызова GPT;
+  • один и тот же хэш внутри процесса оценивается одной корутиной,
+    остальные ждут её Future;
+  • между процессами — claim-строка с verdict IS NULL: второй воркер
+    не зовёт GPT, а ждёт, пока первый допишет вердикт (но не дольше
+    INFLIGHT_TTL — потом считаем claim брошенным и оцениваем сами).
+
+DEDUP_TTL=0 выключает механизм целиком.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+from typing import Awaitable, Callable
+
+from .strategy import EvaluationResult, Verdict
+from ..storage.pg import get_pool
+
+log = logging.getLogger(__name__)
+
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", str(7 * 24 * 3600)))   # секунд
+INFLIGHT_TTL = float(os.getenv("DEDUP_INFLIGHT_TTL", "120"))     # секунд
+WAIT_POLL = 0.5                                                  # секунд
+
+Evaluator = Callable[[str, str], Awaitable[EvaluationResult]]
+
+_inflight: dict[str, asyncio.Future[EvaluationResult]] = {}
+
+
+def content_hash(name: str, description: str) -> str:
+    """sha256 от (name, description) без учёта регистра и пробелов."""
+    norm = "\x00".join(" ".join((s or "").split()).casefold() for s in (name, description))
+    return hashlib.sha256(norm.encode("utf-8")).hexdigest()
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# ───────────────── storage helpers ────────────────────────────────────────
+async def _claim(h: str) -> bool:
+    """
+    Пытаемся стать тем, кто оценивает *h*. True — claim наш (новый хэш,
+    протухший вердикт или брошенный claim); False — есть свежий вердикт
+    или кто-то уже оценивает.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as c:
+        row = await c.fetchrow(
+            """
+            INSERT INTO eval_cache AS e (content_hash, owner, created_at)
+            VALUES ($1, $2, now())
+            ON CONFLICT (content_hash) DO UPDATE
+              SET owner = EXCLUDED.owner,
+                  created_at = now(),
+                  verdict = NULL, explanation = NULL, text = NULL, tokens = NULL
+              WHERE (e.verdict IS NULL
+                     AND e.created_at < now() - make_interval(secs => $4))
+                 OR (e.verdict IS NOT NULL
+                     AND e.created_at < now() - make_interval(secs => $3))
+            RETURNING owner
+            """,
+            h,
+            _owner(),
+            DEDUP_TTL,
+            INFLIGHT_TTL,
+        )
+    return row is not None
+
+
+async def _lookup(h: str, name: str) -> EvaluationResult | None:
+    pool = await get_pool()
+    async with pool.acquire() as c:
+        row = await c.fetchrow(
+            """
+            SELECT verdict, explanation, text FROM eval_cache
+            WHERE content_hash = $1 AND verdict IS NOT NULL
+              AND created_at > now() - make_interval(secs => $2)
+            """,
+            h,
+            DEDUP_TTL,
+        )
+    if row is None:
+        return None
+    return EvaluationResult(
+        project=name,
+        verdict=Verdict(row["verdict"]),
+        explanation=row["explanation"],
+        raw_model_answer=row["text"],
+        tokens=0,   # ни одного потраченного токена
+    )
+
+
+async def _release(h: str) -> None:
+    """Отпустить свой незавершённый claim, пусть оценят заново."""
+    pool = await get_pool()
+    async with pool.acquire() as c:
+        await c.execute(
+            "DELETE FROM eval_cache WHERE content_hash=$1 AND owner=$2 AND verdict IS NULL",
+            h,
+            _owner(),
+        )
+
+
+async def _store(h: str, res: EvaluationResult) -> None:
+    if res.verdict is Verdict.ERROR or not res.gpt or res.truncated:
+        # ошибки не кэшируем; локальные шорткаты и оборванные стримы тоже —
+        # eval_cache хранит только полные GPT-вердикты (их мержат в gpt_judgements)
+        await _release(h)
+        return
+    pool = await get_pool()
+    async with pool.acquire() as c:
+        await c.execute(
+            """
+            UPDATE eval_cache
+            SET verdict = $2, explanation = $3, text = $4, tokens = $5,
+                created_at = now()
+            WHERE content_hash = $1
+            """,
+            h,
+            res.verdict.value,
+            res.explanation,
+            res.raw_model_answer,
+            res.tokens,
+        )
+
+
+# ───────────────── coalescing ─────────────────────────────────────────────
+async def _resolve(
+    h: str,
+    name: str,
+    description: str,
+    evaluate_fn: Evaluator,
+) -> tuple[EvaluationResult, bool]:
+    deadline = asyncio.get_running_loop().time() + INFLIGHT_TTL
+    while True:
+        if await _claim(h):
+            try:
+                res = await evaluate_fn(name, description)
+            except Exception:
+                await _release(h)
+                raise
+            await _store(h, res)
+            return res, False
+
+        cached = await _lookup(h, name)
+        if cached is not None:
+            return cached, True
+
+        # другой воркер оценивает этот же хэш — ждём его вердикт
+        if asyncio.get_running_loop().time() > deadline:
+            log.warning("in-flight claim for %s stuck, evaluating anyway", name)
+            res = await evaluate_fn(name, description)
+            return res, False
+        await asyncio.sleep(WAIT_POLL)
+
+
+def _for(res: EvaluationResult, name: str) -> EvaluationResult:
+    """Копия чужого результата для ждущего: своё имя, ноль токенов."""
+    return EvaluationResult(
+        project=name,
+        verdict=res.verdict,
+        explanation=res.explanation,
+        raw_model_answer=res.raw_model_answer,
+        model=res.model,
+        tokens=0,
+        gpt=res.gpt,
+        truncated=res.truncated,
+    )
+
+
+# ───────────────── public API ─────────────────────────────────────────────
+async def evaluate(
+    name: str,
+    description: str,
+    evaluate_fn: Evaluator,
+) -> tuple[EvaluationResult, bool]:
+    """
+    Оценить проект через *evaluate_fn*, если свежего вердикта по тому же
+    содержимому ещё нет. Возвращает (result, reused); reused=True — GPT
+    не вызывался.
+    """
+    if DEDUP_TTL <= 0:
+        return await evaluate_fn(name, description), False
+
+    h = content_hash(name, description)
+    pending = _inflight.get(h)
+    if pending is not None:
+        try:
+            res = await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise               # отменили нас самих
+            return await evaluate(name, description, evaluate_fn)  # владелец отменён
+        return _for(res, name), True
+
+    fut: asyncio.Future[EvaluationResult] = asyncio.get_running_loop().create_future()
+    _inflight[h] = fut
+    try:
+        res, reused = await _resolve(h, name, description, evaluate_fn)
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # помечаем как прочитанное, если ждущих нет
+        raise
+    else:
+        fut.set_result(res)
+        return res, reused
+    finally:
+        _inflight.pop(h, None)
+
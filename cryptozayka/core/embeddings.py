@@ -0,0 +1,293 @@
+"""Embedding index over past judgements (retrieval for rag / GPT).
+
+Эмбеддинги — llama.cpp /embedding (rag.LlamaClient.embed). Хранение —
+каталог EMBED_INDEX_DIR:
+
+  • vectors.f32 — memmap float32 [capacity × EMBED_DIM]; векторы сжаты
+    фиксированной случайной проекцией (seed постоянный, JL сохраняет
+    косинус) и нормированы — поиск = один matvec + argpartition.
+    100k × 64 float32 = 25 МБ, скан упирается в пропускную способность
+    памяти, а не в Python;
+  • meta.jsonl — строка на запись [row, project, verdict]; последняя
+    строка для row побеждает (переоценка того же проекта перезаписывает
+    его вектор на месте).
+
+Запись инкрементальная: после коммита batch'а executor зовёт
+record_batch с вердиктами, которые дал GPT (шорткаты cascade/similar/
+самого индекса не пишутся — иначе догадка переиспользуется как
+«ранее оценённый» вердикт); под flock'ом сначала пишутся векторы, затем meta — строка
+без meta не видна, файл не бывает полуготовым. Соседние процессы
+подхватывают новые строки по размеру meta.jsonl (не чаще CHECK_EVERY с).
+
+В пайплайне (EMBED_INDEX=1):
+  • rag.screen_project / screen_score получают k ближайших вердиктов;
+  • wrap(evaluate_fn): сосед с cos ≥ EMBED_EXACT и похожим именем
+    (SequenceMatcher ≥ EMBED_EXACT_NAME) — его вердикт без GPT. Одного
+    косинуса мало: 64-мерная проекция его лишь приближает, и разные
+    проекты с шаблонным описанием сливаются;
+    EMBED_PROMPT_CONTEXT=1 — соседи ещё и в промпт GPT (nearest_judged).
+"""
+from __future__ import annotations
+
+import asyncio
+import difflib
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Collection, NamedTuple
+
+import numpy as np
+from prometheus_client import Counter
+
+from . import llm_gateway
+from .strategy import EvaluationResult, Verdict
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.getenv("EMBED_INDEX", "0") == "1"
+INDEX_DIR = Path(os.getenv("EMBED_INDEX_DIR", "/app/data/embeddings"))
+DIM = int(os.getenv("EMBED_DIM", "64"))
+K = int(os.getenv("EMBED_TOP_K", "5"))
+EXACT = float(os.getenv("EMBED_EXACT", "0.97"))                # cos «тот же проект»
+EXACT_NAME = float(os.getenv("EMBED_EXACT_NAME", "0.8"))       # …и похожесть имён
+PROMPT_CONTEXT = os.getenv("EMBED_PROMPT_CONTEXT", "0") == "1"
+CHECK_EVERY = 2.0          # секунд между проверками meta.jsonl на чужие записи
+INITIAL_CAPACITY = 1024
+MAX_TEXT_CHARS = 2000      # вход эмбеддера (контекст слота llama: -c / -np = 2048)
+VEC_CACHE_SIZE = 4096      # эмбеддинг из lookup переиспользуется при записи
+SEED = 20261017
+
+LOOKUPS = Counter("embedding_lookups_total", "Embedding index lookups", ["outcome"])
+
+Evaluator = Callable[..., Awaitable[EvaluationResult]]
+
+
+class Neighbour(NamedTuple):
+    project: str
+    verdict: str
+    score: float
+
+
+class EmbeddingIndex:
+    def __init__(self, root: Path = INDEX_DIR, dim: int = DIM) -> None:
+        self.root = Path(root)
+        self.dim = dim
+        self._vectors = self.root / "vectors.f32"
+        self._metafile = self.root / "meta.jsonl"
+        self._mat: np.ndarray | None = None
+        self._meta: list[tuple[str, str]] = []    # row → (project, verdict)
+        self._rows: dict[str, int] = {}           # project → row
+        self._meta_size = 0
+        self._checked_at = 0.0
+        self._proj: dict[int, np.ndarray] = {}    # исходная размерность → проекция
+        self._lock = threading.Lock()
+
+    # ─── проекция ───
+    def reduce(self, vecs: np.ndarray) -> np.ndarray:
+        """(m, src) → (m, dim), L2-нормированные."""
+        vecs = np.atleast_2d(np.asarray(vecs, dtype=np.float32))
+        src = vecs.shape[1]
+        if src != self.dim:
+            proj = self._proj.get(src)
+            if proj is None:
+                rng = np.random.default_rng(SEED)
+                proj = self._proj[src] = rng.standard_normal((src, self.dim), dtype=np.float32)
+            vecs = vecs @ proj
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        return vecs / np.maximum(norms, 1e-12)
+
+    # ─── файлы ───
+    def _map(self) -> None:
+        size = self._vectors.stat().st_size if self._vectors.exists() else 0
+        capacity = size // (4 * self.dim)
+        self._mat = (
+            np.memmap(self._vectors, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+            if capacity else None
+        )
+
+    def _sync(self) -> None:
+        """Подхватить строки meta.jsonl, дописанные с прошлого раза (в т.ч. другими процессами)."""
+        try:
+            size = self._metafile.stat().st_size
+        except FileNotFoundError:
+            return
+        if size == self._meta_size:
+            return
+        with self._metafile.open("rb") as f:
+            f.seek(self._meta_size)
+            chunk = f.read(size - self._meta_size)
+        chunk = chunk[: chunk.rfind(b"\n") + 1]   # недописанный хвост — в следующий раз
+        for line in chunk.splitlines():
+            row, project, verdict = json.loads(line)
+            if row >= len(self._meta):
+                self._meta.extend([("", "")] * (row + 1 - len(self._meta)))
+            self._meta[row] = (project, verdict)
+            self._rows[project] = row
+        self._meta_size += len(chunk)
+        if self._mat is None or len(self._meta) > self._mat.shape[0]:
+            self._map()
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at >= CHECK_EVERY:
+            self._checked_at = now
+            with self._lock:
+                self._sync()
+
+    def __len__(self) -> int:
+        return len(self._meta)
+
+    # ─── запись ───
+    def add(self, items: list[tuple[str, str]], vecs: np.ndarray) -> None:
+        """Добавить/перезаписать (project, verdict) с эмбеддингами *vecs*."""
+        if not items:
+            return
+        reduced = self.reduce(vecs)
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.root / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._sync()
+            rows, new = [], len(self._meta)
+            for project, _ in items:
+                row = self._rows.get(project)
+                if row is None:
+                    row, new = new, new + 1
+                    self._rows[project] = row
+                rows.append(row)
+
+            capacity = 0 if self._mat is None else self._mat.shape[0]
+            if new > capacity:
+                capacity = max(INITIAL_CAPACITY, capacity * 2, new)
+                with self._vectors.open("ab") as f:
+                    f.truncate(capacity * 4 * self.dim)
+                self._map()
+            assert self._mat is not None
+            self._mat[rows] = reduced
+            self._mat.flush()                    # сначала векторы, потом meta
+
+            lines = "".join(
+                json.dumps([row, project, verdict], ensure_ascii=False) + "\n"
+                for row, (project, verdict) in zip(rows, items)
+            )
+            with self._metafile.open("a", encoding="utf-8") as f:
+                f.write(lines)
+            self._sync()
+
+    # ─── поиск ───
+    def search(self, vec: np.ndarray, k: int = K) -> list[Neighbour]:
+        self._refresh()
+        q = self.reduce(vec)[0]
+        # _sync/add меняют _meta, _mat и строки memmap'а на месте — матрица и
+        # имена должны быть из одного состояния, поэтому скан под тем же lock'ом
+        with self._lock:
+            n, mat = len(self._meta), self._mat
+            if not n or mat is None:
+                return []
+            scores = mat[:n] @ q
+            k = min(k, n)
+            top = np.argpartition(scores, n - k)[n - k:]
+            top = top[np.argsort(scores[top])[::-1]]
+            return [Neighbour(*self._meta[i], round(float(scores[i]), 4)) for i in top]
+
+
+index = EmbeddingIndex()
+
+_vec_cache: OrderedDict[str, np.ndarray] = OrderedDict()
+
+
+def _text(name: str, description: str) -> str:
+    return f"{name}\n{description or ''}"[:MAX_TEXT_CHARS]
+
+
+def _vector(data: Any) -> np.ndarray:
+    """Ответ /embedding (старый {"embedding": […]} / новый [{"embedding": [[…]]}]) → вектор."""
+    if isinstance(data, list):
+        data = data[0]
+    vec = np.asarray(data["embedding"], dtype=np.float32)
+    return vec.mean(axis=0) if vec.ndim == 2 else vec   # pooling none — среднее по токенам
+
+
+async def embed(texts: list[str]) -> np.ndarray:
+    missing = [t for t in dict.fromkeys(texts) if t not in _vec_cache]
+    if missing:
+        for t, data in zip(missing, await llm_gateway.llama_client().embed(missing)):
+            _vec_cache[t] = _vector(data)
+            while len(_vec_cache) > VEC_CACHE_SIZE:
+                _vec_cache.popitem(last=False)
+    return np.stack([_vec_cache[t] for t in texts])
+
+
+async def neighbours(name: str, description: str, k: int = K) -> list[Neighbour]:
+    """k ближайших оценённых проектов; [] — индекс выключен/пуст или llama недоступна."""
+    if not ENABLED:
+        return []
+    try:
+        vec = (await embed([_text(name, description)]))[0]
+        found = await asyncio.to_thread(index.search, vec, k + 1)
+    except Exception as e:
+        log.debug("embedding lookup failed: %s", e)
+        LOOKUPS.labels("unavailable").inc()
+        return []
+    return [n for n in found if n.project != name][:k]
+
+
+async def record_batch(
+    projects: list[dict[str, Any]],
+    verdicts: list[dict[str, Any]],
+    judged: Collection[int],
+) -> None:
+    """Дописать в индекс GPT-вердикты batch'а (индексы *judged*; ошибки не индексируем)."""
+    latest: dict[str, tuple[str, str]] = {}
+    for i, (proj, v) in enumerate(zip(projects, verdicts)):
+        if i in judged and v.get("verdict") in {Verdict.GREEN.value, Verdict.YELLOW.value, Verdict.RED.value}:
+            latest[v["name"]] = (proj.get("description", ""), v["verdict"])
+    if not latest:
+        return
+    try:
+        vecs = await embed([_text(name, d) for name, (d, _) in latest.items()])
+        items = [(name, verdict) for name, (_, verdict) in latest.items()]
+        await asyncio.to_thread(index.add, items, vecs)
+    except Exception as e:   # индекс — оптимизация, batch уже закоммичен
+        log.warning("embedding index update failed: %s", e)
+
+
+def _same_project(name: str, best: Neighbour) -> bool:
+    if best.score < EXACT:
+        return False
+    ratio = difflib.SequenceMatcher(None, name.casefold(), best.project.casefold()).ratio()
+    return ratio >= EXACT_NAME
+
+
+def wrap(evaluate_fn: Evaluator, *, with_context: bool = True) -> Evaluator:
+    """
+    Evaluator с поиском по индексу перед *evaluate_fn*: почти точный
+    сосед с похожим именем — его вердикт без вызова; иначе (EMBED_PROMPT_CONTEXT=1 и
+    with_context) соседи уходят в промпт как neighbours=….
+    """
+
+    async def retrieved(name: str, description: str, **kwargs: Any) -> EvaluationResult:
+        found = await neighbours(name, description)
+        if found and _same_project(name, found[0]):
+            best = found[0]
+            LOOKUPS.labels("exact").inc()
+            log.info("🧭 %s → %s: same as %r (cos %.3f)", name, best.verdict, best.project, best.score)
+            return EvaluationResult(
+                project=name,
+                verdict=Verdict(best.verdict),
+                explanation=f"Near-identical to previously judged {best.project!r} (cos {best.score:.3f})",
+                raw_model_answer="",
+                model="embedding",
+                tokens=0,
+                gpt=False,
+            )
+        LOOKUPS.labels("context" if found else "none").inc()
+        if found and PROMPT_CONTEXT and with_context:
+            kwargs["neighbours"] = [n._asdict() for n in found]
+        return await evaluate_fn(name, description, **kwargs)
+
+    return retrieved
@@ -1,49 +1,151 @@
 # cryptozayka/core/executor.py
 # -*- coding: utf-8 -*-
 """
-Background-worker:
-  1. Каждые 2 с находит в batches запись со status='new'.
-  2. Для каждого проекта в payload вызывает GPT-стратегию.
-  3. Пишет вердикт в gpt_judgements и прибавляет счётчик stats.
-  4. Обновляет batches.status → 'done' (или 'error').
+Background-worker (пул из WORKER_SLOTS слотов):
+  1. Одним UPDATE … RETURNING забирает до N записей batches со status='new'
+     в порядке fair-queue (N = число свободных слотов); свободный слот
+     сразу получает следующий.
+     Пустая очередь ждёт NOTIFY от add_batch, polling раз в POLL_DELAY с —
+     лишь страховка.
+  2. Для каждого проекта в payload (после локального скрининга, если
+     LOCAL_CASCADE=1 — см. cascade.py) вызывает GPT-стратегию
+     (до BATCH_CONCURRENCY проектов одновременно); повторы по содержимому
+     берутся из кэша / склеиваются с уже идущей оценкой (см. dedup.py).
+     При STRATEGY_PACK_SIZE > 1 соседние проекты склеиваются в один
+     GPT-запрос (strategy.analyze_project_packed). SIMILAR_LOOKUP=1 —
+     перед GPT ищем похожие имена среди оценённых (pg_trgm, similar.py),
+     EMBED_INDEX=1 — похожие описания (embeddings.py); после коммита
+     GPT-вердикты batch'а дописываются в embedding-индекс. Маленькие batch'и
+     (одиночные из бота) при STRATEGY_STREAM=1 стримятся: вердикт сразу,
+     как модель его выдала, виден в GET /batch/{id} (early_verdicts) и
+     уходит в VERDICT_CHANNEL.
+     Крупные batch'и (≥ OPENAI_BATCH_THRESHOLD проектов) вместо этого
+     уходят одним job'ом в OpenAI Batch API (см. batch_api.py).
+  3. Копит вердикты в памяти и чекпойнтит их пачками (executemany)
+     в staging-таблицу batch_results.
+  4. Одной транзакцией: batches.status → 'done' (если аренда ещё наша,
+     иначе откат), merge batch_results → gpt_judgements, счётчик stats.
+     При сбое — 'error'.
+
+Аренда (lease): захваченный batch помечается lease_owner/lease_until,
+heartbeat продлевает аренду, пока слот работает. Reaper возвращает в 'new'
+batch'и с истёкшей арендой (воркер умер); новый владелец пропускает
+проекты, уже записанные в batch_results, и не тратит на них токены
+(кроме error-вердиктов — они переоцениваются).
 Запускается из FastAPI-startup (см. api.py).
 """
 from __future__ import annotations
 
 import asyncio
+import functools
 import json
 import logging
+import os
+import socket
 from typing import Any
 
-from .strategy import analyze_project, AnalysisResult
-from ..storage.pg import get_pool
+from . import batch_api, cascade, dedup, embeddings, similar, strategy
+from .strategy import EvaluationResult, Verdict, analyze_project, analyze_project_packed
+from ..storage.pg import BATCH_CHANNEL, claim_batches, get_pool, notify_verdict, wait_new_batch
 
 log = logging.getLogger(__name__)
 
+# сколько проектов одного batch'а оцениваем параллельно
+BATCH_CONCURRENCY = max(1, int(os.getenv("BATCH_CONCURRENCY", "8")))
+# сколько batch'ей обрабатываются одновременно
+WORKER_SLOTS = max(1, int(os.getenv("WORKER_SLOTS", "4")))
+POLL_DELAY = 30           # секунд: страховочный polling, основной сигнал — NOTIFY
+# аренда batch'а: продлеваем каждые LEASE_TTL/3 с
+LEASE_TTL = max(3, int(os.getenv("BATCH_LEASE_TTL", "60")))
+HEARTBEAT_EVERY = LEASE_TTL / 3
+# сколько вердиктов копим в памяти перед записью чекпойнта в batch_results
+CHECKPOINT_EVERY = max(1, int(os.getenv("BATCH_CHECKPOINT_EVERY", "25")))
+
+
+def _owner() -> str:
+    """Идентификатор воркера-арендатора (хост:pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseLost(Exception):
+    """Аренду batch'а забрали (reaper + другой воркер) — итог пишет новый владелец."""
+
 
 # ───────────────── storage helpers ────────────────────────────────────────
+async def _claim_batches(limit: int) -> list[tuple[int, list[dict[str, Any]]]]:
+    """
+    Берём до *limit* batch'ей в порядке fair-queue (см. storage.pg),
+    оформляем аренду на себя и возвращаем [(id, list-payload), …].
+    """
+    rows = await claim_batches(limit, owner=_owner(), lease_ttl=float(LEASE_TTL))
+    return [(bid, json.loads(payload)) for bid, payload in rows]
+
+
 async def _next_batch() -> tuple[int | None, list[dict[str, Any]] | None]:
     """
     Атомарно берём batch со статусом «new», ставим «process» и возвращаем
     (id, list-payload). Если нет новых — (None, None).
     """
+    claimed = await _claim_batches(1)
+    if not claimed:
+        return None, None
+    return claimed[0]
+
+
+async def _renew_leases(bids: list[int]) -> set[int]:
+    """Продлеваем аренду; возвращаем id, которые всё ещё за нами."""
     pool = await get_pool()
     async with pool.acquire() as c:
-        row = await c.fetchrow(
+        rows = await c.fetch(
             """
             UPDATE batches
-            SET status='process'
-            WHERE id = (
-              SELECT id FROM batches WHERE status='new'
-              ORDER BY id LIMIT 1
-              FOR UPDATE SKIP LOCKED
-            )
-            RETURNING id, payload
+            SET lease_until = now() + make_interval(secs => $3)
+            WHERE id = ANY($1::int[])
+              AND status = 'process'
+              AND lease_owner = $2
+            RETURNING id
+            """,
+            bids,
+            _owner(),
+            float(LEASE_TTL),
+        )
+    return {r["id"] for r in rows}
+
+
+async def _reap_expired() -> list[int]:
+    """Возвращаем в очередь batch'и, чья аренда истекла (воркер умер)."""
+    pool = await get_pool()
+    async with pool.acquire() as c:
+        rows = await c.fetch(
             """
+            WITH r AS (
+              UPDATE batches
+              SET status='new', lease_owner=NULL, lease_until=NULL
+              WHERE status='process' AND lease_until < now()
+              RETURNING id
+            )
+            SELECT id, pg_notify($1, id::text) FROM r
+            """,
+            BATCH_CHANNEL,
         )
-    if not row:
-        return None, None
-    return row["id"], json.loads(row["payload"])
+    bids = [r["id"] for r in rows]
+    if bids:
+        log.warning("reaped expired leases: %s", bids)
+    return bids
+
+
+async def _load_progress(bid: int) -> dict[int, dict[str, Any]]:
+    """
+    Вердикты, уже сохранённые для batch'а прежним владельцем: {idx: verdict}.
+    error-строки (например, OpenAI лежал) не в счёт — их оцениваем заново.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as c:
+        rows = await c.fetch(
+            "SELECT idx, result FROM batch_results WHERE batch_id=$1 AND result->>'verdict' <> 'error'",
+            bid,
+        )
+    return {r["idx"]: json.loads(r["result"]) for r in rows}
 
 
 async def _mark_batch(bid: int, ok: bool, result: Any | None) -> None:
@@ -53,83 +155,337 @@ async def _mark_batch(bid: int, ok: bool, result: Any | None) -> None:
             """
             UPDATE batches
             SET status = $2,
-                result = $3::jsonb
-            WHERE id = $1
+                result = $3::jsonb,
+                lease_owner = NULL,
+                lease_until = NULL
+            WHERE id = $1 AND status = 'process' AND lease_owner = $4
             """,
             bid,
             "done" if ok else "error",
             json.dumps(result),
+            _owner(),
         )
 
 
-async def _upsert_judgement(res: AnalysisResult) -> None:
-    pool = await get_pool()
-    async with pool.acquire() as c:
-        # счётчик GPT-вызовов
-        await c.execute(
-            """
-            INSERT INTO stats(metric, value)
-            VALUES ('gpt_calls', 1)
-            ON CONFLICT (metric) DO UPDATE
-              SET value = stats.value + 1
-            """
-        )
-        # вердикт
-        await c.execute(
+class _BatchWriter:
+    """
+    Буфер вердиктов одного batch'а.
+
+    add()    — копит строки, каждые CHECKPOINT_EVERY пишет их в batch_results
+               одним executemany (это и есть прогресс для восстановления);
+    commit() — одна транзакция: статус batch'а (только пока аренда наша,
+               иначе LeaseLost и откат), остаток буфера, merge batch_results →
+               gpt_judgements одним INSERT … ON CONFLICT, stats; возвращает
+               idx смерженных строк (вердикты GPT, не шорткаты).
+    Вместо 2N+1 round-trip'ов на batch — N/CHECKPOINT_EVERY + 1 транзакция.
+    """
+
+    def __init__(self, bid: int, checkpoint_every: int = CHECKPOINT_EVERY) -> None:
+        self.bid = bid
+        self.gpt_calls = 0
+        self._every = checkpoint_every
+        self._buf: list[tuple[int, int, str, str | None]] = []
+
+    async def add(
+        self,
+        idx: int,
+        verdict: dict[str, Any],
+        text: str | None,
+        *,
+        gpt_call: int | None = None,
+    ) -> None:
+        """gpt_call — сколько OpenAI-запросов на счету строки (bool — 0/1)."""
+        if gpt_call is None:            # по умолчанию: есть ответ — был вызов
+            gpt_call = text is not None
+        self.gpt_calls += int(gpt_call)
+        self._buf.append((self.bid, idx, json.dumps(verdict), text))
+        if len(self._buf) >= self._every:
+            await self.flush()
+
+    async def _write(self, c: Any, rows: list[tuple[int, int, str, str | None]]) -> None:
+        await c.executemany(
             """
-            INSERT INTO gpt_judgements(project, verdict, text)
-            VALUES ($1, $2, $3)
-            ON CONFLICT (project) DO UPDATE
-              SET verdict = EXCLUDED.verdict,
-                  text    = EXCLUDED.text
+            INSERT INTO batch_results(batch_id, idx, result, text)
+            VALUES ($1, $2, $3::jsonb, $4)
+            ON CONFLICT (batch_id, idx) DO UPDATE
+              SET result = EXCLUDED.result,
+                  text   = EXCLUDED.text
             """,
-            res.project,
-            res.verdict.value,
-            res.gpt_text,
+            rows,
         )
 
+    async def flush(self) -> None:
+        rows, self._buf = self._buf, []
+        if not rows:
+            return
+        pool = await get_pool()
+        async with pool.acquire() as c:
+            await self._write(c, rows)
+
+    async def commit(self, verdicts: list[dict[str, Any]]) -> set[int]:
+        rows, self._buf = self._buf, []
+        pool = await get_pool()
+        async with pool.acquire() as c, c.transaction():
+            # первым — статус под проверкой аренды: строка batches блокируется
+            # до COMMIT, reaper/новый владелец ждут нас, а не наоборот
+            ours = await c.fetchval(
+                """
+                UPDATE batches
+                SET status = 'done',
+                    result = $2::jsonb,
+                    lease_owner = NULL,
+                    lease_until = NULL
+                WHERE id = $1 AND status = 'process' AND lease_owner = $3
+                RETURNING id
+                """,
+                self.bid,
+                json.dumps(verdicts),
+                _owner(),
+            )
+            if ours is None:
+                raise LeaseLost(self.bid)   # откат: batch_results не мержим
+            if rows:
+                await self._write(c, rows)
+            # вердикты: по одному на проект (последний в payload'е)
+            merged = await c.fetch(
+                """
+                WITH picked AS (
+                  SELECT DISTINCT ON (result->>'name')
+                         idx, result->>'name' AS project, result->>'verdict' AS verdict, text
+                  FROM batch_results
+                  WHERE batch_id = $1 AND text IS NOT NULL
+                    AND result->>'verdict' <> 'error'   -- не затирать прежний вердикт ошибкой
+                  ORDER BY result->>'name', idx DESC
+                ), ins AS (
+                  INSERT INTO gpt_judgements(project, verdict, text)
+                  SELECT project, verdict, text FROM picked
+                  ON CONFLICT (project) DO UPDATE
+                    SET verdict = EXCLUDED.verdict,
+                        text    = EXCLUDED.text
+                )
+                SELECT idx FROM picked
+                """,
+                self.bid,
+            )
+            # счётчик GPT-вызовов
+            if self.gpt_calls:
+                await c.execute(
+                    """
+                    INSERT INTO stats(metric, value)
+                    VALUES ('gpt_calls', $1)
+                    ON CONFLICT (metric) DO UPDATE
+                      SET value = stats.value + EXCLUDED.value
+                    """,
+                    self.gpt_calls,
+                )
+            # staging больше не нужен: итог лежит в batches.result
+            await c.execute("DELETE FROM batch_results WHERE batch_id = $1", self.bid)
+        return {r["idx"] for r in merged}
+
 
 # ───────────────── batch processing ───────────────────────────────────────
-async def _process_batch(bid: int, projects: list[dict[str, Any]]) -> None:
-    verdicts: list[dict[str, Any]] = []
+async def _evaluate(
+    writer: _BatchWriter,
+    idx: int,
+    proj: dict[str, Any],
+    sem: asyncio.Semaphore,
+    *,
+    early: bool = False,
+) -> dict[str, Any]:
+    """
+    Оценивает один проект под семафором. Исключения не пробрасываются:
+    падение одного проекта не должно отменять соседние задачи batch'а.
+    early — стриминг: вердикт уходит NOTIFY'ем до конца ответа модели.
+    """
+    name = proj.get("name", "Unnamed")
+    descr = proj.get("description", "")
 
-    for proj in projects:
-        name = proj.get("name", "Unnamed")
-        descr = proj.get("description", "")
+    if early:
+        on_verdict = functools.partial(_publish_verdict, writer.bid, idx, name)
+        evaluate_fn = functools.partial(analyze_project, on_verdict=on_verdict)
+    elif strategy.PACK_SIZE > 1:
+        evaluate_fn = analyze_project_packed
+    else:
+        evaluate_fn = analyze_project
+    with_context = evaluate_fn is not analyze_project_packed
+    if embeddings.ENABLED:
+        evaluate_fn = embeddings.wrap(evaluate_fn, with_context=with_context)
+    if similar.ENABLED:
+        evaluate_fn = similar.wrap(evaluate_fn, with_context=with_context)
+    if cascade.ENABLED:
+        evaluate_fn = cascade.wrap(evaluate_fn)
 
-        res = await analyze_project(name, descr)
-        verdicts.append(
-            {
+    async with sem:
+        try:
+            res, reused = await dedup.evaluate(name, descr, evaluate_fn)
+        except Exception as e:
+            log.exception("project %r failed: %s", name, e)
+            verdict = {
                 "name": name,
-                "verdict": res.verdict.value,
-                "tokens": res.tokens,
-                "explanation": res.explanation,
+                "verdict": "error",
+                "tokens": None,
+                "explanation": f"Evaluation error: {e}",
             }
+            await writer.add(idx, verdict, None)
+            return verdict
+
+    verdict = _verdict(name, res)
+    # в stats.gpt_calls — только реальные вызовы (кэш, dedup и шорткаты тратят 0 токенов);
+    # packed: один запрос на пачку, см. strategy._charge
+    calls = 0 if reused else res.calls if res.calls is not None else int(bool(res.tokens))
+    await writer.add(idx, verdict, _judgement_text(res), gpt_call=calls)
+    return verdict
+
+
+async def _publish_verdict(bid: int, idx: int, name: str, verdict: Verdict) -> None:
+    await notify_verdict(bid, idx, name, verdict.value)
+
+
+def _judgement_text(res: EvaluationResult) -> str | None:
+    """
+    Текст для gpt_judgements — только полный ответ OpenAI с вердиктом;
+    шорткаты, оборванные стримы и ошибки (их raw_model_answer — текст
+    исключения) → None, в merge не попадают.
+    """
+    if not res.gpt or res.truncated or res.verdict is Verdict.ERROR:
+        return None
+    return res.raw_model_answer
+
+
+def _verdict(name: str, res: EvaluationResult) -> dict[str, Any]:
+    return {
+        "name": name,
+        "verdict": res.verdict.value,
+        "tokens": res.tokens,
+        "explanation": res.explanation,
+    }
+
+
+async def _evaluate_via_batch_api(
+    writer: _BatchWriter,
+    bid: int,
+    projects: list[dict[str, Any]],
+    todo: list[int],
+) -> list[dict[str, Any]]:
+    """Крупный batch → один job OpenAI Batch API вместо len(todo) вызовов."""
+    results = await batch_api.evaluate_batch(bid, [(i, projects[i]) for i in todo])
+    fresh = []
+    for i in todo:
+        res = results[i]
+        verdict = _verdict(projects[i].get("name", "Unnamed"), res)
+        await writer.add(i, verdict, _judgement_text(res), gpt_call=bool(res.tokens))
+        fresh.append(verdict)
+    return fresh
+
+
+async def _process_batch(
+    bid: int,
+    projects: list[dict[str, Any]],
+    *,
+    concurrency: int = BATCH_CONCURRENCY,
+) -> None:
+    done = await _load_progress(bid)
+    if done:
+        log.info("batch %s resumed: %d/%d projects already judged", bid, len(done), len(projects))
+
+    writer = _BatchWriter(bid)
+    sem = asyncio.Semaphore(max(1, concurrency))
+    todo = [i for i in range(len(projects)) if i not in done]
+    if batch_api.enabled_for(len(todo)):
+        fresh = await _evaluate_via_batch_api(writer, bid, projects, todo)
+    else:
+        early = strategy.STREAM and len(projects) <= strategy.STREAM_MAX_BATCH
+        # gather сохраняет порядок payload'а
+        fresh = await asyncio.gather(
+            *(_evaluate(writer, i, projects[i], sem, early=early) for i in todo)
         )
-        await _upsert_judgement(res)
+    done.update(zip(todo, fresh))
 
-    await _mark_batch(bid, ok=True, result=verdicts)
+    verdicts = [done[i] for i in range(len(projects))]
+    judged = await writer.commit(verdicts)
+    if embeddings.ENABLED:
+        # в индекс — только GPT-вердикты: шорткат, попавший туда, вернулся бы
+        # через embeddings.wrap как «ранее оценённый»
+        await embeddings.record_batch(projects, verdicts, judged)
     log.info("batch %s done (%d projects)", bid, len(projects))
 
 
 # ───────────────── worker loop ────────────────────────────────────────────
-async def _worker_loop() -> None:
-    await get_pool()  # warm-up
+async def _run_batch(bid: int, payload: list[dict[str, Any]]) -> None:
+    try:
+        await _process_batch(bid, payload)
+    except LeaseLost:
+        log.warning("batch %s: lease lost before commit, result discarded", bid)
+    except Exception as e:  # GPT упал или другое
+        log.exception("batch %s failed: %s", bid, e)
+        await _mark_batch(bid, ok=False, result=str(e))
 
-    while True:
-        bid, payload = await _next_batch()
-        if bid is None:
-            await asyncio.sleep(2)
-            continue
 
+async def _heartbeat(running: dict[int, asyncio.Task[None]]) -> None:
+    """
+    Каждые HEARTBEAT_EVERY с продлеваем аренду своих batch'ей и запускаем
+    reaper. Если аренду у нас отобрали — слот останавливается, чтобы не
+    тратить токены параллельно с новым владельцем.
+    """
+    while True:
+        await asyncio.sleep(HEARTBEAT_EVERY)
         try:
-            await _process_batch(bid, payload)  # type: ignore[arg-type]
-        except Exception as e:  # GPT упал или другое
-            log.exception("batch %s failed: %s", bid, e)
-            await _mark_batch(bid, ok=False, result=str(e))
+            if running:
+                kept = await _renew_leases(list(running))
+                for bid in set(running) - kept:
+                    log.warning("lease for batch %s lost, stopping slot", bid)
+                    running[bid].cancel()
+            await _reap_expired()
+        except Exception as e:
+            log.warning("heartbeat failed: %s", e)
+
+
+async def _worker_loop(
+    slots: int = WORKER_SLOTS,
+    stop: asyncio.Event | None = None,
+) -> None:
+    """
+    Пул слотов. Когда выставлен *stop* — новые batch'и не берём,
+    дожидаемся уже запущенных (graceful drain) и выходим.
+    """
+    await get_pool()  # warm-up
+    stop = stop or asyncio.Event()
+
+    running: dict[int, asyncio.Task[None]] = {}
+    heartbeat = asyncio.create_task(_heartbeat(running))
+    try:
+        while not stop.is_set():
+            free = slots - len(running)
+            if free > 0:
+                for bid, payload in await _claim_batches(free):
+                    running[bid] = asyncio.create_task(_run_batch(bid, payload))
+
+            # ждём первое из: освободился слот / NOTIFY о новом batch'е
+            # (только если есть свободный слот) / сигнал остановки
+            waiters: set[asyncio.Task[Any]] = set(running.values())
+            stopper = asyncio.create_task(stop.wait())
+            waiters.add(stopper)
+            notify = None
+            if len(running) < slots:
+                notify = asyncio.create_task(wait_new_batch(POLL_DELAY))
+                waiters.add(notify)
+
+            done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            for bid, task in list(running.items()):
+                if task in done:
+                    del running[bid]
+            for aux in (notify, stopper):
+                if aux is not None and aux not in done:
+                    aux.cancel()
+
+        if running:
+            log.info("draining %d running batch(es)…", len(running))
+            await asyncio.wait(running.values())
+    finally:
+        heartbeat.cancel()
 
 
 def start_worker() -> None:
     """Вызывается из api.py → startup."""
     asyncio.create_task(_worker_loop())
-    log.info("batch-worker started")
+    log.info("batch-worker started (%d slots)", WORKER_SLOTS)
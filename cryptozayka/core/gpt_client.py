@@ -1,36 +1,49 @@
 from __future__ import annotations
 
 """
-Асинхронный клиент OpenAI + ежемесячный бюджет токенов.
+Асинхронный клиент OpenAI + ежемесячный бюджет токенов
+(общий для всех процессов леджер в Postgres, см. budget.py).
 
 Публичные функции, ожидаемые другими модулями:
     • chat(messages, …)        – отправить запрос в GPT и вернуть ответ-строку
     • load_usage() → dict      – прочитать текущую статистику расходов
     • reset_usage()            – обнулить счётчик вручную
-    • save_usage(n)            – прибавить *n* токенов к счётчику
-    • get_client()             – вернуть singleton AsyncOpenAI
+    • save_usage(n, model)     – прибавить *n* токенов к счётчику
+    • get_client()             – вернуть singleton AsyncOpenAI (llm_gateway)
+    • count_messages / count_batch – оценка токенов (кэш encoder'ов tiktoken)
 """
 
-import json
+import functools
 import logging
-from datetime import datetime
-from pathlib import Path
+import os
 from typing import Any, Final, List, TypedDict
 
 import tiktoken
 from openai import AsyncOpenAI
 
-from ..settings import get_settings
+from . import budget, llm_gateway
 
 # ─────────────────────────────────────────────────────────────────────────────
 log = logging.getLogger(__name__)
-_s = get_settings()
-_client: Final = AsyncOpenAI(api_key=_s.openai_api_key)
+_client: Final = llm_gateway.openai_client()
 
-# JSON-файл хранится во volume /app/data
-TOKENS_FILE: Final = Path("/app/data/spent_tokens.json")
 COST_PER_1K:  Final[float] = 0.002      # $ за 1000 токенов
 MAX_BUDGET:   Final[float] = 20.0       # месячный лимит в $
+BUDGET_TOKENS: Final[int] = int(MAX_BUDGET / COST_PER_1K * 1000)
+
+# потоки tiktoken для encode_batch (Rust-часть отпускает GIL)
+ENCODE_THREADS: Final[int] = int(os.getenv("TIKTOKEN_THREADS", "4"))
+# семейства моделей → кодировка, если tiktoken не знает конкретное имя
+_FAMILY_ENCODINGS: Final = (
+    ("gpt-4o", "o200k_base"),
+    ("gpt-4.1", "o200k_base"),
+    ("o1", "o200k_base"),
+    ("o3", "o200k_base"),
+    ("gpt-4", "cl100k_base"),
+    ("gpt-3.5", "cl100k_base"),
+    ("text-embedding-3", "cl100k_base"),
+)
+_DEFAULT_ENCODING: Final = "cl100k_base"
 
 # ─────────────────────────── типы ────────────────────────────────────────────
 class _ChatMessage(TypedDict):
@@ -44,59 +57,105 @@ __all__ = [
     "reset_usage",
     "save_usage",
     "get_client",
+    "count_batch",
+    "count_messages",
 ]
 
 # ─────────────────────── внутренние утилиты ─────────────────────────────────
-def _now_ym() -> str:
-    """Текущий месяц (UTC) в формате YYYY-MM."""
-    return datetime.utcnow().strftime("%Y-%m")
+def _encoding_name(model: str) -> str:
+    """gpt-4-0125-preview → cl100k_base; неизвестное — по семейству/дефолт."""
+    try:
+        return tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        pass
+    for prefix, name in _FAMILY_ENCODINGS:
+        if model.startswith(prefix):
+            return name
+    return _DEFAULT_ENCODING
 
 
-def _count(text: str, model: str) -> int:
+@functools.lru_cache(maxsize=None)
+def _encoder(model: str) -> tiktoken.Encoding | None:
     """
-    Грубая оценка количества токенов в *text* для модели.
-    Если tiktoken не знает модель — считаем ~4 байта на символ.
+    Кэш encoder'а на модель. None — кодировку загрузить не удалось
+    (нет сети / кэша BPE): тогда до рестарта считаем эвристикой,
+    а не ходим за файлом на каждый вызов.
     """
+    name = _encoding_name(model)
     try:
-        enc = tiktoken.encoding_for_model(model)
-        return len(enc.encode(text))
-    except KeyError:
-        return max(1, round(len(text) / 4))
-
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        log.warning("tiktoken encoding %s for %s unavailable (%s), using heuristic", name, model, e)
+        return None
 
-def _load() -> dict[str, Any]:
-    """Внутреннее чтение JSON со статистикой."""
-    if TOKENS_FILE.exists():
-        data = json.loads(TOKENS_FILE.read_text())
-    else:
-        data = {"tokens_used": 0, "month": _now_ym()}
 
-    # новый месяц — счётчик обнуляем
-    if data.get("month") != _now_ym():
-        data.update(tokens_used=0, month=_now_ym())
-    return data
+def _heuristic(text: str) -> int:
+    return max(1, round(len(text) / 4))      # ~4 символа на токен
 
 
-def _save(data: dict[str, Any]) -> None:
-    TOKENS_FILE.write_text(json.dumps(data, indent=2))
+def _count(text: str, model: str) -> int:
+    """Оценка количества токенов в *text* для модели."""
+    enc = _encoder(model)
+    if enc is None:
+        return _heuristic(text)
+    return len(enc.encode_ordinary(text))
+
+
+@functools.lru_cache(maxsize=256)
+def _count_memo(text: str, model: str) -> int:
+    """_count с мемоизацией — для повторяющихся system-промптов."""
+    return _count(text, model)
+
+
+def count_batch(texts: List[str], model: str) -> List[int]:
+    """Токены для списка строк одним encode_batch (в ENCODE_THREADS потоков)."""
+    enc = _encoder(model)
+    if enc is None:
+        return [_heuristic(t) for t in texts]
+    if len(texts) == 1:
+        return [len(enc.encode_ordinary(texts[0]))]
+    return [len(t) for t in enc.encode_ordinary_batch(texts, num_threads=ENCODE_THREADS)]
+
+
+def count_messages(messages: List[_ChatMessage], model: str) -> int:
+    """Сумма токенов сообщений: system — через memo, остальные — батчем."""
+    total = 0
+    rest: List[str] = []
+    for m in messages:
+        if m["role"] == "system":
+            total += _count_memo(m["content"], model)
+        else:
+            rest.append(m["content"])
+    if rest:
+        total += sum(count_batch(rest, model))
+    return total
 
 
 # ─────────────────────── публичные хелперы ──────────────────────────────────
 def load_usage() -> dict[str, Any]:
-    """Вернуть текущую статистику (месяц + израсходованные токены)."""
-    return _load()
+    """
+    Текущая статистика (месяц + израсходованные токены) из снапшота
+    леджера — без I/O; свежие цифры подтягивает budget.ledger.refresh().
+    """
+    return {
+        "tokens_used": budget.ledger.used(),
+        "month": budget.current_month(),
+        "models": budget.ledger.snapshot(),
+    }
 
 
 def reset_usage() -> None:
-    """Полностью сбросить статистику токенов."""
-    _save({"tokens_used": 0, "month": _now_ym()})
+    """Полностью сбросить статистику токенов за текущий месяц."""
+    month = budget.current_month()
+    budget.ledger._snapshot[month] = {}
+    budget.run_sync(budget._reset, month)
 
 
-def save_usage(tokens_used: int) -> None:
-    """Добавить *tokens_used* к счётчику и сохранить."""
-    data = _load()
-    data["tokens_used"] += tokens_used
-    _save(data)
+def save_usage(tokens_used: int, model: str = "unspecified") -> None:
+    """Добавить *tokens_used* к счётчику модели *model*."""
+    month = budget.current_month()
+    budget.ledger._put(month, model, budget.ledger.snapshot(month).get(model, 0) + tokens_used)
+    budget.run_sync(budget._settle, month, model, None, tokens_used)
 
 
 def get_client() -> AsyncOpenAI:
@@ -114,28 +173,25 @@ async def chat(
 ) -> str:
     """
     Отправить список сообщений в GPT-модель и вернуть ответ (строка).
-    Контролируем месячный бюджет; при превышении — RuntimeError.
+    Контролируем месячный бюджет; при превышении — budget.BudgetExceeded
+    (подкласс RuntimeError).
     """
-    usage = _load()
-
-    # оцениваем потенциальные траты
-    estimated_tokens = sum(_count(m["content"], model) for m in messages) + max_tokens
-    projected_cost   = (usage["tokens_used"] + estimated_tokens) / 1000 * COST_PER_1K
-
-    if projected_cost > MAX_BUDGET:
-        raise RuntimeError("GPT budget exceeded for current month")
-
-    # выполняем запрос
-    resp = await _client.chat.completions.create(
-        model=model,
-        temperature=temperature,
-        max_tokens=max_tokens,
-        messages=[dict(m) for m in messages],
-    )
-
-    # сохраняем фактические токены
-    usage["tokens_used"] += resp.usage.total_tokens
-    _save(usage)
+    # резервируем оценку, после ответа списываем фактические токены
+    estimated_tokens = count_messages(messages, model) + max_tokens
+    reservation = await budget.ledger.reserve(model, estimated_tokens, BUDGET_TOKENS)
+
+    used: int | None = 0
+    try:
+        async with llm_gateway.observe("openai", model) as call:
+            resp = await _client.chat.completions.create(
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                messages=[dict(m) for m in messages],
+            )
+            used = call.tokens = getattr(resp.usage, "total_tokens", None)
+    finally:
+        await budget.ledger.settle(reservation, used)
 
     return resp.choices[0].message.content.strip()
 
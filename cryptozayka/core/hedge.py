@@ -0,0 +1,138 @@
+"""Hedged GPT requests with latency-based model fallback.
+
+Если основной вызов (strategy.MODEL) не ответил за скользящий p95
+латентности последних WINDOW вызовов, тот же запрос параллельно уходит
+в fallback-модель (флаг Unleash "gpt_fallback_model", по умолчанию
+Settings.openai_model). Побеждает первый валидный ответ, проигравший
+отменяется.
+
+Стоимость ограничена: доля хеджированных вызовов в окне не больше
+GPT_HEDGE_MAX_RATE; сверх лимита просто ждём основной ответ.
+Пока в окне меньше MIN_SAMPLES замеров, порог — GPT_HEDGE_DEFAULT_DELAY.
+
+GPT_HEDGE=1 включает механизм. Метрика: gpt_hedge_total{outcome}.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from prometheus_client import Counter
+
+from ..settings import get_settings
+from .flags import get_variant
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.getenv("GPT_HEDGE", "0") == "1"
+MAX_RATE = float(os.getenv("GPT_HEDGE_MAX_RATE", "0.1"))          # доля вызовов
+DEFAULT_DELAY = float(os.getenv("GPT_HEDGE_DEFAULT_DELAY", "15"))  # секунд
+QUANTILE = 0.95
+WINDOW = 200
+MIN_SAMPLES = 20
+
+HEDGES = Counter(
+    "gpt_hedge_total",
+    "Hedged GPT requests: fired / won by fallback / lost / skipped by rate cap",
+    ["outcome"],
+)
+
+Call = Callable[[str], Awaitable[tuple[str, int | None]]]   # model → (answer, tokens)
+
+
+def fallback_model() -> str:
+    return get_variant("gpt_fallback_model", get_settings().openai_model)
+
+
+class Hedger:
+    def __init__(self, window: int = WINDOW) -> None:
+        self._latency: deque[float] = deque(maxlen=window)
+        self._hedged: deque[bool] = deque(maxlen=window)
+
+    def threshold(self) -> float:
+        if len(self._latency) < MIN_SAMPLES:
+            return DEFAULT_DELAY
+        ordered = sorted(self._latency)
+        return ordered[min(len(ordered) - 1, int(QUANTILE * len(ordered)))]
+
+    def _track(self, task: asyncio.Future[Any], started: float) -> None:
+        """Латентность primary — всякий раз, когда он завершился успешно."""
+
+        def _done(t: asyncio.Future[Any]) -> None:
+            if not t.cancelled() and t.exception() is None:
+                self._latency.append(time.perf_counter() - started)
+
+        task.add_done_callback(_done)
+
+    def _allowed(self) -> bool:
+        # +1: этот хедж тоже должен уложиться в лимит
+        return sum(self._hedged) + 1 <= MAX_RATE * max(len(self._hedged), MIN_SAMPLES)
+
+    async def race(
+        self,
+        call: Call,
+        primary: str,
+        fallback: str,
+        validate: Callable[[str], Any],
+    ) -> tuple[str, int | None, str]:
+        """
+        (answer, tokens, model) — первый валидный ответ из primary/fallback.
+        Ни один вызов не переживает race: проигравший и (при отмене самого
+        race — потеря аренды, drain) все незавершённые отменяются.
+        """
+        started = time.perf_counter()
+        first = asyncio.ensure_future(call(primary))
+        self._track(first, started)
+        tasks = [first]
+        fallback_won = False
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.threshold())
+            if done or fallback == primary:
+                answer, tokens = await first
+                self._hedged.append(False)
+                return answer, tokens, primary
+
+            if not self._allowed():
+                HEDGES.labels("capped").inc()
+                answer, tokens = await first
+                self._hedged.append(False)
+                return answer, tokens, primary
+
+            HEDGES.labels("fired").inc()
+            self._hedged.append(True)
+            log.info("⏱ %s slower than %.1fs, hedging with %s", primary, self.threshold(), fallback)
+            second = asyncio.ensure_future(call(fallback))
+            tasks.append(second)
+            models = {first: primary, second: fallback}
+            pending = {first, second}
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        answer, tokens = task.result()
+                        validate(answer)
+                    except Exception as e:
+                        error = e
+                        continue
+                    fallback_won = task is second
+                    HEDGES.labels("won" if fallback_won else "lost").inc()
+                    return answer, tokens, models[task]
+            assert error is not None
+            raise error
+        finally:
+            if fallback_won and not first.done():
+                # primary отменяем (его токены никто бы не учёл), но в окно
+                # кладём прожитое время — нижнюю границу его латентности (≥ порога):
+                # без неё в окне остаются только быстрые ответы и p95 ползёт вниз
+                self._latency.append(time.perf_counter() - started)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+
+hedger = Hedger()
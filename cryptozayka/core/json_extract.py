@@ -0,0 +1,81 @@
+"""Tolerant extraction of the JSON payload from a model answer.
+
+Модель иногда оборачивает ответ в ```json … ``` или добавляет прозу до/после.
+extract_json не тратит второй платный вызов на «почини формат»:
+
+  1. быстрый путь — json.loads всего ответа;
+  2. содержимое первого markdown-блока ```…```, если он есть;
+  3. первое сбалансированное JSON-значение нужного типа в тексте — через
+     JSONDecoder.raw_decode (C-сканер сам находит конец значения, скобки
+     внутри строк ему не мешают).
+
+Метрика gpt_answer_parse_total{shape,result}: clean / extracted / failed —
+доля failed и есть parse-failure rate. Считается один раз на итоговый
+ответ: предварительные проверки (кэш, кандидаты хеджа) зовут с record=False.
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import Any
+
+from prometheus_client import Counter
+
+PARSE_RESULTS = Counter(
+    "gpt_answer_parse_total",
+    "Model answers by JSON parse outcome",
+    ["shape", "result"],
+)
+
+MAX_CANDIDATES = 16     # сколько открывающих скобок пробуем, прежде чем сдаться
+
+_FENCE_RE = re.compile(r"```[a-zA-Z]*[ \t]*\n?(.*?)```", re.DOTALL)
+_OPENERS = {dict: "{", list: "["}
+_decoder = json.JSONDecoder()
+
+
+def _first_value(text: str, kinds: tuple[type, ...]) -> Any:
+    opener = re.compile("[" + "".join(re.escape(_OPENERS[k]) for k in kinds) + "]")
+    for i, m in enumerate(opener.finditer(text)):
+        if i == MAX_CANDIDATES:
+            break
+        try:
+            value = _decoder.raw_decode(text, m.start())[0]
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, kinds):
+            return value
+    return None
+
+
+def extract_json(answer: str, *kinds: type, record: bool = True) -> Any:
+    """
+    Первое JSON-значение одного из типов *kinds* (dict и/или list, по
+    умолчанию dict) из ответа модели; ValueError, если его там нет.
+    record=False — не трогать метрику (проверка, а не итоговый разбор).
+    """
+    kinds = kinds or (dict,)
+    shape = "|".join(k.__name__ for k in kinds)
+    answer = answer or ""
+
+    def _record(result: str) -> None:
+        if record:
+            PARSE_RESULTS.labels(shape, result).inc()
+
+    try:
+        parsed = json.loads(answer)
+        if isinstance(parsed, kinds):
+            _record("clean")
+            return parsed
+    except json.JSONDecodeError:
+        pass
+
+    fence = _FENCE_RE.search(answer)
+    for text in ((fence.group(1),) if fence else ()) + (answer,):
+        parsed = _first_value(text, kinds)
+        if parsed is not None:
+            _record("extracted")
+            return parsed
+
+    _record("failed")
+    raise ValueError(f"model answer is not JSON {shape}: {answer[:80]!r}")
@@ -0,0 +1,126 @@
+"""Single owner of LLM provider clients and their metrics.
+
+Раньше strategy.py и gpt_client.py держали по своему AsyncOpenAI с
+дефолтным httpx-пулом, а rag.py — отдельную aiohttp-сессию. Теперь:
+
+  • openai_client() — один AsyncOpenAI на процесс поверх настроенного
+    httpx.AsyncClient: явные лимиты пула (LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE), keep-alive LLM_KEEPALIVE_EXPIRY с, HTTP/2
+    (LLM_HTTP2=1 и установлен пакет h2 — иначе HTTP/1.1), таймауты
+    OPENAI_TIMEOUT / OPENAI_CONNECT_TIMEOUT. Воркеры переиспользуют тёплые
+    соединения вместо нового TLS-рукопожатия на каждый всплеск;
+  • llama_client() — пул к llama.cpp (rag.LlamaClient, таймауты LLAMA_*);
+  • observe(provider, model) — латентность, токены и ошибки каждого вызова
+    в одном месте: llm_request_seconds, llm_tokens_total, llm_errors_total;
+  • close() — закрыть всё при остановке воркера/API.
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from prometheus_client import Counter, Histogram
+
+from ..settings import get_settings
+
+if TYPE_CHECKING:
+    from .rag import LlamaClient
+
+log = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "32"))
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))   # секунд
+HTTP2 = os.getenv("LLM_HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))             # секунд на запрос
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+
+LATENCY = Histogram(
+    "llm_request_seconds",
+    "LLM provider call latency",
+    ["provider", "model", "outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+TOKENS = Counter("llm_tokens_total", "Tokens reported by LLM providers", ["provider", "model"])
+ERRORS = Counter("llm_errors_total", "Failed LLM provider calls", ["provider", "model", "error"])
+
+_openai: AsyncOpenAI | None = None
+
+
+def _http_client() -> httpx.AsyncClient:
+    return DefaultAsyncHttpxClient(
+        http2=HTTP2,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+    )
+
+
+def openai_client() -> AsyncOpenAI:
+    """Общий AsyncOpenAI процесса (создаётся при первом обращении)."""
+    global _openai
+    if _openai is None:
+        _openai = AsyncOpenAI(
+            api_key=get_settings().openai_api_key,
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+            http_client=_http_client(),
+        )
+        log.info(
+            "OpenAI pool: %d conns, %d keep-alive, http2=%s", MAX_CONNECTIONS, MAX_KEEPALIVE, HTTP2
+        )
+    return _openai
+
+
+def llama_client() -> LlamaClient:
+    from . import rag
+
+    return rag.client
+
+
+class Call:
+    """Заполняется внутри observe(): tokens — usage ответа, если известен."""
+
+    __slots__ = ("tokens",)
+
+    def __init__(self) -> None:
+        self.tokens: int | None = None
+
+
+@asynccontextmanager
+async def observe(provider: str, model: str) -> AsyncIterator[Call]:
+    call = Call()
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield call
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        outcome = "error"
+        ERRORS.labels(provider, model, type(e).__name__).inc()
+        raise
+    finally:
+        LATENCY.labels(provider, model, outcome).observe(time.perf_counter() - started)
+        if call.tokens:
+            TOKENS.labels(provider, model).inc(call.tokens)
+
+
+async def close() -> None:
+    global _openai
+    from . import rag
+
+    if _openai is not None:
+        await _openai.close()
+        _openai = None
+    await rag.close_llama()
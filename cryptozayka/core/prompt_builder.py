@@ -1,25 +1,17 @@
 """Build user prompt taking into account scamlist matches."""
 from __future__ import annotations
 
-import json
-import os
 from pathlib import Path
-from typing import List, Dict
+from typing import List
 
-SCAMLIST_PATH = Path("memory/scamlist.json")
+from .scamlist import ScamIndex
 
-def _load_scamlist() -> Dict[str, list]:
-    if SCAMLIST_PATH.exists():
-        return json.loads(SCAMLIST_PATH.read_text())
-    return {"scams": []}
+SCAMLIST_PATH = Path("memory/scamlist.json")
+_INDEX = ScamIndex(SCAMLIST_PATH)
 
 def check_against_scamlist(project_name: str) -> List[dict]:
-    data = _load_scamlist()
-    matches = []
-    for scam in data.get("scams", []):
-        if scam.get("name", "").lower() in project_name.lower():
-            matches.append(scam)
-    return matches
+    """Записи scamlist, чьё имя входит в название (Aho–Corasick, см. scamlist.py)."""
+    return _INDEX.match(project_name)
 
 def build_project_prompt(name: str, description: str) -> tuple[str, list]:
     matches = check_against_scamlist(name)
@@ -0,0 +1,116 @@
+"""Registry of compiled prompt templates (PROMPTS_DIR/*.md).
+
+Шаблон читается с диска один раз и сразу режется по плейсхолдерам
+``{{ name }}`` на список [литерал, имя, литерал, имя, …]; рендер — один
+"".join без replace/format (JSON-скобки в тексте шаблона не мешают).
+
+Горячая перезагрузка: не чаще раза в CHECK_EVERY с на шаблон делаем
+os.stat и, если mtime/размер поменялись, перекомпилируем. Правка промпта
+подхватывается без рестарта, а горячий путь не трогает диск на каждый проект.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+PROMPTS_DIR = Path(
+    os.getenv("PROMPTS_DIR") or Path(__file__).resolve().parents[2] / "prompts"
+)
+CHECK_EVERY = float(os.getenv("PROMPTS_CHECK_EVERY", "2"))   # секунд; 0 — stat на каждый рендер
+SUFFIX = ".md"
+
+_PLACEHOLDER_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+@dataclass(slots=True)
+class CompiledTemplate:
+    name: str
+    parts: list[str]        # чётные — литералы, нечётные — имена переменных
+    mtime_ns: int
+    size: int
+    checked_at: float
+    digest: str             # sha1 текста — версия шаблона
+
+    @property
+    def fields(self) -> frozenset[str]:
+        return frozenset(self.parts[1::2])
+
+    def render(self, values: dict[str, str]) -> str:
+        parts = self.parts[:]
+        for i in range(1, len(parts), 2):
+            parts[i] = values[parts[i]]
+        return "".join(parts)
+
+
+def compile_template(name: str, text: str, mtime_ns: int = 0, size: int = 0) -> CompiledTemplate:
+    # re.split с группой: [lit, var, lit, var, …, lit]
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return CompiledTemplate(name, _PLACEHOLDER_RE.split(text), mtime_ns, size, time.monotonic(), digest)
+
+
+class TemplateRegistry:
+    """Именованные шаблоны каталога *root*: name → root/name.md."""
+
+    def __init__(self, root: Path = PROMPTS_DIR, check_every: float = CHECK_EVERY) -> None:
+        self.root = Path(root)
+        self.check_every = check_every
+        self._cache: dict[str, CompiledTemplate] = {}
+        self._lock = threading.Lock()
+
+    def path(self, name: str) -> Path:
+        return self.root / f"{name}{SUFFIX}"
+
+    def names(self) -> list[str]:
+        return sorted(p.stem for p in self.root.glob(f"*{SUFFIX}"))
+
+    def _load(self, name: str) -> CompiledTemplate:
+        path = self.path(name)
+        try:
+            st = path.stat()
+            text = path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Prompt file not found: {path}") from None
+        tpl = compile_template(name, text, st.st_mtime_ns, st.st_size)
+        log.info("prompt %r (re)loaded from %s", name, path)
+        return tpl
+
+    def get(self, name: str) -> CompiledTemplate:
+        tpl = self._cache.get(name)
+        now = time.monotonic()
+        if tpl is not None and now - tpl.checked_at < self.check_every:
+            return tpl
+
+        with self._lock:
+            tpl = self._cache.get(name)
+            if tpl is not None:
+                try:
+                    st = self.path(name).stat()
+                except FileNotFoundError:
+                    st = None
+                if st is not None and (st.st_mtime_ns, st.st_size) == (tpl.mtime_ns, tpl.size):
+                    tpl.checked_at = now
+                    return tpl
+            tpl = self._cache[name] = self._load(name)
+            return tpl
+
+    def render(self, name: str, /, **values: str) -> str:
+        return self.get(name).render(values)
+
+    def version(self, name: str) -> str:
+        """Отпечаток содержимого шаблона — меняется при любой правке файла."""
+        return f"{name}:{self.get(name).digest}"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+registry = TemplateRegistry()
@@ -1,46 +1,244 @@
-"""Local Llama2‐7B with simple RAG for cheap preliminary screening.
+"""Local Llama2‐7B with RAG for cheap preliminary screening.
 
 Requires running llama.cpp server at http://llama:8080 (see docker-compose snippet).
 
 Functions:
   `screen_project(name, desc) -> (is_flagged: bool, reason: str)`
+  `screen_score(name, desc) -> (p_scam: float | None, reply: str)`
+      p_scam — вероятность ответа YES по n_probs первого токена
+      (None — сервер недоступен).
+
+  `screen_many([(name, desc), …]) -> [(p_scam, reply), …]`
+      то же пачкой: один multi-prompt /completion на LLAMA_SLOTS проектов;
+      им скринит каскад (cascade.py), склеивая одновременные проекты.
+      Сервер занят / таймаут — сразу (None, "") для всех: проекты уходят
+      в GPT, а не во второй круг ожидания слотов по одному.
 
 Logic:
+  • Compress the description to LLAMA_DESC_TOKENS (compress.py) — the
+    local context is per slot (-c / -np of llama-server).
+  • Retrieve k nearest past verdicts from the embedding index
+    (embeddings.py, EMBED_INDEX=1) and put them into the prompt.
   • Query local model: "Is project likely scam …?" with temperature=0.
   • If confident 'yes', mark as scam → GPT not called (save tokens).
+
+Transport (LlamaClient): один долгоживущий aiohttp-сессион с keep-alive,
+не больше LLAMA_SLOTS одновременных промптов (= -np сервера), ожидание
+свободного слота не дольше LLAMA_QUEUE_TIMEOUT с. cache_prompt=true —
+общий префикс-инструкция считается сервером один раз на слот.
 """
 from __future__ import annotations
 
 import aiohttp
+import asyncio
 import logging
+import math
 import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+from . import compress, embeddings, llm_gateway, strategy
 
 log = logging.getLogger(__name__)
 _LLAMA_URL = os.getenv("LLAMA_URL", "http://llama:8080/completion")
+# /embedding того же сервера (нужен флаг --embedding) или отдельный embedding-сервер
+_EMBED_URL = os.getenv("LLAMA_EMBED_URL") or _LLAMA_URL.rsplit("/", 1)[0] + "/embedding"
+LLAMA_SLOTS = max(1, int(os.getenv("LLAMA_SLOTS", "4")))              # = llama-server -np
+LLAMA_QUEUE_TIMEOUT = float(os.getenv("LLAMA_QUEUE_TIMEOUT", "30"))   # секунд ждём слот
+LLAMA_TIMEOUT = float(os.getenv("LLAMA_TIMEOUT", "30"))               # секунд на запрос
+LLAMA_DESC_TOKENS = int(os.getenv("LLAMA_DESC_TOKENS", "256"))        # бюджет описания в промпте
 
 
-async def _llama(prompt: str) -> str:
-    async with aiohttp.ClientSession() as s:
+class LlamaBusy(asyncio.TimeoutError):
+    """Свободный слот llama-сервера не появился за LLAMA_QUEUE_TIMEOUT."""
+
+
+class LlamaClient:
+    """Пул соединений + счётчик слотов к одному llama.cpp-серверу."""
+
+    def __init__(
+        self,
+        url: str = _LLAMA_URL,
+        slots: int = LLAMA_SLOTS,
+        embed_url: str = _EMBED_URL,
+    ) -> None:
+        self.url = url
+        self.embed_url = embed_url
+        self.slots = slots
+        self._free = slots
+        self._cond: asyncio.Condition | None = None
+        self._session: aiohttp.ClientSession | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _bind(self) -> None:
+        """Сессия и Condition привязаны к loop'у — пересоздаём при смене."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._session is None or self._session.closed:
+            self._loop = loop
+            self._cond = asyncio.Condition()
+            self._free = self.slots
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.slots, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=LLAMA_TIMEOUT),
+            )
+
+    @asynccontextmanager
+    async def _acquire(self, n: int) -> AsyncIterator[None]:
+        assert self._cond is not None
+        async with self._cond:
+            try:
+                await asyncio.wait_for(
+                    self._cond.wait_for(lambda: self._free >= n), LLAMA_QUEUE_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                raise LlamaBusy(f"no free llama slot in {LLAMA_QUEUE_TIMEOUT}s") from None
+            self._free -= n
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._free += n
+                self._cond.notify_all()
+
+    async def _request(self, url: str, payload: dict[str, Any], n: int) -> Any:
+        self._bind()
+        assert self._session is not None
+        async with self._acquire(n):
+            async with llm_gateway.observe("llama", "local"):
+                async with self._session.post(url, json=payload) as r:
+                    r.raise_for_status()
+                    return await r.json()
+
+    async def _post(self, prompt: str | list[str], n: int, extra: dict[str, Any]) -> Any:
         payload = {
             "prompt": prompt,
             "temperature": 0,
-            "max_tokens": 128,
+            "n_predict": 128,
             "stop": ["\n"],
+            "cache_prompt": True,
+            **extra,
         }
-        async with s.post(_LLAMA_URL, json=payload, timeout=30) as r:
-            r.raise_for_status()
-            data = await r.json()
-            return data["content"].strip()
+        return await self._request(self.url, payload, n)
 
+    async def complete(self, prompt: str, **extra: Any) -> dict[str, Any]:
+        return await self._post(prompt, 1, extra)
 
-async def screen_project(name: str, description: str) -> tuple[bool, str]:
-    prompt = f"""Answer strictly with 'YES' or 'NO' and a short reason.
+    async def complete_many(self, prompts: list[str], **extra: Any) -> list[dict[str, Any]]:
+        """Multi-prompt /completion: до self.slots промптов за запрос."""
+        out: list[dict[str, Any]] = []
+        for i in range(0, len(prompts), self.slots):
+            chunk = prompts[i:i + self.slots]
+            if len(chunk) == 1:
+                out.append(await self.complete(chunk[0], **extra))
+                continue
+            data = await self._post(chunk, len(chunk), extra)
+            if not isinstance(data, list) or len(data) != len(chunk):
+                raise ValueError("llama server ignored multi-prompt request")
+            out.extend(data)
+        return out
+
+    async def embed(self, texts: list[str]) -> list[Any]:
+        """Сырые ответы /embedding — по запросу на текст, не больше self.slots сразу."""
+        return list(await asyncio.gather(
+            *(self._request(self.embed_url, {"content": t}, 1) for t in texts)
+        ))
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+client = LlamaClient()
+
+
+async def close_llama() -> None:
+    await client.close()
+
+
+async def _complete(prompt: str, **extra: Any) -> dict[str, Any]:
+    return await client.complete(prompt, **extra)
+
+
+async def _llama(prompt: str) -> str:
+    data = await _complete(prompt)
+    return data["content"].strip()
+
+
+def _screen_prompt(
+    name: str,
+    description: str,
+    neighbours: list[embeddings.Neighbour] | None = None,
+) -> str:
+    # токены считаем tiktoken'ом GPT-модели — для бюджета llama достаточно близко
+    description = compress.compress(description, LLAMA_DESC_TOKENS, strategy.MODEL).text
+    context = ""
+    if neighbours:
+        lines = "\n".join(f"- {n.project}: {n.verdict} (similarity {n.score:.2f})" for n in neighbours)
+        context = f"Past verdicts for similar projects:\n{lines}\n"
+    return f"""Answer strictly with 'YES' or 'NO' and a short reason.
 Question: Is the following airdrop project a scam risk?
-Project: {name}
+{context}Project: {name}
 Details: {description}
 Answer:"""
+
+
+def _first_token_probs(data: dict[str, Any]) -> list[tuple[str, float]]:
+    """(token, prob) кандидатов первого токена — старый и новый формат llama.cpp."""
+    probs = data.get("completion_probabilities") or []
+    if not probs:
+        return []
+    first = probs[0]
+    if "probs" in first:                                  # {"probs": [{"tok_str", "prob"}]}
+        return [(p.get("tok_str", ""), float(p.get("prob", 0))) for p in first["probs"]]
+    return [                                              # {"top_logprobs": [{"token", "logprob"}]}
+        (p.get("token", ""), math.exp(float(p.get("logprob", -math.inf))))
+        for p in first.get("top_logprobs", [])
+    ]
+
+
+def _p_yes(reply: str, candidates: list[tuple[str, float]]) -> float:
+    yes = sum(p for tok, p in candidates if tok.strip().lower().startswith("y"))
+    no = sum(p for tok, p in candidates if tok.strip().lower().startswith("n"))
+    if yes + no > 0:
+        return yes / (yes + no)
+    # сервер без n_probs — только жёсткий ответ
+    return 1.0 if reply.lower().startswith("yes") else 0.0
+
+
+def _score(data: dict[str, Any]) -> tuple[float, str]:
+    reply = data.get("content", "").strip()
+    return _p_yes(reply, _first_token_probs(data)), reply
+
+
+async def screen_score(name: str, description: str) -> tuple[float | None, str]:
+    found = await embeddings.neighbours(name, description)
+    try:
+        data = await _complete(_screen_prompt(name, description, found), n_probs=5)
+    except Exception as e:
+        log.debug("llama error: %s", e)
+        return None, ""
+    return _score(data)
+
+
+async def screen_many(projects: list[tuple[str, str]]) -> list[tuple[float | None, str]]:
+    found = await asyncio.gather(*(embeddings.neighbours(n, d) for n, d in projects))
+    prompts = [_screen_prompt(n, d, nb) for (n, d), nb in zip(projects, found)]
+    try:
+        results = await client.complete_many(prompts, n_probs=5)
+    except asyncio.TimeoutError as e:   # LlamaBusy / таймаут запроса: второй круг удвоил бы задержку
+        log.debug("llama multi-prompt timed out: %s", e)
+        return [(None, "")] * len(projects)
+    except Exception as e:
+        log.debug("llama multi-prompt error: %s, falling back to single prompts", e)
+        return list(await asyncio.gather(*(screen_score(n, d) for n, d in projects)))
+    return [_score(r) for r in results]
+
+
+async def screen_project(name: str, description: str) -> tuple[bool, str]:
+    found = await embeddings.neighbours(name, description)
     try:
-        reply = await _llama(prompt)
+        reply = await _llama(_screen_prompt(name, description, found))
     except Exception as e:
         log.debug("llama error: %s", e)
         return False, ""
@@ -0,0 +1,239 @@
+"""Adaptive OpenAI rate limiter (requests + tokens per minute).
+
+Два token-bucket'а на модель — RPM и TPM. Перед вызовом резервируем
+1 запрос и оценку токенов (gpt_client._count + max_tokens); если ведро
+ушло в минус — спим ровно столько, сколько нужно на доливку. Лимиты
+не настраиваются руками, а выучиваются из заголовков ответа:
+
+    x-ratelimit-limit-requests / x-ratelimit-limit-tokens      → ёмкость
+    x-ratelimit-remaining-requests / -remaining-tokens         → уровень
+    x-ratelimit-reset-requests / -reset-tokens ("6m0s", "20ms") → 429-пауза
+
+После ответа разница «оценка − usage.total_tokens» возвращается в ведро;
+вызов, упавший не по 429 (release), возвращает резерв токенов целиком.
+
+OPENAI_RATELIMIT_SHARED=1 (по умолчанию) — ведра живут в таблице
+rate_limits и общие для всех воркер-процессов; 0 — локально в процессе.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Any, Mapping
+
+from ..storage.pg import get_pool
+
+log = logging.getLogger(__name__)
+
+RPM_DEFAULT = float(os.getenv("OPENAI_RPM", "500"))
+TPM_DEFAULT = float(os.getenv("OPENAI_TPM", "30000"))
+SHARED = os.getenv("OPENAI_RATELIMIT_SHARED", "1") == "1"
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset(value: str | None) -> float | None:
+    """'6m0s' → 360.0, '20ms' → 0.02; None, если разобрать нельзя."""
+    if not value:
+        return None
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(n) * _UNIT[u] for n, u in parts)
+
+
+def _num(headers: Mapping[str, str], key: str) -> float | None:
+    try:
+        return float(headers[key])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenBucketLimiter:
+    """Ведра RPM/TPM в памяти процесса."""
+
+    def __init__(self, key: str, rpm: float = RPM_DEFAULT, tpm: float = TPM_DEFAULT) -> None:
+        self.key = key
+        self.rpm, self.tpm = rpm, tpm
+        self._req, self._tok = rpm, tpm
+        self._ts = time.monotonic()
+
+    # ─── storage primitives (переопределяются в PgTokenBucketLimiter) ───
+    def _refill(self) -> None:
+        """Долить ведра за время с прошлого изменения и сдвинуть отметку."""
+        now = time.monotonic()
+        elapsed, self._ts = now - self._ts, now
+        self._req = min(self.rpm, self._req + self.rpm / 60 * elapsed)
+        self._tok = min(self.tpm, self._tok + self.tpm / 60 * elapsed)
+
+    async def _reserve(self, tokens: float) -> float:
+        """Списать 1 запрос и *tokens*; вернуть, сколько секунд ждать."""
+        self._refill()
+        self._req -= 1
+        self._tok -= tokens
+        return max(0.0, -self._req / (self.rpm / 60), -self._tok / (self.tpm / 60))
+
+    async def _adjust(
+        self,
+        *,
+        rpm: float | None,
+        tpm: float | None,
+        remaining_req: float | None,
+        remaining_tok: float | None,
+        refund: float,
+    ) -> None:
+        self._refill()   # remaining-* — уровень «сейчас», доливка до него уже учтена
+        self.rpm = rpm or self.rpm
+        self.tpm = tpm or self.tpm
+        self._tok += refund
+        if remaining_req is not None:
+            self._req = min(self._req, remaining_req)
+        if remaining_tok is not None:
+            self._tok = min(self._tok, remaining_tok)
+
+    # ─── public API ─────────────────────────────────────────────────────
+    async def acquire(self, tokens: int) -> None:
+        """Дождаться права отправить запрос на ~*tokens* токенов."""
+        wait = await self._reserve(min(float(tokens), self.tpm))
+        if wait > 0:
+            log.debug("rate limit %s: sleeping %.2fs", self.key, wait)
+            await asyncio.sleep(wait)
+
+    async def observe(self, headers: Mapping[str, str], reserved: int, used: int | None) -> None:
+        """Выучить лимиты из заголовков ответа и вернуть излишек резерва."""
+        await self._adjust(
+            rpm=_num(headers, "x-ratelimit-limit-requests"),
+            tpm=_num(headers, "x-ratelimit-limit-tokens"),
+            remaining_req=_num(headers, "x-ratelimit-remaining-requests"),
+            remaining_tok=_num(headers, "x-ratelimit-remaining-tokens"),
+            refund=float(reserved - used) if used is not None else 0.0,
+        )
+
+    async def release(self, reserved: int) -> None:
+        """Вызов упал не по 429 — токены не потрачены, возвращаем резерв в ведро."""
+        await self._adjust(rpm=None, tpm=None, remaining_req=None, remaining_tok=None, refund=float(reserved))
+
+    async def penalize(self, headers: Mapping[str, str]) -> float:
+        """
+        Реакция на 429: обнуляем оба ведра (все процессы притормозят разом)
+        и возвращаем рекомендуемую паузу из x-ratelimit-reset-*.
+        """
+        await self._adjust(
+            rpm=_num(headers, "x-ratelimit-limit-requests"),
+            tpm=_num(headers, "x-ratelimit-limit-tokens"),
+            remaining_req=0.0,
+            remaining_tok=0.0,
+            refund=0.0,
+        )
+        resets = [
+            parse_reset(headers.get("x-ratelimit-reset-requests")),
+            parse_reset(headers.get("x-ratelimit-reset-tokens")),
+        ]
+        return max((r for r in resets if r is not None), default=0.0)
+
+
+class PgTokenBucketLimiter(TokenBucketLimiter):
+    """Те же ведра, но в строке rate_limits — общие для всех процессов."""
+
+    def __init__(self, key: str, rpm: float = RPM_DEFAULT, tpm: float = TPM_DEFAULT) -> None:
+        super().__init__(key, rpm, tpm)
+        self._ready = False
+
+    async def _ensure_row(self, c: Any) -> None:
+        if self._ready:
+            return
+        await c.execute(
+            """
+            INSERT INTO rate_limits(key, rpm, tpm, req_level, tok_level)
+            VALUES ($1, $2, $3, $2, $3)
+            ON CONFLICT (key) DO NOTHING
+            """,
+            self.key,
+            self.rpm,
+            self.tpm,
+        )
+        self._ready = True
+
+    async def _reserve(self, tokens: float) -> float:
+        pool = await get_pool()
+        async with pool.acquire() as c:
+            await self._ensure_row(c)
+            row = await c.fetchrow(
+                """
+                WITH s AS (
+                  SELECT key, rpm, tpm,
+                         LEAST(rpm, req_level + rpm / 60 * EXTRACT(EPOCH FROM clock_timestamp() - updated_at)) - 1  AS req,
+                         LEAST(tpm, tok_level + tpm / 60 * EXTRACT(EPOCH FROM clock_timestamp() - updated_at)) - $2 AS tok
+                  FROM rate_limits WHERE key = $1
+                  FOR UPDATE
+                )
+                UPDATE rate_limits r
+                SET req_level = s.req, tok_level = s.tok, updated_at = clock_timestamp()
+                FROM s
+                WHERE r.key = s.key
+                RETURNING s.rpm, s.tpm,
+                          GREATEST(0, -s.req / (s.rpm / 60), -s.tok / (s.tpm / 60)) AS wait
+                """,
+                self.key,
+                tokens,
+            )
+        self.rpm, self.tpm = row["rpm"], row["tpm"]
+        return float(row["wait"])
+
+    async def _adjust(
+        self,
+        *,
+        rpm: float | None,
+        tpm: float | None,
+        remaining_req: float | None,
+        remaining_tok: float | None,
+        refund: float,
+    ) -> None:
+        pool = await get_pool()
+        async with pool.acquire() as c:
+            await self._ensure_row(c)
+            # доливка за паузу и updated_at — тем же UPDATE, иначе следующий
+            # _reserve долил бы поверх remaining-* весь интервал ещё раз
+            await c.execute(
+                """
+                WITH s AS (
+                  SELECT key,
+                         LEAST(rpm, req_level + rpm / 60 * EXTRACT(EPOCH FROM clock_timestamp() - updated_at)) AS req,
+                         LEAST(tpm, tok_level + tpm / 60 * EXTRACT(EPOCH FROM clock_timestamp() - updated_at)) AS tok
+                  FROM rate_limits WHERE key = $1
+                  FOR UPDATE
+                )
+                UPDATE rate_limits r
+                SET rpm        = COALESCE(NULLIF($2, 0), r.rpm),
+                    tpm        = COALESCE(NULLIF($3, 0), r.tpm),
+                    req_level  = LEAST(s.req, COALESCE($4, s.req)),
+                    tok_level  = LEAST(s.tok + $6, COALESCE($5, s.tok + $6)),
+                    updated_at = clock_timestamp()
+                FROM s
+                WHERE r.key = s.key
+                """,
+                self.key,
+                rpm,
+                tpm,
+                remaining_req,
+                remaining_tok,
+                refund,
+            )
+        self.rpm = rpm or self.rpm
+        self.tpm = tpm or self.tpm
+
+
+_limiters: dict[str, TokenBucketLimiter] = {}
+
+
+def get_limiter(model: str) -> TokenBucketLimiter:
+    """Singleton-лимитер на модель (лимиты OpenAI считаются по моделям)."""
+    lim = _limiters.get(model)
+    if lim is None:
+        cls = PgTokenBucketLimiter if SHARED else TokenBucketLimiter
+        lim = _limiters[model] = cls(f"openai:{model}")
+    return lim
@@ -0,0 +1,148 @@
+"""Two-tier cache of GPT responses (in-process LRU + Postgres).
+
+Ключ — sha256 от точного запроса: модель, temperature, max_tokens и
+отрендеренный промпт. Поменяли шаблон или MODEL — поменялся ключ, старые
+записи просто перестают находиться и вымываются по TTL (явная инвалидация
+не нужна).
+
+  • L1 — OrderedDict в памяти процесса: не больше MEM_SIZE записей,
+    каждая живёт MEM_TTL с; hit — микросекунды и ноль токенов;
+  • L2 — таблица response_cache, общая для всех воркеров; hit из L2
+    прогревает L1. Записи старше TTL не читаются и раз в PURGE_EVERY
+    записей удаляются.
+
+RESPONSE_CACHE_TTL=0 выключает кэш целиком; отдельный вызов обходит его
+через cache=False (см. strategy.analyze_project).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from prometheus_client import Counter
+
+from ..storage.pg import get_pool
+
+log = logging.getLogger(__name__)
+
+TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))   # секунд; 0 — выкл.
+MEM_TTL = float(os.getenv("RESPONSE_CACHE_MEM_TTL", "3600"))       # секунд
+MEM_SIZE = int(os.getenv("RESPONSE_CACHE_MEM_SIZE", "4096"))       # записей
+PURGE_EVERY = 500
+
+CACHE_REQUESTS = Counter(
+    "gpt_response_cache_requests_total",
+    "GPT response cache lookups",
+    ["tier", "result"],
+)
+
+_mem: OrderedDict[str, tuple[float, str]] = OrderedDict()   # key → (expires, answer)
+_stores = 0
+
+
+def enabled() -> bool:
+    return TTL > 0
+
+
+def request_key(model: str, prompt: str, *, temperature: float, max_tokens: int) -> str:
+    payload = json.dumps(
+        {"model": model, "temperature": temperature, "max_tokens": max_tokens, "prompt": prompt},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ───────────────── L1 ─────────────────────────────────────────────────────
+def _mem_get(key: str) -> str | None:
+    hit = _mem.get(key)
+    if hit is None:
+        return None
+    expires, answer = hit
+    if expires < time.monotonic():
+        del _mem[key]
+        return None
+    _mem.move_to_end(key)
+    return answer
+
+
+def _mem_put(key: str, answer: str) -> None:
+    _mem[key] = (time.monotonic() + MEM_TTL, answer)
+    _mem.move_to_end(key)
+    while len(_mem) > MEM_SIZE:
+        _mem.popitem(last=False)
+
+
+def clear_memory() -> None:
+    _mem.clear()
+
+
+# ───────────────── L2 ─────────────────────────────────────────────────────
+async def _pg_get(key: str) -> str | None:
+    pool = await get_pool()
+    async with pool.acquire() as c:
+        return await c.fetchval(
+            """
+            SELECT answer FROM response_cache
+            WHERE key = $1 AND created_at > now() - make_interval(secs => $2)
+            """,
+            key,
+            TTL,
+        )
+
+
+async def _pg_put(key: str, model: str, answer: str, tokens: int | None) -> None:
+    global _stores
+    pool = await get_pool()
+    async with pool.acquire() as c:
+        await c.execute(
+            """
+            INSERT INTO response_cache(key, model, answer, tokens)
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT (key) DO UPDATE
+              SET answer = EXCLUDED.answer, tokens = EXCLUDED.tokens, created_at = now()
+            """,
+            key,
+            model,
+            answer,
+            tokens,
+        )
+        _stores += 1
+        if _stores % PURGE_EVERY == 0:
+            await c.execute(
+                "DELETE FROM response_cache WHERE created_at < now() - make_interval(secs => $1)",
+                TTL,
+            )
+
+
+# ───────────────── public API ─────────────────────────────────────────────
+async def get(key: str) -> str | None:
+    answer = _mem_get(key)
+    if answer is not None:
+        CACHE_REQUESTS.labels("memory", "hit").inc()
+        return answer
+    CACHE_REQUESTS.labels("memory", "miss").inc()
+
+    try:
+        answer = await _pg_get(key)
+    except Exception as e:   # кэш не должен ронять оценку
+        log.warning("response cache lookup failed: %s", e)
+        answer = None
+    if answer is None:
+        CACHE_REQUESTS.labels("postgres", "miss").inc()
+        return None
+    CACHE_REQUESTS.labels("postgres", "hit").inc()
+    _mem_put(key, answer)
+    return answer
+
+
+async def put(key: str, model: str, answer: str, tokens: int | None) -> None:
+    _mem_put(key, answer)
+    try:
+        await _pg_put(key, model, answer, tokens)
+    except Exception as e:
+        log.warning("response cache store failed: %s", e)
@@ -0,0 +1,170 @@
+"""Aho–Corasick index over scamlist names.
+
+check_against_scamlist раньше на каждый проект читал scamlist.json и
+проверял `name in project` для каждой записи — O(#scams × len). Теперь:
+
+  • автомат Ахо–Корасик строится один раз по lowercased-именам; поиск
+    всех вхождений — один проход по имени проекта, O(len + совпадения),
+    от размера списка не зависит;
+  • не чаще раза в CHECK_EVERY с делаем os.stat; поменялись mtime/размер —
+    строим новый автомат целиком в фоновом потоке (50k имён — ~1 с) и
+    подменяем одной ссылкой; до тех пор вызывающие получают старый индекс
+    и не ждут (читатели видят либо старый, либо новый, никогда не
+    полупостроенный). Синхронно строится только самый первый индекс;
+  • недописанный/битый файл — предупреждение в лог, продолжаем отдавать
+    прежний индекс, пока файл снова не поменяется.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Iterable
+
+log = logging.getLogger(__name__)
+
+CHECK_EVERY = float(os.getenv("SCAMLIST_CHECK_EVERY", "2"))   # секунд
+
+
+class Automaton:
+    """Словарь паттернов → все (паттерн-id) вхождения в тексте за один проход."""
+
+    __slots__ = ("_goto", "_fail", "_out")
+
+    def __init__(self, patterns: Iterable[tuple[str, int]]) -> None:
+        goto: list[dict[str, int]] = [{}]
+        out: list[list[int]] = [[]]
+        for word, pid in patterns:
+            if not word:
+                continue
+            s = 0
+            for ch in word:
+                nxt = goto[s].get(ch)
+                if nxt is None:
+                    nxt = goto[s][ch] = len(goto)
+                    goto.append({})
+                    out.append([])
+                s = nxt
+            out[s].append(pid)
+
+        # BFS: fail-ссылки; выходы наследуются от fail-состояния
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            s = queue.popleft()
+            for ch, nxt in goto[s].items():
+                queue.append(nxt)
+                f = fail[s]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def find(self, text: str) -> set[int]:
+        goto, fail, out = self._goto, self._fail, self._out
+        found: set[int] = set()
+        s = 0
+        for ch in text:
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            if out[s]:
+                found.update(out[s])
+        return found
+
+
+class _Snapshot:
+    __slots__ = ("entries", "automaton", "mtime_ns", "size", "checked_at")
+
+    def __init__(self, entries: list[dict[str, Any]], mtime_ns: int, size: int) -> None:
+        self.entries = entries
+        self.automaton = Automaton(
+            (str(e.get("name", "")).lower(), i) for i, e in enumerate(entries)
+        )
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.checked_at = time.monotonic()
+
+
+class ScamIndex:
+    """Кэшированный автомат по *path*; перестраивается при смене файла."""
+
+    def __init__(self, path: Path, check_every: float = CHECK_EVERY) -> None:
+        self.path = Path(path)
+        self.check_every = check_every
+        self._snap: _Snapshot | None = None
+        self._failed: tuple[int, int] | None = None    # (mtime, size) битого файла
+        self._rebuild_thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def _stat(self) -> tuple[int, int]:
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return 0, 0
+        return st.st_mtime_ns, st.st_size
+
+    def _build(self, mtime_ns: int, size: int) -> _Snapshot | None:
+        """Новый снапшот; None — файл не читается/не JSON (оставляем прежний)."""
+        try:
+            entries = json.loads(self.path.read_text()).get("scams", [])
+        except FileNotFoundError:
+            entries = []
+        except (OSError, ValueError) as e:   # JSONDecodeError — подкласс ValueError
+            log.warning("scamlist %s unreadable (%s), keeping previous index", self.path, e)
+            return None
+        snap = _Snapshot(entries, mtime_ns, size)
+        log.info("scamlist index built: %d names from %s", len(entries), self.path)
+        return snap
+
+    def _rebuild(self, mtime_ns: int, size: int) -> None:
+        snap = None
+        try:
+            snap = self._build(mtime_ns, size)
+        finally:
+            with self._lock:
+                if snap is None:
+                    self._failed = (mtime_ns, size)
+                else:
+                    self._snap = snap             # атомарная подмена ссылки
+                self._rebuild_thread = None
+
+    def _current(self) -> _Snapshot:
+        snap = self._snap
+        now = time.monotonic()
+        if snap is not None and now - snap.checked_at < self.check_every:
+            return snap
+        with self._lock:
+            snap = self._snap
+            key = self._stat()
+            if snap is None:                      # первый вызов — отдавать нечего
+                self._snap = snap = self._build(*key) or _Snapshot([], *key)
+                return snap
+            snap.checked_at = now
+            if key in ((snap.mtime_ns, snap.size), self._failed) or self._rebuild_thread:
+                return snap
+            self._rebuild_thread = threading.Thread(
+                target=self._rebuild, args=key, name="scamlist-rebuild", daemon=True
+            )
+            self._rebuild_thread.start()
+            return snap
+
+    def join(self, timeout: float | None = None) -> None:
+        """Дождаться идущей фоновой перестройки (тесты, прогрев)."""
+        thread = self._rebuild_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def match(self, project_name: str) -> list[dict[str, Any]]:
+        """Все записи scamlist, чьё имя входит в *project_name* (порядок файла)."""
+        snap = self._current()
+        return [snap.entries[i] for i in sorted(snap.automaton.find(project_name.lower()))]
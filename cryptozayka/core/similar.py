@@ -0,0 +1,122 @@
+"""Near-duplicate project names via pg_trgm.
+
+Скам возвращается под опечатками («LayerZer0», «Layer-Zero Drop») и каждый
+раз оплачивается заново. GIN-индекс gin_trgm_ops по gpt_judgements.project
+отвечает на «project % $1» по индексу и на миллионах строк:
+
+  • find(name) — ранее оценённые проекты с similarity ≥ SIMILAR_THRESHOLD
+    (по убыванию); его же отдаёт GET /project/similar/{name};
+  • wrap(evaluate_fn) — в пайплайне: совпадение ≥ SIMILAR_SHORTCUT с
+    проектом, уже признанным red, — сразу red без GPT; остальные
+    совпадения уходят в промпт полем similar_judged (подделка под
+    известный проект — тоже сигнал).
+
+SIMILAR_LOOKUP=1 включает шаг в пайплайне. Метрика:
+similar_lookups_total{outcome="shortcut"|"context"|"none"|"unavailable"}.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Awaitable, Callable, NamedTuple
+
+import asyncpg
+from prometheus_client import Counter
+
+from .strategy import EvaluationResult, Verdict
+from ..storage.pg import get_pool
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.getenv("SIMILAR_LOOKUP", "0") == "1"
+THRESHOLD = float(os.getenv("SIMILAR_THRESHOLD", "0.5"))
+SHORTCUT = float(os.getenv("SIMILAR_SHORTCUT", "0.8"))
+LIMIT = 5          # соседей в промпт
+
+# pg_trgm не установлен (_INIT_SQL это допускает): нет similarity() / оператора %
+MISSING_TRGM = (asyncpg.UndefinedFunctionError, asyncpg.UndefinedObjectError)
+
+LOOKUPS = Counter("similar_lookups_total", "Trigram near-duplicate lookups", ["outcome"])
+
+Evaluator = Callable[..., Awaitable[EvaluationResult]]
+
+
+class Match(NamedTuple):
+    project: str
+    verdict: str
+    similarity: float
+
+
+async def find(
+    name: str,
+    *,
+    threshold: float = THRESHOLD,
+    limit: int = LIMIT,
+    exclude_self: bool = False,
+) -> list[Match]:
+    """Оценённые проекты, похожие на *name*, — самые похожие первыми."""
+    pool = await get_pool()
+    async with pool.acquire() as c:
+        async with c.transaction():
+            # порог оператора % — GUC; set_config(…, true) живёт до конца транзакции
+            await c.execute(
+                "SELECT set_config('pg_trgm.similarity_threshold', $1, true)", str(threshold)
+            )
+            rows = await c.fetch(
+                """
+                SELECT project, verdict, similarity(project, $1) AS sim
+                FROM gpt_judgements
+                WHERE project % $1 AND ($3::bool IS FALSE OR project <> $1)
+                ORDER BY sim DESC, project
+                LIMIT $2
+                """,
+                name,
+                limit,
+                exclude_self,
+            )
+    return [Match(r["project"], r["verdict"], round(float(r["sim"]), 3)) for r in rows]
+
+
+def as_context(matches: list[Match]) -> list[dict[str, Any]]:
+    return [m._asdict() for m in matches]
+
+
+def wrap(evaluate_fn: Evaluator, *, with_context: bool = True) -> Evaluator:
+    """
+    Evaluator с поиском похожих имён перед *evaluate_fn*. with_context —
+    evaluate_fn принимает similar=… (analyze_project; packed — нет).
+    """
+
+    async def looked_up(name: str, description: str, **kwargs: Any) -> EvaluationResult:
+        try:
+            matches = await find(name, exclude_self=True)
+        except Exception as e:   # нет pg_trgm / БД — оцениваем как раньше
+            log.warning("similar lookup for %r failed: %s", name, e)
+            LOOKUPS.labels("unavailable").inc()
+            return await evaluate_fn(name, description, **kwargs)
+
+        scam = next(
+            (m for m in matches if m.similarity >= SHORTCUT and m.verdict == Verdict.RED.value),
+            None,
+        )
+        if scam is not None:
+            LOOKUPS.labels("shortcut").inc()
+            log.info("🔁 %s → red: near-duplicate of %r (%.2f)", name, scam.project, scam.similarity)
+            return EvaluationResult(
+                project=name,
+                verdict=Verdict.RED,
+                explanation=f"Near-duplicate of a known scam {scam.project!r} (similarity {scam.similarity:.2f})",
+                raw_model_answer="",
+                model="pg_trgm",
+                tokens=0,
+                gpt=False,
+            )
+        if not matches:
+            LOOKUPS.labels("none").inc()
+            return await evaluate_fn(name, description, **kwargs)
+        LOOKUPS.labels("context").inc()
+        if with_context:
+            kwargs["similar"] = as_context(matches)
+        return await evaluate_fn(name, description, **kwargs)
+
+    return looked_up
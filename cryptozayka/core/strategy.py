@@ -2,24 +2,29 @@
 from __future__ import annotations
 
 import asyncio
+import functools
 import json
 import logging
 import os
+import time
+from contextvars import ContextVar
 from dataclasses import dataclass
 from enum import Enum
-from pathlib import Path
-from typing import Any
+from typing import Any, Awaitable, Callable
 
 # ---------------------------------------------------------------------------
 # OpenAI import — совместим со всеми версиями SDK
 # ---------------------------------------------------------------------------
 try:  # OpenAI ≥ 1.0
-    from openai import AsyncOpenAI, OpenAIError                # type: ignore
+    from openai import OpenAIError, RateLimitError              # type: ignore
 except ImportError:  # OpenAI < 1.0
-    from openai import AsyncOpenAI                              # type: ignore
-    from openai.error import OpenAIError                        # type: ignore
+    from openai.error import OpenAIError, RateLimitError        # type: ignore
 
 from ..settings import get_settings
+from . import compress, hedge, llm_gateway, prompts, response_cache, streaming
+from .gpt_client import _count
+from .json_extract import extract_json
+from .ratelimit import get_limiter
 
 # ---------------------------------------------------------------------------
 # Config & constants
@@ -30,16 +35,34 @@ log = logging.getLogger(__name__)
 
 MODEL = "gpt-4-0125-preview"
 
-_prompts_dir = os.getenv("PROMPTS_DIR")
-if _prompts_dir:
-    PROMPT_FILE = Path(_prompts_dir) / "project_eval.md"
-else:
-    PROMPT_FILE = Path(__file__).resolve().parents[2] / "prompts" / "project_eval.md"
+PROMPT_TEMPLATE = os.getenv("PROMPT_TEMPLATE", "project_eval")   # имя файла в PROMPTS_DIR
+PROMPT_FILE = prompts.registry.path(PROMPT_TEMPLATE)
 
-MAX_DESC_LEN = 512        # ограничиваем описание → меньше токенов
+MAX_DESC_TOKENS = int(os.getenv("STRATEGY_DESC_TOKENS", "128"))   # бюджет описания (см. compress.py)
+MAX_TOKENS = 300          # лимит ответа; входит в оценку для rate limiter'а
+TEMPERATURE = 0.2
 RETRY_ATTEMPTS = 3
 RETRY_DELAY = 2           # секунд, увеличивается экспоненциально
 
+# JSON mode провайдера: модель обязана вернуть JSON-объект (packed-ответ
+# поэтому {"results": [...]}); 0 — полагаемся только на extract_json
+JSON_MODE = os.getenv("STRATEGY_JSON_MODE", "1") == "1"
+RESPONSE_FORMAT = {"type": "json_object"}
+
+# packed-режим: K проектов в одном запросе (1 — выкл.; нужен BATCH_CONCURRENCY ≥ K)
+PACK_SIZE = int(os.getenv("STRATEGY_PACK_SIZE", "1"))
+PACK_TOKEN_BUDGET = int(os.getenv("STRATEGY_PACK_TOKENS", "2500"))   # токенов на проекты пачки
+PACK_WAIT = float(os.getenv("STRATEGY_PACK_WAIT", "0.05"))           # секунд ждём добора пачки
+PACK_ANSWER_TOKENS = 120  # лимит ответа на один проект пачки
+PACK_TEMPLATE = os.getenv("PACK_TEMPLATE", "project_eval_packed")
+
+# streaming: вердикт публикуется, как только пришёл (batch'и до STREAM_MAX_BATCH
+# проектов, т.е. одиночные интерактивные); EXPLANATION_CHARS > 0 — обрываем
+# стрим, когда explanation набрал столько символов
+STREAM = os.getenv("STRATEGY_STREAM", "0") == "1"
+STREAM_MAX_BATCH = int(os.getenv("STRATEGY_STREAM_MAX_BATCH", "1"))
+STREAM_EXPLANATION_CHARS = int(os.getenv("STRATEGY_STREAM_EXPLANATION_CHARS", "0"))
+
 # ---------------------------------------------------------------------------
 # Data types
 # ---------------------------------------------------------------------------
@@ -58,6 +81,16 @@ class EvaluationResult:
     raw_model_answer: str
     model: str = MODEL
     tokens: int | None = None     # usage.total_tokens
+    gpt: bool = True              # вердикт OpenAI-модели (сейчас или из кэша), не локальный шорткат
+    truncated: bool = False       # стрим оборван по STREAM_EXPLANATION_CHARS — ответ неполный
+    calls: int | None = None      # OpenAI-запросов на счету результата; None — 1, если tokens
+
+OnVerdict = Callable[[Verdict], Awaitable[None]]
+
+# какая модель ответила на последний _call_gpt в этой задаче (hedge мог уйти в fallback)
+_ANSWERED_BY: ContextVar[str] = ContextVar("answered_by", default=MODEL)
+# стрим последнего _call_gpt оборван по STREAM_EXPLANATION_CHARS — ответ неполный
+_TRUNCATED: ContextVar[bool] = ContextVar("truncated", default=False)
 
 # ───── legacy alias, чтобы старый код (api.py, executor.py) не падал ────────
 class AnalysisResult(EvaluationResult):   # noqa: N801
@@ -69,56 +102,257 @@ class AnalysisResult(EvaluationResult):   # noqa: N801
 # GPT helper
 # ---------------------------------------------------------------------------
 
-client = AsyncOpenAI(api_key=settings.openai_api_key)
+client = llm_gateway.openai_client()   # общий пул соединений процесса
+
+# поле контекста → пояснение к нему (prompts/note_<поле>.md); в промпт идёт
+# только при наличии поля — иначе ~70 лишних токенов на каждый запрос
+_CONTEXT_FIELDS = ("similar_judged", "nearest_judged")
+
+def _context_notes(project: dict[str, Any]) -> str:
+    notes = [prompts.registry.render(f"note_{f}") for f in _CONTEXT_FIELDS if f in project]
+    return "\n" + "".join(notes) if notes else ""
+
+def _build_prompt(project: dict[str, Any], template: str = PROMPT_TEMPLATE) -> str:
+    """Рендер скомпилированного шаблона (см. prompts.py) — без I/O на каждый проект."""
+    pj = json.dumps(project, ensure_ascii=False, indent=2)
+    return prompts.registry.render(template, project_json=pj, context_notes=_context_notes(project))
+
+def _project_json(
+    name: str,
+    description: str,
+    similar: list[dict[str, Any]] | None = None,
+    neighbours: list[dict[str, Any]] | None = None,
+) -> dict[str, Any]:
+    short = compress.compress(description or "", MAX_DESC_TOKENS, MODEL)
+    project: dict[str, Any] = {"name": name, "description": short.text}
+    if similar:
+        project["similar_judged"] = similar   # похожие по имени, см. similar.py
+    if neighbours:
+        project["nearest_judged"] = neighbours   # похожие по смыслу, см. embeddings.py
+    return project
+
+def _prepare_prompt(
+    name: str,
+    description: str,
+    similar: list[dict[str, Any]] | None = None,
+    neighbours: list[dict[str, Any]] | None = None,
+) -> str:
+    """Сжатие описания + рендер шаблона — общий путь для sync и Batch API."""
+    return _build_prompt(_project_json(name, description, similar, neighbours))
+
+def _format_kwargs() -> dict[str, Any]:
+    """response_format для chat.completions (и тела Batch API)."""
+    return {"response_format": RESPONSE_FORMAT} if JSON_MODE else {}
+
+def _parse_answer(answer: str, *, record: bool = True) -> tuple[Verdict, str]:
+    """
+    JSON-ответ модели → (verdict, explanation); ValueError, если формат чужой.
+    Ответ в ```-блоке или с прозой вокруг разбирается без повторного вызова.
+    record=False — проверка без учёта в gpt_answer_parse_total.
+    """
+    parsed = extract_json(answer, record=record)
+
+    verdict_raw = parsed.get("verdict", "").lower()
+    explanation = parsed.get("explanation", "").strip()
+
+    if verdict_raw not in {v.value for v in Verdict}:
+        raise ValueError(f"Unexpected verdict '{verdict_raw}'")
+
+    return Verdict(verdict_raw), explanation
 
-def _build_prompt(project: dict[str, Any]) -> str:
-    if not PROMPT_FILE.exists():
-        raise FileNotFoundError(f"Prompt file not found: {PROMPT_FILE}")
-    tpl = PROMPT_FILE.read_text(encoding="utf-8")
-    pj  = json.dumps(project, ensure_ascii=False, indent=2)
-    return tpl.replace("{{ project_json }}", pj)
+async def _call_gpt(
+    prompt: str,
+    *,
+    cache: bool = True,
+    max_tokens: int = MAX_TOKENS,
+    validate: Callable[[str], Any] = functools.partial(_parse_answer, record=False),
+    on_verdict: OnVerdict | None = None,
+) -> tuple[str, int | None]:
+    """
+    GPT-ответ на *prompt* через двухуровневый кэш (см. response_cache.py):
+    hit — ноль токенов; кэшируем только ответы, которые проходят *validate*
+    (проверка не пишет метрику разбора — её считает вызывающий, один раз).
+    cache=False — всегда идём в OpenAI и кэш не трогаем.
+    on_verdict — стриминговый вызов, вердикт отдаётся до конца ответа.
+    GPT_HEDGE=1 — нестриминговый вызов хеджируется fallback-моделью (hedge.py);
+    ответы fallback не кэшируются: ключ посчитан для MODEL; оборванные
+    стримы тоже — обрезанный explanation не должен переживать запрос.
+    """
+    _ANSWERED_BY.set(MODEL)
+    _TRUNCATED.set(False)
+    if on_verdict is not None:
+        fetch = functools.partial(_call_openai, on_verdict=on_verdict)
+    elif hedge.ENABLED:
+        fetch = functools.partial(_call_hedged, validate=validate)
+    else:
+        fetch = _call_openai
+    if not (cache and response_cache.enabled()):
+        return await fetch(prompt, max_tokens)
 
-async def _call_gpt(prompt: str) -> tuple[str, int | None]:
-    """Асинхронный вызов GPT-4 с экспоненциальным бэкоффом."""
+    key = response_cache.request_key(MODEL, prompt, temperature=TEMPERATURE, max_tokens=max_tokens)
+    answer = await response_cache.get(key)
+    if answer is not None:
+        return answer, 0
+
+    answer, tokens = await fetch(prompt, max_tokens)
+    if _ANSWERED_BY.get() != MODEL or _TRUNCATED.get():
+        return answer, tokens
+    try:
+        validate(answer)
+    except Exception:
+        return answer, tokens           # битый ответ не кэшируем
+    await response_cache.put(key, MODEL, answer, tokens)
+    return answer, tokens
+
+async def _call_hedged(
+    prompt: str,
+    max_tokens: int,
+    *,
+    validate: Callable[[str], Any],
+) -> tuple[str, int | None]:
+    """MODEL, а если он медленнее p95 — гонка с fallback-моделью."""
+    answer, tokens, model = await hedge.hedger.race(
+        lambda m: _call_openai(prompt, max_tokens, model=m),
+        MODEL,
+        hedge.fallback_model(),
+        validate,
+    )
+    _ANSWERED_BY.set(model)
+    return answer, tokens
+
+async def _call_openai(
+    prompt: str,
+    max_tokens: int = MAX_TOKENS,
+    on_verdict: OnVerdict | None = None,
+    model: str | None = None,
+) -> tuple[str, int | None]:
+    """
+    Асинхронный вызов GPT-4 с экспоненциальным бэкоффом.
+    Перед каждой попыткой ждём RPM/TPM-лимитер (см. ratelimit.py),
+    после ответа — кормим его заголовками x-ratelimit-*.
+    model — другая модель (fallback хеджа), по умолчанию MODEL.
+    """
+    model = model or MODEL
+    limiter = get_limiter(model)
+    estimate = _count(prompt, model) + max_tokens
     delay = RETRY_DELAY
     for attempt in range(1, RETRY_ATTEMPTS + 1):
+        await limiter.acquire(estimate)
         try:
-            resp = await client.chat.completions.create(
-                model=MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
-                max_tokens=300,
-            )
-            return resp.choices[0].message.content, getattr(resp.usage, "total_tokens", None)
+            async with llm_gateway.observe("openai", model) as call:
+                if on_verdict is not None:
+                    answer, call.tokens = await _stream_once(prompt, max_tokens, limiter, estimate, on_verdict)
+                else:
+                    raw = await client.chat.completions.with_raw_response.create(
+                        model=model,
+                        messages=[{"role": "user", "content": prompt}],
+                        temperature=TEMPERATURE,
+                        max_tokens=max_tokens,
+                        **_format_kwargs(),
+                    )
+                    resp = raw.parse()
+                    call.tokens = getattr(resp.usage, "total_tokens", None)
+                    await limiter.observe(raw.headers, estimate, call.tokens)
+                    answer = resp.choices[0].message.content
+            return answer, call.tokens
+        except RateLimitError as e:
+            pause = await limiter.penalize(e.response.headers)
+            log.warning("GPT rate-limited (%d/%d), reset in %.1fs", attempt, RETRY_ATTEMPTS, pause)
+            if attempt == RETRY_ATTEMPTS:
+                raise
+            await asyncio.sleep(max(delay, pause))
+            delay *= 2
         except OpenAIError as e:
             log.warning("GPT call failed (%d/%d): %s", attempt, RETRY_ATTEMPTS, e)
+            await limiter.release(estimate)
             if attempt == RETRY_ATTEMPTS:
                 raise
             await asyncio.sleep(delay)
             delay *= 2
 
+async def _stream_once(
+    prompt: str,
+    max_tokens: int,
+    limiter: Any,
+    estimate: int,
+    on_verdict: OnVerdict,
+) -> tuple[str, int | None]:
+    """Одна стриминговая попытка: JSON разбирается по мере прихода чанков."""
+    started = time.perf_counter()
+    raw = await client.chat.completions.with_raw_response.create(
+        model=MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=TEMPERATURE,
+        max_tokens=max_tokens,
+        stream=True,
+        stream_options={"include_usage": True},
+        **_format_kwargs(),
+    )
+    stream = raw.parse()
+    acc = streaming.IncrementalAnswer()
+    tokens = None
+    try:
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                tokens = chunk.usage.total_tokens
+            if not chunk.choices:
+                continue
+            if acc.feed(chunk.choices[0].delta.content or "") is not None:
+                streaming.TIME_TO_VERDICT.observe(time.perf_counter() - started)
+                try:
+                    await on_verdict(Verdict(acc.verdict))
+                except Exception as e:  # публикация не должна рвать стрим
+                    log.warning("early verdict publish failed: %s", e)
+            if (
+                STREAM_EXPLANATION_CHARS
+                and acc.verdict is not None
+                and len(acc.explanation()[0]) >= STREAM_EXPLANATION_CHARS
+            ):
+                streaming.STREAM_CANCELLED.inc()
+                _TRUNCATED.set(True)
+                break
+    finally:
+        await stream.close()
+    streaming.TIME_TO_COMPLETE.observe(time.perf_counter() - started)
+
+    if tokens is None:  # оборвали стрим до usage-чанка — считаем сами
+        tokens = _count(prompt, MODEL) + _count(acc.text, MODEL)
+    await limiter.observe(raw.headers, estimate, tokens)
+    return acc.answer(), tokens
+
 # ---------------------------------------------------------------------------
 # Public API
 # ---------------------------------------------------------------------------
 
-async def analyze_project(name: str, description: str) -> EvaluationResult:
-    """Главная точка входа для воркера. Совместима с прежним кодом."""
-    description = (description or "")[:MAX_DESC_LEN]
-    project = {"name": name, "description": description}
-
-    prompt = _build_prompt(project)
+async def analyze_project(
+    name: str,
+    description: str,
+    *,
+    cache: bool = True,
+    on_verdict: OnVerdict | None = None,
+    similar: list[dict[str, Any]] | None = None,
+    neighbours: list[dict[str, Any]] | None = None,
+) -> EvaluationResult:
+    """
+    Главная точка входа для воркера. Совместима с прежним кодом.
+    cache=False — обойти кэш ответов (переоценка «с нуля»);
+    on_verdict — стриминг, колбэк получает вердикт до конца ответа;
+    similar / neighbours — ранее оценённые проекты с похожим именем /
+    описанием (контекст в промпт).
+    truncated=True в результате — ответ оборван; его не кэшируют и не
+    сохраняют как GPT-вердикт (dedup, gpt_judgements).
+    """
+    prompt = _prepare_prompt(name, description, similar, neighbours)
+    opts: dict[str, Any] = {}
+    if not cache:
+        opts["cache"] = False
+    if on_verdict is not None:
+        opts["on_verdict"] = on_verdict
 
     try:
-        answer, tokens = await _call_gpt(prompt)
-        parsed = json.loads(answer)
-
-        verdict_raw = parsed.get("verdict", "").lower()
-        explanation = parsed.get("explanation", "").strip()
-
-        if verdict_raw not in {v.value for v in Verdict}:
-            raise ValueError(f"Unexpected verdict '{verdict_raw}'")
-
-        verdict = Verdict(verdict_raw)
+        answer, tokens = await _call_gpt(prompt, **opts)
+        model = _ANSWERED_BY.get()
+        verdict, explanation = _parse_answer(answer)
 
     except Exception as exc:
         log.exception("❌ GPT evaluation failed: %s", exc)
@@ -126,15 +360,204 @@ async def analyze_project(name: str, description: str) -> EvaluationResult:
         explanation = f"Evaluation error: {exc}"
         answer = str(exc)
         tokens = None
+        model = MODEL
 
     result = EvaluationResult(
         project=name,
         verdict=verdict,
         explanation=explanation,
         raw_model_answer=answer,
+        model=model,
         tokens=tokens,
+        truncated=_TRUNCATED.get(),
     )
     if tokens:
         log.info("📝 %s → %s (%s tokens)", name, verdict.value, tokens)
 
     return result
+
+
+# ---------------------------------------------------------------------------
+# Packed mode: K проектов в одном запросе
+# ---------------------------------------------------------------------------
+
+def _build_packed_prompt(items: list[dict[str, Any]]) -> str:
+    pj = json.dumps(items, ensure_ascii=False, indent=2)
+    return prompts.registry.render(PACK_TEMPLATE, projects_json=pj)
+
+def _parse_packed(
+    answer: str,
+    ids: list[str],
+    *,
+    strict: bool = False,
+    record: bool = True,
+) -> dict[str, tuple[Verdict, str, str]]:
+    """
+    Ответ {"results": [...]} (или голый массив) → {id: (verdict, explanation,
+    raw_item)}. Чужие id и элементы без валидного вердикта пропускаются;
+    ValueError — если годных нет вовсе (strict — если не хватает хоть одного).
+    """
+    parsed = extract_json(answer, dict, list, record=record)
+    if isinstance(parsed, dict):
+        parsed = parsed.get("results")
+    if not isinstance(parsed, list):
+        raise ValueError("packed answer has no results array")
+
+    allowed = {Verdict.GREEN.value, Verdict.YELLOW.value, Verdict.RED.value}
+    out: dict[str, tuple[Verdict, str, str]] = {}
+    for item in parsed:
+        if not isinstance(item, dict):
+            continue
+        pid = str(item.get("id", ""))
+        verdict_raw = str(item.get("verdict", "")).lower()
+        if pid in ids and verdict_raw in allowed:
+            explanation = str(item.get("explanation", "")).strip()
+            out[pid] = (Verdict(verdict_raw), explanation, json.dumps(item, ensure_ascii=False))
+
+    if not out or (strict and len(out) < len(ids)):
+        raise ValueError(f"packed answer covers {len(out)}/{len(ids)} projects")
+    return out
+
+def _charge(results: list[EvaluationResult], tokens: int | None) -> None:
+    """
+    Один запрос пачки → результатам: токены поровну (остаток — первым),
+    сам вызов — первому (stats.gpt_calls считает запросы, а не проекты).
+    tokens=0 — ответ из кэша, вызова не было.
+    """
+    if not tokens or not results:
+        return
+    share, extra = divmod(tokens, len(results))
+    for i, res in enumerate(results):
+        res.tokens = (res.tokens or 0) + share + int(i < extra)
+    results[0].calls = (results[0].calls or 0) + 1
+
+async def analyze_pack(projects: list[tuple[str, str]]) -> list[EvaluationResult]:
+    """
+    Оценить [(name, description), …] одним запросом. Битый ответ — пачка
+    делится пополам и каждая половина повторяется; проекты, пропущенные
+    моделью, переоцениваются отдельной пачкой. Порядок результатов = порядок входа.
+    У результатов явный calls: запрос пачки (и битые запросы до деления) —
+    один вызов, его токены разнесены по проектам.
+    """
+    if len(projects) == 1:
+        res = await analyze_project(*projects[0])
+        res.calls = int(bool(res.tokens))
+        return [res]
+
+    items = [{"id": str(i), **_project_json(n, d)} for i, (n, d) in enumerate(projects)]
+    ids = [it["id"] for it in items]
+    try:
+        answer, tokens = await _call_gpt(
+            _build_packed_prompt(items),
+            max_tokens=PACK_ANSWER_TOKENS * len(items),
+            validate=lambda a: _parse_packed(a, ids, strict=True, record=False),
+        )
+        model = _ANSWERED_BY.get()
+    except Exception as exc:
+        log.exception("❌ packed GPT evaluation failed: %s", exc)
+        return [
+            EvaluationResult(
+                project=name,
+                verdict=Verdict.ERROR,
+                explanation=f"Evaluation error: {exc}",
+                raw_model_answer=str(exc),
+                calls=0,
+            )
+            for name, _ in projects
+        ]
+
+    try:
+        parsed = _parse_packed(answer, ids)
+    except (ValueError, TypeError) as exc:
+        mid = len(projects) // 2
+        log.warning("malformed packed answer for %d projects (%s), splitting", len(projects), exc)
+        left, right = await asyncio.gather(analyze_pack(projects[:mid]), analyze_pack(projects[mid:]))
+        _charge(left + right, tokens)        # битый запрос тоже оплачен
+        return left + right
+
+    missing = [i for i in range(len(projects)) if str(i) not in parsed]
+    retried = iter(await analyze_pack([projects[i] for i in missing]) if missing else ())
+
+    results, answered = [], []
+    for i, (name, _) in enumerate(projects):
+        if str(i) not in parsed:
+            results.append(next(retried))
+            continue
+        verdict, explanation, raw = parsed[str(i)]
+        res = EvaluationResult(
+            project=name,
+            verdict=verdict,
+            explanation=explanation,
+            raw_model_answer=raw,
+            model=model,
+            tokens=0,
+            calls=0,
+        )
+        results.append(res)
+        answered.append(res)
+    _charge(answered, tokens)
+    log.info("📦 %d projects in one request (%s tokens)", len(parsed), tokens)
+    return results
+
+class _Packer:
+    """
+    Склеивает одиночные вызовы analyze_project_packed в пачки: отправляем,
+    когда набралось PACK_SIZE проектов, следующий не влезает в
+    PACK_TOKEN_BUDGET или прошло PACK_WAIT с с первого в пачке.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self._items: list[tuple[str, str, asyncio.Future[EvaluationResult]]] = []
+        self._tokens = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def submit(self, name: str, description: str) -> EvaluationResult:
+        cost = _count(json.dumps(_project_json(name, description), ensure_ascii=False), MODEL)
+        if self._items and self._tokens + cost > PACK_TOKEN_BUDGET:
+            self._flush()
+
+        fut: asyncio.Future[EvaluationResult] = self.loop.create_future()
+        self._items.append((name, description, fut))
+        self._tokens += cost
+        if len(self._items) >= PACK_SIZE:
+            self._flush()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(PACK_WAIT, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._items, self._tokens = self._items, [], 0
+        if items:
+            task = self.loop.create_task(self._run(items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, items: list[tuple[str, str, asyncio.Future[EvaluationResult]]]) -> None:
+        try:
+            results = await analyze_pack([(name, descr) for name, descr, _ in items])
+            for (*_, fut), res in zip(items, results, strict=True):
+                if not fut.done():      # ждущий мог быть отменён
+                    fut.set_result(res)
+        except Exception as exc:
+            for *_, fut in items:
+                if not fut.done():
+                    fut.set_exception(exc)
+        except BaseException:
+            for *_, fut in items:
+                fut.cancel()
+            raise
+
+_packer: _Packer | None = None
+
+async def analyze_project_packed(name: str, description: str) -> EvaluationResult:
+    """Как analyze_project, но проект уезжает в OpenAI в пачке с соседями."""
+    global _packer
+    loop = asyncio.get_running_loop()
+    if _packer is None or _packer.loop is not loop:
+        _packer = _Packer(loop)
+    return await _packer.submit(name, description)
@@ -0,0 +1,98 @@
+"""Incremental parsing of streamed GPT answers.
+
+Ответ модели — {"verdict": "...", "explanation": "..."}, и вердикт
+приходит в первых токенах. IncrementalAnswer принимает чанки стрима и
+  • как только в буфере появился "verdict": "<green|yellow|red>" —
+    отдаёт его (strategy публикует вердикт исполнителю сразу);
+  • следит за длиной уже пришедшего explanation, чтобы стрим можно было
+    оборвать по STRATEGY_STREAM_EXPLANATION_CHARS;
+  • answer() — полный JSON, если стрим дошёл до конца, иначе собранный
+    заново из вердикта и обрезанного explanation.
+
+Метрики: gpt_time_to_verdict_seconds vs gpt_time_to_complete_seconds,
+gpt_stream_cancelled_total.
+"""
+from __future__ import annotations
+
+import json
+import re
+
+from prometheus_client import Counter, Histogram
+
+TIME_TO_VERDICT = Histogram(
+    "gpt_time_to_verdict_seconds",
+    "Time from request start until the verdict was parsed from the stream",
+)
+TIME_TO_COMPLETE = Histogram(
+    "gpt_time_to_complete_seconds",
+    "Time from request start until the stream finished or was cancelled",
+)
+STREAM_CANCELLED = Counter(
+    "gpt_stream_cancelled_total",
+    "Streams cut off once the explanation reached the configured length",
+)
+
+_VERDICT_RE = re.compile(r'"verdict"\s*:\s*"(green|yellow|red)"', re.IGNORECASE)
+_EXPLANATION_RE = re.compile(r'"explanation"\s*:\s*"')
+
+
+def _json_string_prefix(raw: str) -> tuple[str, bool]:
+    """
+    Раскодировать начало JSON-строки (без открывающей кавычки).
+    Возвращает (текст, закрыта_ли_строка); оборванный escape в хвосте
+    отбрасывается.
+    """
+    i = 0
+    while i < len(raw):
+        ch = raw[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == '"':
+            return json.loads('"' + raw[:i] + '"'), True
+        i += 1
+    body = raw if i == len(raw) else raw[:-1]   # i перескочил конец — оборванный escape
+    try:
+        return json.loads('"' + body + '"'), False
+    except json.JSONDecodeError:                # оборванный \uXXXX
+        return json.loads('"' + body[: body.rfind("\\")] + '"'), False
+
+
+class IncrementalAnswer:
+    def __init__(self) -> None:
+        self.text = ""
+        self.verdict: str | None = None
+        self._expl_at: int | None = None
+
+    def feed(self, chunk: str) -> str | None:
+        """Добавить чанк; вернуть вердикт, если он появился именно сейчас."""
+        # ищем с небольшим перекрытием: ключ мог разрезаться между чанками
+        start = max(0, len(self.text) - 32)
+        self.text += chunk
+        if self._expl_at is None:
+            m = _EXPLANATION_RE.search(self.text, start)
+            if m:
+                self._expl_at = m.end()
+        if self.verdict is None:
+            m = _VERDICT_RE.search(self.text, start)
+            if m:
+                self.verdict = m.group(1).lower()
+                return self.verdict
+        return None
+
+    def explanation(self) -> tuple[str, bool]:
+        if self._expl_at is None:
+            return "", False
+        return _json_string_prefix(self.text[self._expl_at:])
+
+    def answer(self) -> str:
+        """Полный ответ модели либо JSON из уже разобранных полей."""
+        try:
+            json.loads(self.text)
+            return self.text
+        except json.JSONDecodeError:
+            pass
+        if self.verdict is None:
+            return self.text
+        explanation, _ = self.explanation()
+        return json.dumps({"verdict": self.verdict, "explanation": explanation}, ensure_ascii=False)
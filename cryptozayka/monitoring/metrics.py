@@ -1,5 +1,5 @@
-from __future__ import annotations
 """Prometheus exporter + OpenTelemetry tracing (ready file)."""
+from __future__ import annotations
 
 import asyncio
 import logging
@@ -10,6 +10,7 @@ from prometheus_client import generate_latest, CONTENT_TYPE_LATEST, Histogram, G
 
 from ..otel import init_otel
 from ..storage_pg import get_pool
+from ..core.budget import ledger
 from ..core.gpt_client import _load_usage
 
 # Init tracing
@@ -33,6 +34,10 @@ async def _latency_middleware(request: Request, call_next):
 @app.on_event("startup")
 async def _startup():
     asyncio.create_task(_queue_loop())
+    try:
+        await ledger.refresh()
+    except Exception as e:  # БД ещё не поднялась — покажем снапшот
+        log.warning("token ledger refresh failed: %s", e)
     GPT_SPENT.set(_load_usage().get("tokens_used", 0))
 
 
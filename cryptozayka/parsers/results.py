@@ -1,35 +1,23 @@
-"""Batch results parser – converts OpenAI `.jsonl` dumps into DB entries."""
+"""Batch results parser – converts OpenAI `.jsonl` dumps into DB entries.
+
+Понимает и формат OpenAI Batch API
+    {"custom_id": …, "response": {"status_code": 200, "body": {chat.completion}}, "error": null}
+и старые дампы ({"project"/"id", "response": {"choices": …}} или {"content": …}).
+Файлы читаются построчно (iter_replies), без загрузки целиком в память.
+"""
 from __future__ import annotations
 
 import json
 import logging
-from datetime import datetime
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Iterator
 
 from ..storage import get_db
-from ..core.strategy import _interpret  # reuse scam/recommend detector
+from ..core.strategy import _parse_answer, Verdict
 
 log = logging.getLogger(__name__)
 
-
-def _ensure_table() -> None:
-    """Create `gpt_judgements` table if it doesn't exist."""
-    create_sql = """        CREATE TABLE IF NOT EXISTS gpt_judgements(
-        project  TEXT PRIMARY KEY,
-        verdict  TEXT NOT NULL,
-        text     TEXT NOT NULL,
-        ts       TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );"""
-    # Run sync via connection helper
-    import asyncio
-    asyncio.run(_run_sql(create_sql))
-
-
-async def _run_sql(sql: str) -> None:
-    async with get_db() as db:
-        await db.executescript(sql)
-        await db.commit()
+_CHUNK = 500   # строк на один executemany
 
 
 def _extract_project(entry: dict) -> tuple[str, str]:
@@ -40,60 +28,88 @@ def _extract_project(entry: dict) -> tuple[str, str]:
         entry.get("id") or
         "unknown"
     )
+    response = entry.get("response") or {}
+    body = response.get("body") or response      # Batch API кладёт ответ в body
     reply = (
-        entry.get("response", {})
-        .get("choices", [{}])[0]
+        (body.get("choices") or [{}])[0]
         .get("message", {})
         .get("content", "")
-        .strip()
-    )
+        or ""
+    ).strip()
     if not reply and "content" in entry:
         reply = entry["content"]
     return str(project), reply
 
 
-async def _store(project: str, verdict: str, text: str) -> None:
-    async with get_db() as db:
-        await db.execute(
-            """INSERT OR REPLACE INTO gpt_judgements(project, verdict, text, ts)
-                   VALUES (?, ?, ?, ?);""",
-            (project, verdict, text, datetime.utcnow().isoformat()),
-        )
-        await db.commit()
-
+def _extract_tokens(entry: dict) -> int | None:
+    response = entry.get("response") or {}
+    body = response.get("body") or response
+    return (body.get("usage") or {}).get("total_tokens")
 
-async def parse_file(path: Path) -> int:
-    """Parse single `.jsonl` file and persist judgements. Returns count."""
-    if path.suffix != ".jsonl":
-        raise ValueError("expected .jsonl file")
-    lines = path.read_text(encoding="utf-8").splitlines()
 
-    imported = 0
+def iter_replies(lines: Iterable[str], source: str = "<stream>") -> Iterator[tuple[str, str, int | None]]:
+    """Поток (project|custom_id, reply, total_tokens) из строк `.jsonl`."""
     for line in lines:
         if not line.strip():
             continue
         try:
             entry = json.loads(line)
         except json.JSONDecodeError as e:
-            log.warning("skip bad json (%s): %s", path.name, e)
+            log.warning("skip bad json (%s): %s", source, e)
             continue
 
         project, reply = _extract_project(entry)
         if not reply:
-            log.warning("skip empty reply for %s in %s", project, path.name)
+            log.warning("skip empty reply for %s in %s (%s)", project, source, entry.get("error"))
             continue
+        yield project, reply, _extract_tokens(entry)
+
+
+def _verdict(reply: str) -> Verdict:
+    try:
+        return _parse_answer(reply)[0]
+    except Exception:
+        return Verdict.ERROR
+
+
+async def _store(rows: list[tuple[str, str, str]]) -> None:
+    pool = await get_db()
+    async with pool.acquire() as conn:
+        await conn.executemany(
+            """
+            INSERT INTO gpt_judgements(project, verdict, text)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (project) DO UPDATE
+              SET verdict = EXCLUDED.verdict,
+                  text    = EXCLUDED.text
+            """,
+            rows,
+        )
+
+
+async def parse_file(path: Path) -> int:
+    """Parse single `.jsonl` file and persist judgements. Returns count."""
+    if path.suffix != ".jsonl":
+        raise ValueError("expected .jsonl file")
 
-        is_scam, recommend = _interpret(reply)
-        verdict = "🚫 scam" if is_scam else ("✅ participate" if recommend else "⚠️ skip")
-        await _store(project, verdict, reply)
-        imported += 1
+    imported = 0
+    rows: list[tuple[str, str, str]] = []
+    with path.open(encoding="utf-8") as fh:
+        for project, reply, _ in iter_replies(fh, path.name):
+            rows.append((project, _verdict(reply).value, reply))
+            if len(rows) >= _CHUNK:
+                await _store(rows)
+                imported += len(rows)
+                rows = []
+    if rows:
+        await _store(rows)
+        imported += len(rows)
     log.info("%s: imported %d judgements", path.name, imported)
     return imported
 
 
 async def parse_dir(dir_path: Path) -> int:
     """Parse all `.jsonl` files in directory. Returns total count."""
-    _ensure_table()
     total = 0
     for file in dir_path.iterdir():
         if file.suffix == ".jsonl":
@@ -9,6 +9,7 @@ from .pg import (  # noqa
     add_batch,
     next_batch,
     mark_batch,
+    wait_new_batch,
 )
 
 __all__ = [
@@ -17,5 +18,6 @@ __all__ = [
     "add_batch",
     "next_batch",
     "mark_batch",
+    "wait_new_batch",
 ]
 
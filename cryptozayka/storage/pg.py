@@ -2,9 +2,22 @@
 # -*- coding: utf-8 -*-
 """
 PostgreSQL-storage layer — asyncpg-pool + batch / stats helpers.
+
+Новые batch'и анонсируются через NOTIFY в канал BATCH_CHANNEL;
+воркеры ждут их в wait_new_batch() на отдельном LISTEN-соединении.
+
+Очередь batch'ей — weighted fair queuing (start-time fair queuing):
+  • при add_batch batch получает виртуальный старт
+        vtime = max(V, last_finish[submitter]),
+    а last_finish[submitter] сдвигается на len(payload) · VT_UNIT / weight;
+  • claim_batches берёт ORDER BY priority, vtime по частичному индексу
+    (O(log n)) и двигает системные часы V = max(vtime) выбранных;
+  • priority — класс: PRIORITY_INTERACTIVE (одиночные проекты) всегда
+    раньше PRIORITY_BULK (импорты), внутри класса — честная доля.
 """
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import os
@@ -58,6 +71,14 @@ async def get_pool() -> asyncpg.Pool:
     return _POOL
 
 
+async def close_pool() -> None:
+    """Закрыть pool, если он был создан (безопасно звать повторно)."""
+    global _POOL
+    if _POOL is not None:
+        await _POOL.close()
+    _POOL = None
+
+
 # ─────────────────────── schema bootstrap ─────────────────────
 _INIT_SQL = """
 CREATE TABLE IF NOT EXISTS batches (
@@ -79,6 +100,110 @@ CREATE TABLE IF NOT EXISTS stats (
     metric TEXT PRIMARY KEY,
     value  BIGINT NOT NULL DEFAULT 0
 );
+
+-- аренда batch'а воркером (см. core/executor.py)
+ALTER TABLE batches ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+ALTER TABLE batches ADD COLUMN IF NOT EXISTS lease_until TIMESTAMP;
+CREATE INDEX IF NOT EXISTS batches_lease_until_idx
+    ON batches (lease_until) WHERE status = 'process';
+
+-- fair queuing: кто прислал, класс приоритета, виртуальное время старта
+ALTER TABLE batches ADD COLUMN IF NOT EXISTS submitter TEXT     NOT NULL DEFAULT 'anon';
+ALTER TABLE batches ADD COLUMN IF NOT EXISTS priority  SMALLINT NOT NULL DEFAULT 10;
+ALTER TABLE batches ADD COLUMN IF NOT EXISTS vtime     BIGINT   NOT NULL DEFAULT 0;
+CREATE INDEX IF NOT EXISTS batches_fair_queue_idx
+    ON batches (priority, vtime, id) WHERE status = 'new';
+
+CREATE TABLE IF NOT EXISTS queue_tenants (
+    submitter   TEXT PRIMARY KEY,
+    weight      INT    NOT NULL DEFAULT 1 CHECK (weight > 0),
+    last_finish BIGINT NOT NULL DEFAULT 0
+);
+
+-- dedup по содержимому проекта (core/dedup.py);
+-- verdict IS NULL — оценка в процессе у owner'а
+CREATE TABLE IF NOT EXISTS eval_cache (
+    content_hash TEXT PRIMARY KEY,
+    owner        TEXT,
+    verdict      TEXT,
+    explanation  TEXT,
+    text         TEXT,
+    tokens       INT,
+    created_at   TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- общие для всех процессов RPM/TPM-ведра OpenAI (core/ratelimit.py)
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key        TEXT PRIMARY KEY,
+    rpm        DOUBLE PRECISION NOT NULL,
+    tpm        DOUBLE PRECISION NOT NULL,
+    req_level  DOUBLE PRECISION NOT NULL,
+    tok_level  DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ      NOT NULL DEFAULT clock_timestamp()
+);
+
+-- L2 кэша GPT-ответов (core/response_cache.py), key — sha256 запроса
+CREATE TABLE IF NOT EXISTS response_cache (
+    key        TEXT PRIMARY KEY,
+    model      TEXT NOT NULL,
+    answer     TEXT NOT NULL,
+    tokens     INT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS response_cache_created_at_idx ON response_cache (created_at);
+
+-- месячный леджер GPT-токенов (core/budget.py)
+CREATE TABLE IF NOT EXISTS token_ledger (
+    month      TEXT   NOT NULL,
+    model      TEXT   NOT NULL,
+    used       BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (month, model)
+);
+ALTER TABLE token_ledger DROP COLUMN IF EXISTS reserved;
+
+-- резервы идущих вызовов: строка на вызов, протухшие (процесс умер между
+-- reserve и settle) снимает следующий reserve
+CREATE TABLE IF NOT EXISTS token_reservations (
+    id         BIGSERIAL PRIMARY KEY,
+    month      TEXT   NOT NULL,
+    model      TEXT   NOT NULL,
+    owner      TEXT   NOT NULL,
+    tokens     BIGINT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS token_reservations_month_idx ON token_reservations (month, expires_at);
+
+-- id job'а OpenAI Batch API (core/batch_api.py) — чтобы после рестарта
+-- продолжить опрос, а не отправлять batch второй раз
+ALTER TABLE batches ADD COLUMN IF NOT EXISTS provider_batch_id TEXT;
+
+-- ранние вердикты стриминга {idx: verdict} — GET /batch/{id} отдаёт их
+-- до commit'а batch'а (core/executor.py)
+ALTER TABLE batches ADD COLUMN IF NOT EXISTS early_verdicts JSONB NOT NULL DEFAULT '{}';
+
+-- по-проектный прогресс batch'а: idx — позиция проекта в payload,
+-- text — сырой ответ модели (NULL, если GPT не вызывался)
+CREATE TABLE IF NOT EXISTS batch_results (
+    batch_id INT   NOT NULL REFERENCES batches(id) ON DELETE CASCADE,
+    idx      INT   NOT NULL,
+    result   JSONB NOT NULL,
+    text     TEXT,
+    PRIMARY KEY (batch_id, idx)
+);
+ALTER TABLE batch_results ADD COLUMN IF NOT EXISTS text TEXT;
+
+-- поиск похожих имён (core/similar.py); без прав на CREATE EXTENSION
+-- схема всё равно поднимается, lookup просто будет недоступен
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS gpt_judgements_project_trgm_idx
+        ON gpt_judgements USING gin (project gin_trgm_ops);
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'pg_trgm unavailable: %', SQLERRM;
+END
+$$;
 """
 
 
@@ -87,39 +212,191 @@ async def _init_schema(pool: asyncpg.Pool) -> None:
         await conn.execute(_INIT_SQL)
 
 
+# ─────────────────────── LISTEN / NOTIFY ──────────────────────
+BATCH_CHANNEL: Final[str] = "batches_new"
+
+_LISTEN_CONN: Optional[asyncpg.Connection] = None
+_NEW_BATCH: Optional[asyncio.Event] = None
+
+
+def _on_notify(*_: Any) -> None:
+    if _NEW_BATCH is not None:
+        _NEW_BATCH.set()
+
+
+async def _ensure_listener() -> None:
+    """Отдельное (не из пула) соединение, подписанное на BATCH_CHANNEL."""
+    global _LISTEN_CONN, _NEW_BATCH
+    if _NEW_BATCH is None:
+        _NEW_BATCH = asyncio.Event()
+    if _LISTEN_CONN is not None and not _LISTEN_CONN.is_closed():
+        return
+    try:
+        conn = await asyncpg.connect(_dsn(), timeout=15)
+        await conn.add_listener(BATCH_CHANNEL, _on_notify)
+    except Exception as e:  # упадём на polling, переподключимся позже
+        log.warning("LISTEN %s unavailable: %s", BATCH_CHANNEL, e)
+        _LISTEN_CONN = None
+        return
+    _LISTEN_CONN = conn
+    # за время реконнекта могли пропустить NOTIFY → проверим очередь сразу
+    _NEW_BATCH.set()
+    log.info("👂 listening on %s", BATCH_CHANNEL)
+
+
+async def wait_new_batch(timeout: float) -> bool:
+    """
+    Ждём NOTIFY о новом batch'е не дольше *timeout* секунд.
+    True — пришло уведомление, False — истёк таймаут (polling-страховка).
+    """
+    await _ensure_listener()
+    assert _NEW_BATCH is not None
+    try:
+        await asyncio.wait_for(_NEW_BATCH.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        _NEW_BATCH.clear()
+
+
+VERDICT_CHANNEL: Final[str] = "verdicts_early"
+
+
+async def notify_verdict(batch_id: int, idx: int, project: str, verdict: str) -> None:
+    """
+    Ранний вердикт стримингового вызова (до commit'а batch'а): сохраняем в
+    batches.early_verdicts (его читает GET /batch/{id}) и шлём в VERDICT_CHANNEL.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(
+            """
+            WITH u AS (
+              UPDATE batches
+              SET early_verdicts = early_verdicts || jsonb_build_object($2::int, $3::text)
+              WHERE id = $1
+            )
+            SELECT pg_notify($4, $5)
+            """,
+            batch_id,
+            idx,
+            verdict,
+            VERDICT_CHANNEL,
+            json.dumps({"batch_id": batch_id, "idx": idx, "project": project, "verdict": verdict}),
+        )
+
+
+async def close_listener() -> None:
+    global _LISTEN_CONN
+    if _LISTEN_CONN is not None and not _LISTEN_CONN.is_closed():
+        await _LISTEN_CONN.close()
+    _LISTEN_CONN = None
+
+
 # ───────────────────── batch helpers ──────────────────────────
-async def add_batch(payload: list[dict[str, Any]]) -> int:
+PRIORITY_INTERACTIVE: Final[int] = 0
+PRIORITY_BULK: Final[int] = 10
+VT_UNIT: Final[int] = 1000          # виртуальное время одного проекта при weight=1
+
+
+async def add_batch(
+    payload: list[dict[str, Any]],
+    *,
+    submitter: str = "anon",
+    priority: int | None = None,
+) -> int:
+    """
+    Ставит batch в очередь. По умолчанию одиночный проект — интерактивный
+    класс, всё остальное — bulk.
+    """
+    if priority is None:
+        priority = PRIORITY_INTERACTIVE if len(payload) == 1 else PRIORITY_BULK
+    cost = max(1, len(payload)) * VT_UNIT
+
     pool = await get_pool()
     async with pool.acquire() as conn:
+        # тег старта, INSERT и NOTIFY одним запросом; строка queue_tenants
+        # блокируется до COMMIT → теги одного submitter'а не пересекаются
         row = await conn.fetchrow(
-            "INSERT INTO batches (payload) VALUES ($1::jsonb) RETURNING id",
+            """
+            WITH clock AS (
+              SELECT COALESCE(
+                (SELECT value FROM stats WHERE metric = 'queue_vclock'), 0
+              ) AS v
+            ), t AS (
+              INSERT INTO queue_tenants AS q (submitter, last_finish)
+              SELECT $2, clock.v + $4 FROM clock
+              ON CONFLICT (submitter) DO UPDATE
+                SET last_finish = GREATEST(q.last_finish, (SELECT v FROM clock))
+                                  + $4 / q.weight
+              RETURNING last_finish, weight
+            ), b AS (
+              INSERT INTO batches (payload, submitter, priority, vtime)
+              SELECT $1::jsonb, $2, $3, t.last_finish - $4 / t.weight FROM t
+              RETURNING id
+            )
+            SELECT id, pg_notify($5, id::text) FROM b
+            """,
             json.dumps(payload),
+            submitter,
+            priority,
+            cost,
+            BATCH_CHANNEL,
         )
     return int(row["id"])
 
 
-async def next_batch() -> tuple[int | None, str | None]:
+async def claim_batches(
+    limit: int,
+    *,
+    owner: str | None = None,
+    lease_ttl: float | None = None,
+) -> list[tuple[int, str]]:
     """
-    Атомарно берём первый batch со статусом 'new', ставим 'process'
-    и возвращаем (id, payload_JSON) либо (None, None).
+    Атомарно берём до *limit* batch'ей в порядке fair-queue, ставим
+    'process' (+ аренда на *owner*, если задан) и двигаем виртуальные часы.
+    Возвращаем [(id, payload_JSON), …].
     """
     pool = await get_pool()
     async with pool.acquire() as conn:
-        row = await conn.fetchrow(
+        rows = await conn.fetch(
             """
-            UPDATE batches
-            SET status = 'process'
-            WHERE id = (
-              SELECT id FROM batches WHERE status='new'
-              ORDER BY id LIMIT 1
-              FOR UPDATE SKIP LOCKED
+            WITH c AS (
+              UPDATE batches
+              SET status = 'process',
+                  lease_owner = $2,
+                  lease_until = now() + make_interval(secs => $3)
+              WHERE id IN (
+                SELECT id FROM batches WHERE status = 'new'
+                ORDER BY priority, vtime, id LIMIT $1
+                FOR UPDATE SKIP LOCKED
+              )
+              RETURNING id, payload, priority, vtime
+            ), clk AS (
+              INSERT INTO stats(metric, value)
+              SELECT 'queue_vclock', MAX(vtime) FROM c HAVING COUNT(*) > 0
+              ON CONFLICT (metric) DO UPDATE
+                SET value = GREATEST(stats.value, EXCLUDED.value)
             )
-            RETURNING id, payload
-            """
+            SELECT id, payload FROM c ORDER BY priority, vtime, id
+            """,
+            limit,
+            owner,
+            lease_ttl,
         )
-    if not row:
+    return [(int(r["id"]), r["payload"]) for r in rows]
+
+
+async def next_batch() -> tuple[int | None, str | None]:
+    """
+    Атомарно берём следующий по fair-queue batch со статусом 'new',
+    ставим 'process' и возвращаем (id, payload_JSON) либо (None, None).
+    """
+    claimed = await claim_batches(1)
+    if not claimed:
         return None, None
-    return int(row["id"]), row["payload"]  # type: ignore[return-value]
+    return claimed[0]
 
 
 async def mark_batch(batch_id: int, *, ok: bool, result: Any | None = None, error: str | None = None) -> None:
@@ -163,9 +440,18 @@ get_db = get_pool  # for old code
 
 __all__ = [
     "get_pool",
+    "close_pool",
     "get_db",
     "add_batch",
     "next_batch",
+    "claim_batches",
     "mark_batch",
     "load_month_stats",
+    "PRIORITY_INTERACTIVE",
+    "PRIORITY_BULK",
+    "wait_new_batch",
+    "close_listener",
+    "BATCH_CHANNEL",
+    "VERDICT_CHANNEL",
+    "notify_verdict",
 ]
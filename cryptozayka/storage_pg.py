@@ -11,6 +11,7 @@ from cryptozayka.storage.pg import (  # noqa: F401
     add_batch,
     next_batch,
     mark_batch,
+    wait_new_batch,
 )
 
 __all__ = [
@@ -19,4 +20,5 @@ __all__ = [
     "add_batch",
     "next_batch",
     "mark_batch",
+    "wait_new_batch",
 ]
@@ -40,6 +40,8 @@ from telegram.ext import (
 # ───────── config ───────────────────────────────────────────
 API_URL: Final[str] = os.getenv("ZAYKA_API", "http://zayka:8000")
 TOKEN: Final[str | None] = os.getenv("TELEGRAM_TOKEN")
+# ключ доверенного клиента: без него API не принимает submitter
+API_KEY: Final[str | None] = os.getenv("ZAYKA_API_KEY")
 
 log = logging.getLogger(__name__)
 
@@ -50,7 +52,7 @@ _SESS: aiohttp.ClientSession | None = None
 async def _session() -> aiohttp.ClientSession:
     global _SESS
     if _SESS is None or _SESS.closed:
-        _SESS = aiohttp.ClientSession()
+        _SESS = aiohttp.ClientSession(headers={"X-Api-Key": API_KEY} if API_KEY else None)
     return _SESS
 
 
@@ -98,8 +100,13 @@ ERR_EXAMPLE = (
 )
 
 
-async def _submit_projects(chat_send, projects: list[dict[str, Any]]) -> None:
-    resp = await _post("/batch/submit", projects)
+async def _submit_projects(
+    chat_send, projects: list[dict[str, Any]], user_id: int | None = None
+) -> None:
+    # submitter → честная очередь на стороне API: один юзер не забьёт всех
+    trusted = API_KEY and user_id is not None
+    path = f"/batch/submit?submitter=tg:{user_id}" if trusted else "/batch/submit"
+    resp = await _post(path, projects)
     await chat_send(f"✅ Batch #{resp['batch_id']} accepted")
 
 
@@ -113,7 +120,8 @@ async def cmd_project(update: Update, ctx: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text(ERR_EXAMPLE)
         return
 
-    await _submit_projects(update.message.reply_text, [proj])
+    user = update.effective_user
+    await _submit_projects(update.message.reply_text, [proj], user.id if user else None)
 
 
 async def cmd_stats(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
@@ -160,7 +168,8 @@ async def on_text(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
     except Exception:
         return  # не JSON — игнорируем
 
-    await _submit_projects(update.message.reply_text, projects)
+    user = update.effective_user
+    await _submit_projects(update.message.reply_text, projects, user.id if user else None)
 
 
 # ───────── меню ─────────────────────────────────────────────
@@ -1,34 +1,105 @@
-"""Async background worker that processes queued batches."""
+"""Async background worker that processes queued batches.
+
+* worker_loop() — один процесс: пул слотов из core.executor,
+  SIGTERM → graceful drain (новые batch'и не берём, текущие дорабатываем).
+* run_procs(n)  — супервизор над *n* процессами-воркерами: у каждого свой
+  event loop и свой asyncpg-pool; SIGTERM/SIGINT пересылается детям,
+  упавший ребёнок перезапускается.
+"""
 from __future__ import annotations
 
 import asyncio
 import logging
+import multiprocessing as mp
+import signal
+import time
+from multiprocessing.process import BaseProcess
+from typing import Callable
 
-from .storage import next_batch, mark_batch
-from .core.executor import process_batch
+from .core.executor import _worker_loop
+from .core import llm_gateway
+from .storage.pg import close_listener, close_pool
 
 log = logging.getLogger(__name__)
-POLL_INTERVAL = 60  # seconds
+
+LOG_FORMAT = "%(asctime)s | %(levelname)-8s | %(processName)s | %(name)s | %(message)s"
+SUPERVISE_EVERY = 1.0     # seconds between liveness checks
+RESTART_BACKOFF = 5.0     # don't respawn a child more often than this
+DRAIN_TIMEOUT = 300.0     # seconds to wait for children after SIGTERM
 
 
-async def _handle(bid: str) -> None:
-    """Process a single batch id and mark result in storage."""
+async def worker_loop() -> None:
+    """Endless loop – claims batches and processes them until SIGTERM."""
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
     try:
-        await process_batch(bid)
-        await mark_batch(bid, "done")
-        log.info("✔ processed %s", bid)
-    except Exception as e:  # noqa: BLE001
-        await mark_batch(bid, "error", error=str(e))
-        log.exception("✖ failed %s", bid)
+        await _worker_loop(stop=stop)
+    finally:
+        await close_listener()
+        await llm_gateway.close()
+        await close_pool()
+    log.info("worker stopped")
 
 
-async def worker_loop() -> None:
-    """Endless loop – pulls next batch and processes it."""
-    while True:
-        bid = await next_batch()
-        if bid is None:
-            await asyncio.sleep(POLL_INTERVAL)
-            continue
-
-        await mark_batch(bid, "processing")
-        await _handle(bid)
+# ─────────────────────────── multi-process mode ──────────────────────────
+def _child(log_level: str) -> None:
+    """Entry-point of a worker process (spawned, so all state is fresh)."""
+    logging.basicConfig(level=log_level, format=LOG_FORMAT)
+    # Ctrl+C hits the whole process group – let the supervisor decide
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(worker_loop())
+
+
+def run_procs(
+    n: int,
+    *,
+    log_level: str = "INFO",
+    drain_timeout: float = DRAIN_TIMEOUT,
+    target: Callable[[str], None] = _child,
+) -> None:
+    """Supervise *n* worker processes (*target*(log_level)) until SIGTERM / SIGINT."""
+    ctx = mp.get_context("spawn")
+    procs: dict[int, BaseProcess] = {}
+    started: dict[int, float] = {}
+    stopping = False
+
+    def _spawn(i: int) -> None:
+        p = ctx.Process(target=target, args=(log_level,), name=f"worker-{i}")
+        p.start()
+        procs[i], started[i] = p, time.monotonic()
+        log.info("▶ worker-%d started (pid %s)", i, p.pid)
+
+    def _stop(signum: int, _frame: object) -> None:
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        log.info("signal %s: draining %d worker(s)…", signum, len(procs))
+        for p in procs.values():
+            if p.is_alive():
+                p.terminate()  # SIGTERM → graceful drain in the child
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    for i in range(n):
+        _spawn(i)
+
+    while not stopping:
+        time.sleep(SUPERVISE_EVERY)
+        for i, p in list(procs.items()):
+            if stopping or p.is_alive():
+                continue
+            if time.monotonic() - started[i] < RESTART_BACKOFF:
+                continue  # crash-loop guard
+            log.warning("✖ worker-%d exited with code %s, restarting", i, p.exitcode)
+            _spawn(i)
+
+    deadline = time.monotonic() + drain_timeout
+    for i, p in procs.items():
+        p.join(max(0.0, deadline - time.monotonic()))
+        if p.is_alive():
+            log.warning("worker-%d did not drain in time, killing", i)
+            p.kill()
+            p.join()
+    log.info("all workers stopped")
@@ -0,0 +1,52 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+from unittest.mock import AsyncMock, patch
+
+import asyncpg
+from fastapi.testclient import TestClient
+
+from cryptozayka import api
+
+PROJECTS = [{"name": "Demo", "description": "Desc"}]
+
+
+def test_submit_derives_submitter_and_gates_overrides():
+    client = TestClient(api.app)
+    add = AsyncMock(return_value=7)
+    with patch.object(api, "add_batch", new=add), patch.object(api, "API_KEY", "s3cret"):
+        r = client.post("/batch/submit", json=PROJECTS)
+        assert r.status_code == 200 and r.json() == {"batch_id": 7}
+        assert add.await_args.kwargs == {"submitter": "ip:testclient", "priority": None}
+
+        # без ключа клиент не выбирает себе tenant/класс
+        for query in ("submitter=tg:1", "priority=interactive"):
+            r = client.post(f"/batch/submit?{query}", json=PROJECTS)
+            assert r.status_code == 403
+        r = client.post("/batch/submit?priority=interactive", json=PROJECTS, headers={"X-Api-Key": "nope"})
+        assert r.status_code == 403
+        assert add.await_count == 1
+
+        r = client.post(
+            "/batch/submit?submitter=tg:1&priority=bulk",
+            json=PROJECTS,
+            headers={"X-Api-Key": "s3cret"},
+        )
+        assert r.status_code == 200
+        assert add.await_args.kwargs == {"submitter": "tg:1", "priority": api.PRIORITY_BULK}
+
+
+def test_similar_without_pg_trgm_is_503():
+    client = TestClient(api.app)
+    missing = asyncpg.UndefinedFunctionError("function similarity(text, unknown) does not exist")
+    with patch.object(api.similar, "find", new=AsyncMock(side_effect=missing)):
+        r = client.get("/project/similar/LayerZer0")
+    assert r.status_code == 503
+    assert "pg_trgm" in r.json()["detail"]
@@ -0,0 +1,103 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from openai import AsyncOpenAI
+
+from cryptozayka.core import batch_api, strategy
+from cryptozayka.core.strategy import Verdict
+
+
+def _stand_in() -> tuple[web.Application, dict]:
+    """Минимальная заглушка files/batches OpenAI."""
+    state: dict = {"input": b"", "polls": 0}
+
+    def _batch(status: str) -> dict:
+        return {
+            "id": "batch_1",
+            "object": "batch",
+            "endpoint": batch_api.ENDPOINT,
+            "input_file_id": "file_in",
+            "completion_window": "24h",
+            "created_at": 0,
+            "status": status,
+            "output_file_id": "file_out" if status == "completed" else None,
+        }
+
+    async def upload(req: web.Request) -> web.Response:
+        form = await req.post()
+        state["input"] = form["file"].file.read()
+        return web.json_response({
+            "id": "file_in", "object": "file", "bytes": len(state["input"]),
+            "created_at": 0, "filename": "in.jsonl", "purpose": "batch", "status": "processed",
+        })
+
+    async def create(req: web.Request) -> web.Response:
+        return web.json_response(_batch("validating"))
+
+    async def retrieve(req: web.Request) -> web.Response:
+        state["polls"] += 1
+        return web.json_response(_batch("in_progress" if state["polls"] < 2 else "completed"))
+
+    async def content(req: web.Request) -> web.Response:
+        out = []
+        for line in state["input"].decode().splitlines():
+            custom_id = json.loads(line)["custom_id"]
+            if custom_id.endswith(":2"):
+                continue  # провайдер «потерял» один запрос
+            verdict = "red" if custom_id.endswith(":0") else "green"
+            answer = json.dumps({"verdict": verdict, "explanation": "ok"})
+            out.append(json.dumps({
+                "custom_id": custom_id,
+                "response": {"status_code": 200, "body": {
+                    "choices": [{"message": {"content": answer}}],
+                    "usage": {"total_tokens": 42},
+                }},
+                "error": None,
+            }))
+        return web.Response(text="\n".join(out) + "\n")
+
+    app = web.Application()
+    app.router.add_post("/v1/files", upload)
+    app.router.add_post("/v1/batches", create)
+    app.router.add_get("/v1/batches/{id}", retrieve)
+    app.router.add_get("/v1/files/{id}/content", content)
+    return app, state
+
+
+@pytest.mark.asyncio
+async def test_evaluate_batch_against_stand_in(monkeypatch):
+    app, state = _stand_in()
+    async with TestServer(app) as server:
+        client = AsyncOpenAI(api_key="sk-test", base_url=str(server.make_url("/v1")))
+        save = AsyncMock()
+        monkeypatch.setattr(strategy, "client", client)
+        monkeypatch.setattr(batch_api, "_load_provider_id", AsyncMock(return_value=None))
+        monkeypatch.setattr(batch_api, "_save_provider_id", save)
+        monkeypatch.setattr(batch_api, "BATCH_API_POLL", 0)
+
+        items = [(0, {"name": "Rug", "description": "x"}),
+                 (1, {"name": "Good", "description": "y"}),
+                 (2, {"name": "Lost", "description": "z"})]
+        out = await batch_api.evaluate_batch(7, items)
+        await client.close()
+
+    save.assert_awaited_once_with(7, "batch_1")
+    assert [json.loads(line)["custom_id"] for line in state["input"].decode().splitlines()] == \
+        ["7:0", "7:1", "7:2"]
+    assert state["polls"] == 2
+    assert out[0].verdict is Verdict.RED and out[0].tokens == 42
+    assert out[1].verdict is Verdict.GREEN and out[1].project == "Good"
+    assert out[2].verdict is Verdict.ERROR
@@ -0,0 +1,49 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+os.environ.setdefault("POSTGRES_HOST", "localhost")
+
+import pytest
+
+import cryptozayka.storage.pg as pg_mod
+from cryptozayka.core import budget
+
+
+@pytest.mark.asyncio
+async def test_stale_reservations_are_reclaimed():
+    try:
+        pool = await pg_mod.get_pool()
+    except Exception as e:
+        pg_mod._POOL = None
+        pytest.skip(f"Postgres unavailable: {e}")
+    month = budget.current_month()
+    ledger = budget.TokenLedger()
+    try:
+        await ledger.reset(month)
+        held = await ledger.reserve("m1", 600, 1000)
+        with pytest.raises(budget.BudgetExceeded):
+            await ledger.reserve("m2", 500, 1000)
+
+        # процесс умер между reserve и settle: резерв протух
+        async with pool.acquire() as c:
+            await c.execute(
+                "UPDATE token_reservations SET expires_at = now() - interval '1 second' WHERE id = $1",
+                held.id,
+            )
+        fresh = await ledger.reserve("m2", 500, 1000)
+
+        await ledger.settle(held, 100)      # запоздалый settle: резерва уже нет, used учтён
+        await ledger.settle(fresh, 300)
+        async with pool.acquire() as c:
+            left = await c.fetchval("SELECT count(*) FROM token_reservations WHERE month = $1", month)
+        assert left == 0
+        assert await ledger.refresh(month) == {"m1": 100, "m2": 300}
+    finally:
+        await ledger.reset(month)
+        await pg_mod.close_pool()
@@ -0,0 +1,67 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+import asyncio
+import math
+from unittest.mock import AsyncMock
+
+import pytest
+
+from cryptozayka.core import cascade, rag
+from cryptozayka.core.strategy import EvaluationResult, Verdict
+
+
+def test_p_yes_from_both_llama_formats():
+    old = {"completion_probabilities": [{"probs": [{"tok_str": " YES", "prob": 0.6},
+                                                   {"tok_str": "NO", "prob": 0.2}]}]}
+    new = {"completion_probabilities": [{"top_logprobs": [{"token": "Yes", "logprob": math.log(0.3)},
+                                                          {"token": " No", "logprob": math.log(0.6)}]}]}
+    assert rag._p_yes("YES", rag._first_token_probs(old)) == pytest.approx(0.75)
+    assert rag._p_yes("NO", rag._first_token_probs(new)) == pytest.approx(1 / 3)
+    assert rag._p_yes("YES, clone of a rug", []) == 1.0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "p_scam, escalated",
+    [(0.97, False), (0.5, True), (None, True)],
+)
+async def test_cascade_short_circuits_confident_red(monkeypatch, p_scam, escalated):
+    monkeypatch.setattr(
+        rag, "screen_many", AsyncMock(side_effect=lambda ps: [(p_scam, "YES rug pull")] * len(ps))
+    )
+    monkeypatch.setattr(cascade, "RED_THRESHOLD", 0.9)
+    gpt = AsyncMock(return_value=EvaluationResult("P", Verdict.GREEN, "ok", "{}", tokens=100))
+    saved_before = cascade.TOKENS_SAVED._value.get()
+
+    res = await cascade.wrap(gpt)("P", "desc")
+
+    assert gpt.await_count == int(escalated)
+    if escalated:
+        assert res.verdict is Verdict.GREEN
+    else:
+        assert res.verdict is Verdict.RED
+        assert res.tokens == 0 and res.model.startswith("local:")
+        assert cascade.TOKENS_SAVED._value.get() > saved_before
+
+
+@pytest.mark.asyncio
+async def test_concurrent_screens_share_multi_prompt_requests(monkeypatch):
+    screen_many = AsyncMock(side_effect=lambda ps: [(0.99 if "Rug" in n else 0.1, n) for n, _ in ps])
+    monkeypatch.setattr(rag, "screen_many", screen_many)
+    monkeypatch.setattr(rag, "LLAMA_SLOTS", 4)
+    gpt = AsyncMock(side_effect=lambda n, d: EvaluationResult(n, Verdict.GREEN, "ok", "{}", tokens=100))
+
+    names = ["Rug1", "Ok1", "Rug2", "Ok2", "Ok3", "Rug3"]
+    res = await asyncio.gather(*(cascade.wrap(gpt)(n, "d") for n in names))
+
+    assert [len(c.args[0]) for c in screen_many.await_args_list] == [4, 2]
+    assert [r.verdict for r in res] == [Verdict.RED, Verdict.GREEN] * 2 + [Verdict.GREEN, Verdict.RED]
+    assert gpt.await_count == 3
@@ -0,0 +1,56 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+from cryptozayka.core import compress, strategy
+
+MODEL = "gpt-4-0125-preview"
+
+DESCRIPTION = """
+LayerZero is an omnichain interoperability protocol!!! See https://layerzero.network/docs?utm=x
+Join our Telegram for updates.
+The best project in crypto. The best project in crypto.
+Token supply is capped at 1B, 20% unlocked at TGE, team tokens vested for 3 years.
+We love our community and our community loves us so much it is truly amazing and wonderful.
+Audited by Zellic and OtterSec; raised $120M from a16z and Sequoia.
+"""
+
+
+def test_normalize_and_drop_boilerplate():
+    parts = compress.sentences(compress.normalize(DESCRIPTION))
+    assert parts[0] == "LayerZero is an omnichain interoperability protocol!"
+    assert parts[1] == "See layerzero.network"
+    assert not any("Telegram" in p for p in parts)
+    assert sum("best project" in p for p in parts) == 1
+
+
+def test_budget_keeps_informative_sentences_in_order():
+    compress.compress.cache_clear()
+    res = compress.compress(DESCRIPTION, 60, MODEL)
+    assert res.tokens_after <= 60 < res.tokens_before
+    assert res.text.startswith("LayerZero is an omnichain")
+    assert "Audited by Zellic" in res.text and "Token supply" in res.text
+    assert res.text.index("Token supply") < res.text.index("Audited")
+    assert "community loves us" not in res.text
+
+
+def test_short_description_untouched_and_long_sentence_cut_by_words():
+    compress.compress.cache_clear()
+    assert compress.compress("Simple DEX on Base.", 48, MODEL).text == "Simple DEX on Base."
+
+    wall = " ".join(f"word{i}" for i in range(400))
+    res = compress.compress(wall, 30, MODEL)
+    assert res.tokens_after <= 30
+    assert wall.startswith(res.text) and not res.text.endswith("word")
+
+
+def test_project_json_uses_token_budget(monkeypatch):
+    monkeypatch.setattr(strategy, "MAX_DESC_TOKENS", 48)
+    compress.compress.cache_clear()
+    assert strategy._project_json("LZ", DESCRIPTION)["description"] == compress.compress(DESCRIPTION, 48, strategy.MODEL).text
@@ -0,0 +1,75 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+        "POSTGRES_HOST": "localhost",
+        "POSTGRES_PORT": "5432",
+    }
+)
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from cryptozayka.core import dedup
+from cryptozayka.core.strategy import EvaluationResult, Verdict
+
+
+def test_content_hash_normalizes_case_and_whitespace():
+    assert dedup.content_hash("LayerZero", "Cross  chain\n") == dedup.content_hash(
+        "layerzero ", "cross chain"
+    )
+    assert dedup.content_hash("LayerZero", "a") != dedup.content_hash("LayerZero", "b")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_share_one_call():
+    calls = 0
+
+    async def fake_eval(name: str, _descr: str):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return EvaluationResult(name, Verdict.GREEN, "ok", "{}", tokens=50)
+
+    with patch.object(dedup, "_claim", new=AsyncMock(return_value=True)), \
+         patch.object(dedup, "_store", new=AsyncMock()):
+        results = await asyncio.gather(
+            *(dedup.evaluate("Proj", "Same", fake_eval) for _ in range(4))
+        )
+
+    assert calls == 1
+    assert [reused for _, reused in results] == [False, True, True, True]
+    assert results[1][0].tokens == 0
+    assert not dedup._inflight
+
+
+@pytest.mark.asyncio
+async def test_truncated_answer_not_stored():
+    cut = EvaluationResult("Proj", Verdict.RED, "Anon", "{}", tokens=30, truncated=True)
+    release, store = AsyncMock(), AsyncMock()
+
+    with patch.object(dedup, "_claim", new=AsyncMock(return_value=True)), \
+         patch.object(dedup, "_release", new=release), \
+         patch.object(dedup, "get_pool", new=store):
+        res, reused = await dedup.evaluate("Proj", "Same", AsyncMock(return_value=cut))
+
+    assert res is cut and not reused
+    release.assert_awaited_once()
+    store.assert_not_awaited()          # в eval_cache не пишем
+
+
+@pytest.mark.asyncio
+async def test_fresh_stored_verdict_is_reused():
+    cached = EvaluationResult("Proj", Verdict.RED, "scam", "{}", tokens=0)
+    fake_eval = AsyncMock()
+
+    with patch.object(dedup, "_claim", new=AsyncMock(return_value=False)), \
+         patch.object(dedup, "_lookup", new=AsyncMock(return_value=cached)):
+        res, reused = await dedup.evaluate("Proj", "Same", fake_eval)
+
+    fake_eval.assert_not_awaited()
+    assert reused and res.verdict is Verdict.RED
@@ -0,0 +1,115 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+from unittest.mock import AsyncMock
+
+import numpy as np
+import pytest
+
+from cryptozayka.core import embeddings, rag
+from cryptozayka.core.embeddings import EmbeddingIndex, Neighbour
+from cryptozayka.core.strategy import EvaluationResult, Verdict
+
+
+def _vecs(*seeds, dim=256):
+    return np.stack([np.random.default_rng(s).standard_normal(dim) for s in seeds]).astype(np.float32)
+
+
+def test_index_search_overwrite_and_reload(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, "CHECK_EVERY", 0)
+    idx = EmbeddingIndex(tmp_path, dim=32)
+    assert idx.search(_vecs(1)[0]) == []
+
+    idx.add([("A", "green"), ("B", "red"), ("C", "yellow")], _vecs(1, 2, 3))
+    top = idx.search(_vecs(2)[0], k=2)
+    assert top[0].project == "B" and top[0].score == pytest.approx(1.0, abs=1e-4)
+    assert len(top) == 2 and top[1].score < 0.9
+
+    idx.add([("B", "yellow")], _vecs(2))          # переоценка — та же строка
+    assert len(idx) == 3 and idx.search(_vecs(2)[0], k=1)[0].verdict == "yellow"
+
+    other = EmbeddingIndex(tmp_path, dim=32)       # другой процесс видит записи
+    other.add([("D", "red")], _vecs(4))
+    assert idx.search(_vecs(4)[0], k=1)[0] == Neighbour("D", "red", pytest.approx(1.0, abs=1e-4))
+
+
+def test_index_grows_past_initial_capacity(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, "INITIAL_CAPACITY", 4)
+    idx = EmbeddingIndex(tmp_path, dim=16)
+    for i in range(10):
+        idx.add([(f"P{i}", "green")], _vecs(i))
+    assert len(idx) == 10
+    assert idx.search(_vecs(7)[0], k=1)[0].project == "P7"
+
+
+def test_vector_from_both_llama_formats():
+    assert embeddings._vector({"embedding": [1, 2]}).tolist() == [1, 2]
+    assert embeddings._vector([{"index": 0, "embedding": [[1, 2], [3, 4]]}]).tolist() == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_wrap_skips_near_exact_and_passes_context(monkeypatch):
+    monkeypatch.setattr(embeddings, "PROMPT_CONTEXT", True)
+    evaluate = AsyncMock(return_value=EvaluationResult("X", Verdict.GREEN, "", ""))
+
+    monkeypatch.setattr(embeddings, "neighbours", AsyncMock(return_value=[Neighbour("Rug v1", "red", 0.99)]))
+    res = await embeddings.wrap(evaluate)("Rug v2", "same text")
+    assert res.verdict is Verdict.RED and res.tokens == 0
+    evaluate.assert_not_awaited()
+
+    # косинус проекции высокий, но имя другое — решает GPT
+    twin = [Neighbour("Moon Bridge", "red", 0.99)]
+    monkeypatch.setattr(embeddings, "neighbours", AsyncMock(return_value=twin))
+    await embeddings.wrap(evaluate)("Sun Lending", "same text")
+    evaluate.assert_awaited_once_with("Sun Lending", "same text", neighbours=[twin[0]._asdict()])
+    evaluate.reset_mock()
+
+    near = [Neighbour("Dex", "green", 0.8)]
+    monkeypatch.setattr(embeddings, "neighbours", AsyncMock(return_value=near))
+    await embeddings.wrap(evaluate)("Dex 2", "another dex", similar=[])
+    evaluate.assert_awaited_once_with("Dex 2", "another dex", similar=[], neighbours=[near[0]._asdict()])
+
+
+@pytest.mark.asyncio
+async def test_screen_prompt_gets_neighbours(monkeypatch):
+    monkeypatch.setattr(embeddings, "neighbours", AsyncMock(return_value=[Neighbour("Rug", "red", 0.9)]))
+    complete = AsyncMock(return_value={"content": "YES clone"})
+    monkeypatch.setattr(rag, "_complete", complete)
+
+    assert await rag.screen_project("Rug 2", "x") == (True, "YES clone")
+    assert "- Rug: red (similarity 0.90)" in complete.await_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_record_batch_indexes_judged_projects(tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, "index", EmbeddingIndex(tmp_path, dim=16))
+    monkeypatch.setattr(embeddings, "ENABLED", True)
+    monkeypatch.setattr(embeddings, "CHECK_EVERY", 0)
+    embeddings._vec_cache.clear()
+
+    async def fake_embed(texts):
+        return [{"embedding": _vecs(len(t))[0].tolist()} for t in texts]
+
+    monkeypatch.setattr(rag.client, "embed", fake_embed)
+    projects = [
+        {"name": "A", "description": "aa"},
+        {"name": "B", "description": "bbbb"},
+        {"name": "C", "description": "ccc"},
+    ]
+    verdicts = [
+        {"name": "A", "verdict": "red"},
+        {"name": "B", "verdict": "error"},
+        {"name": "C", "verdict": "red"},              # шорткат cascade/similar
+    ]
+    await embeddings.record_batch(projects, verdicts, judged={0, 1})
+
+    assert len(embeddings.index) == 1                 # ни error, ни шорткат в индекс не попали
+    found = await embeddings.neighbours("Z", "zz")    # тот же фейковый вектор, что у "A\naa"
+    assert found[0].project == "A" and found[0].score == pytest.approx(1.0, abs=1e-4)
@@ -0,0 +1,163 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+        "POSTGRES_HOST": "localhost",
+        "POSTGRES_PORT": "5432",
+    }
+)
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from cryptozayka.core import dedup, executor
+from cryptozayka.core.strategy import EvaluationResult, Verdict
+
+
+@pytest.fixture(autouse=True)
+def _no_dedup(monkeypatch):
+    """Dedup ходит в Postgres — в unit-тестах executor'а выключаем."""
+    monkeypatch.setattr(dedup, "DEDUP_TTL", 0)
+
+
+@pytest.mark.asyncio
+async def test_process_batch_concurrent_keeps_order():
+    running = 0
+    peak = 0
+
+    async def fake_analyze(name: str, _descr: str):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01 if name != "P0" else 0.05)
+        running -= 1
+        if name == "P3":
+            raise RuntimeError("boom")
+        return EvaluationResult(name, Verdict.GREEN, "ok", "{}", tokens=10)
+
+    projects = [{"name": f"P{i}", "description": ""} for i in range(6)]
+    commit = AsyncMock()
+    with patch.object(executor, "analyze_project", new=fake_analyze), \
+         patch.object(executor, "_load_progress", new=AsyncMock(return_value={})), \
+         patch.object(executor._BatchWriter, "flush", new=AsyncMock()), \
+         patch.object(executor._BatchWriter, "commit", new=commit):
+        await executor._process_batch(1, projects, concurrency=3)
+
+    result = commit.await_args.args[0]
+    assert [r["name"] for r in result] == [p["name"] for p in projects]
+    assert result[3]["verdict"] == "error"
+    assert result[4]["verdict"] == "green"
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_process_batch_resumes_from_stored_progress():
+    stored = {0: {"name": "P0", "verdict": "red", "tokens": 5, "explanation": "old"}}
+    analyze = AsyncMock(
+        return_value=EvaluationResult("P1", Verdict.GREEN, "ok", "{}", tokens=10)
+    )
+    add = AsyncMock()
+    commit = AsyncMock()
+
+    projects = [{"name": "P0"}, {"name": "P1"}]
+    with patch.object(executor, "analyze_project", new=analyze), \
+         patch.object(executor, "_load_progress", new=AsyncMock(return_value=stored)), \
+         patch.object(executor._BatchWriter, "add", new=add), \
+         patch.object(executor._BatchWriter, "commit", new=commit):
+        await executor._process_batch(7, projects)
+
+    analyze.assert_awaited_once_with("P1", "")
+    assert add.await_args.args[0] == 1
+    result = commit.await_args.args[0]
+    assert [r["verdict"] for r in result] == ["red", "green"]
+
+
+@pytest.mark.asyncio
+async def test_only_real_gpt_calls_counted_and_merged():
+    results = {
+        "Called": EvaluationResult("Called", Verdict.GREEN, "ok", '{"v": 1}', tokens=120),
+        "Cached": EvaluationResult("Cached", Verdict.GREEN, "ok", '{"v": 2}', tokens=0),
+        "Local": EvaluationResult("Local", Verdict.RED, "scam", "yes", model="local:m", tokens=0, gpt=False),
+        "Cut": EvaluationResult("Cut", Verdict.RED, "Anon", '{"v": 3}', tokens=40, truncated=True),
+        "Failed": EvaluationResult("Failed", Verdict.ERROR, "Evaluation error: boom", "boom"),
+        # пачка из двух проектов — один запрос
+        "PackHead": EvaluationResult("PackHead", Verdict.GREEN, "ok", '{"id": "0"}', tokens=45, calls=1),
+        "PackTail": EvaluationResult("PackTail", Verdict.GREEN, "ok", '{"id": "1"}', tokens=45, calls=0),
+    }
+
+    async def fake_analyze(name: str, _descr: str):
+        return results[name]
+
+    writer = executor._BatchWriter(1, checkpoint_every=100)
+    sem = asyncio.Semaphore(3)
+    with patch.object(executor, "analyze_project", new=fake_analyze):
+        for i, name in enumerate(results):
+            await executor._evaluate(writer, i, {"name": name, "description": ""}, sem)
+
+    assert writer.gpt_calls == 3
+    texts = {row[1]: row[3] for row in writer._buf}
+    # ни шорткат, ни оборванный стрим, ни ошибка не станут GPT-вердиктом
+    assert texts == {
+        0: '{"v": 1}', 1: '{"v": 2}', 2: None, 3: None, 4: None, 5: '{"id": "0"}', 6: '{"id": "1"}',
+    }
+
+
+@pytest.mark.asyncio
+async def test_batch_writer_checkpoints_in_chunks():
+    writer = executor._BatchWriter(3, checkpoint_every=2)
+    write = AsyncMock()
+    pool = MagicMock()
+    pool.acquire.return_value.__aenter__ = AsyncMock()
+    pool.acquire.return_value.__aexit__ = AsyncMock(return_value=False)
+    with patch.object(executor, "get_pool", new=AsyncMock(return_value=pool)), \
+         patch.object(executor._BatchWriter, "_write", new=write):
+        for i in range(5):
+            await writer.add(i, {"name": f"P{i}"}, "{}" if i != 4 else None)
+
+    assert [len(call.args[1]) for call in write.await_args_list] == [2, 2]
+    assert writer.gpt_calls == 4
+
+
+@pytest.mark.asyncio
+async def test_worker_loop_refills_slots():
+    queue = list(range(1, 6))
+    claims: list[int] = []
+    done: list[int] = []
+    running = 0
+    peak = 0
+
+    async def fake_claim(limit: int):
+        claims.append(limit)
+        taken, queue[:] = queue[:limit], queue[limit:]
+        return [(bid, []) for bid in taken]
+
+    async def fake_wait(_timeout: float):
+        await asyncio.sleep(0.01)
+        return False
+
+    async def fake_process(bid: int, _payload):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01 * bid)
+        running -= 1
+        done.append(bid)
+
+    with patch.object(executor, "get_pool", new=AsyncMock()), \
+         patch.object(executor, "_claim_batches", new=fake_claim), \
+         patch.object(executor, "_process_batch", new=fake_process), \
+         patch.object(executor, "wait_new_batch", new=fake_wait):
+        task = asyncio.create_task(executor._worker_loop(slots=2))
+        for _ in range(200):
+            if len(done) == 5:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    assert sorted(done) == [1, 2, 3, 4, 5]
+    assert claims[0] == 2
+    assert peak == 2
@@ -0,0 +1,97 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+import tiktoken
+
+from cryptozayka.core import gpt_client
+
+
+def _byte_encoding() -> tiktoken.Encoding:
+    """Офлайн-кодировка: один байт — один токен."""
+    return tiktoken.Encoding(
+        "bytes",
+        pat_str=r"[\s\S]",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+
+
+def test_encoding_name_resolves_families():
+    assert gpt_client._encoding_name("gpt-4-0125-preview") == "cl100k_base"
+    assert gpt_client._encoding_name("gpt-4o-mini-2099-01-01") == "o200k_base"
+    assert gpt_client._encoding_name("llama-3-local") == "cl100k_base"
+
+
+def test_encoder_cached_and_counts(monkeypatch):
+    calls = []
+
+    def fake_get_encoding(name):
+        calls.append(name)
+        return _byte_encoding()
+
+    monkeypatch.setattr(gpt_client.tiktoken, "get_encoding", fake_get_encoding)
+    gpt_client._encoder.cache_clear()
+    gpt_client._count_memo.cache_clear()
+    try:
+        msgs = [
+            {"role": "system", "content": "sys"},
+            {"role": "user", "content": "hello"},
+            {"role": "user", "content": "<|endoftext|>"},
+        ]
+        assert gpt_client.count_messages(msgs, "gpt-4-0125-preview") == 3 + 5 + 13
+        assert gpt_client.count_batch(["ab", "abc"], "gpt-4-0125-preview") == [2, 3]
+        assert gpt_client._count("abcd", "gpt-4-0125-preview") == 4
+        assert calls == ["cl100k_base"]          # encoder загружен один раз
+    finally:
+        gpt_client._encoder.cache_clear()
+
+
+def test_unavailable_encoding_falls_back_to_heuristic(monkeypatch):
+    def broken(name):
+        raise OSError("offline")
+
+    monkeypatch.setattr(gpt_client.tiktoken, "get_encoding", broken)
+    gpt_client._encoder.cache_clear()
+    try:
+        assert gpt_client.count_batch(["x" * 40], "gpt-4") == [10]
+    finally:
+        gpt_client._encoder.cache_clear()
+
+
+@pytest.mark.asyncio
+async def test_chat_reserves_and_settles(monkeypatch):
+    from cryptozayka.core import budget
+
+    res = budget.Reservation("2026-10", "gpt-4o-mini", 510)
+    reserve = AsyncMock(return_value=res)
+    settle = AsyncMock()
+    monkeypatch.setattr(budget.ledger, "reserve", reserve)
+    monkeypatch.setattr(budget.ledger, "settle", settle)
+    monkeypatch.setattr(gpt_client, "count_messages", lambda msgs, model: 10)
+
+    reply = SimpleNamespace(
+        usage=SimpleNamespace(total_tokens=42),
+        choices=[SimpleNamespace(message=SimpleNamespace(content=" hi "))],
+    )
+    create = AsyncMock(return_value=reply)
+    monkeypatch.setattr(gpt_client._client.chat.completions, "create", create)
+
+    assert await gpt_client.chat([{"role": "user", "content": "x"}]) == "hi"
+    reserve.assert_awaited_once_with("gpt-4o-mini", 510, gpt_client.BUDGET_TOKENS)
+    settle.assert_awaited_once_with(res, 42)
+
+    create.side_effect = RuntimeError("boom")
+    with pytest.raises(RuntimeError):
+        await gpt_client.chat([{"role": "user", "content": "x"}])
+    settle.assert_awaited_with(res, 0)          # резерв снят, ничего не списано
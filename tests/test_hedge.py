@@ -0,0 +1,133 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+import asyncio
+import json
+
+import pytest
+
+from cryptozayka.core import hedge, response_cache, strategy
+from cryptozayka.core.strategy import Verdict
+
+GOOD = json.dumps({"verdict": "green", "explanation": "ok"})
+
+
+def _hedger(monkeypatch, delay=0.05, rate=1.0):
+    monkeypatch.setattr(hedge, "DEFAULT_DELAY", delay)
+    monkeypatch.setattr(hedge, "MAX_RATE", rate)
+    return hedge.Hedger()
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_loses_to_fallback(monkeypatch):
+    h = _hedger(monkeypatch)
+    cancelled = []
+
+    async def call(model):
+        try:
+            await asyncio.sleep(0.2 if model == "big" else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+        return GOOD, 10
+
+    answer, tokens, model = await h.race(call, "big", "small", json.loads)
+    await asyncio.sleep(0)
+    assert (answer, tokens, model) == (GOOD, 10, "small")
+    assert cancelled == ["big"]
+    # прожитое primary время (≥ порога) всё равно попадает в окно p95
+    assert len(h._latency) == 1 and 0.05 <= h._latency[0] < 0.2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_race_cancels_primary(monkeypatch):
+    h = _hedger(monkeypatch, delay=10)
+    cancelled = []
+
+    async def call(model):
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+        return GOOD, 10
+
+    task = asyncio.create_task(h.race(call, "big", "small", json.loads))
+    await asyncio.sleep(0.01)
+    task.cancel()                       # потеря аренды / drain
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.sleep(0)
+    assert cancelled == ["big"]
+    assert not h._latency
+
+
+@pytest.mark.asyncio
+async def test_invalid_fallback_waits_for_primary(monkeypatch):
+    h = _hedger(monkeypatch)
+
+    async def call(model):
+        if model == "small":
+            return "not json", 5
+        await asyncio.sleep(0.1)
+        return GOOD, 10
+
+    assert await h.race(call, "big", "small", json.loads) == (GOOD, 10, "big")
+
+
+@pytest.mark.asyncio
+async def test_rate_cap_skips_hedge(monkeypatch):
+    h = _hedger(monkeypatch, rate=0.0)
+    calls = []
+
+    async def call(model):
+        calls.append(model)
+        await asyncio.sleep(0.1)
+        return GOOD, 10
+
+    assert (await h.race(call, "big", "small", json.loads))[2] == "big"
+    assert calls == ["big"]
+
+
+def test_threshold_tracks_p95(monkeypatch):
+    h = _hedger(monkeypatch, delay=99)
+    assert h.threshold() == 99
+    for i in range(100):
+        h._latency.append(i / 100)
+    assert h.threshold() == pytest.approx(0.95)
+
+
+@pytest.mark.asyncio
+async def test_analyze_project_reports_fallback_model(monkeypatch):
+    monkeypatch.setattr(hedge, "ENABLED", True)
+    monkeypatch.setattr(hedge, "hedger", _hedger(monkeypatch))
+    monkeypatch.setattr(hedge, "fallback_model", lambda: "gpt-4o-mini")
+    monkeypatch.setattr(response_cache, "TTL", 3600)
+    response_cache.clear_memory()
+    stored = []
+
+    async def fake_get(key):
+        return None
+
+    async def fake_put(*args):
+        stored.append(args)
+
+    async def fake_openai(prompt, max_tokens, model=None):
+        await asyncio.sleep(1 if model == strategy.MODEL else 0.01)
+        return GOOD, 42
+
+    monkeypatch.setattr(response_cache, "get", fake_get)
+    monkeypatch.setattr(response_cache, "put", fake_put)
+    monkeypatch.setattr(strategy, "_call_openai", fake_openai)
+
+    res = await strategy.analyze_project("Foo", "bar")
+    assert res.verdict is Verdict.GREEN
+    assert res.model == "gpt-4o-mini"
+    assert stored == []     # ответ fallback не кэшируется под ключом MODEL
@@ -0,0 +1,81 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+import asyncio
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+
+from cryptozayka.core import hedge, response_cache, strategy
+from cryptozayka.core.json_extract import PARSE_RESULTS, extract_json
+from cryptozayka.core.strategy import Verdict
+
+
+def _count(shape, result):
+    return PARSE_RESULTS.labels(shape, result)._value.get()
+
+
+def test_fenced_and_chatty_answers():
+    fenced = 'Sure!\n```json\n{"verdict": "red", "explanation": "looks like {a} rug"}\n```\nHope it helps.'
+    chatty = 'My verdict: {"verdict": "green", "explanation": "solid"} — done. {"noise": 1}'
+    assert strategy._parse_answer(fenced) == (Verdict.RED, "looks like {a} rug")
+    assert strategy._parse_answer(chatty) == (Verdict.GREEN, "solid")
+
+
+def test_skips_unbalanced_candidates():
+    answer = 'Template was {"verdict": ... ok, real answer: {"verdict": "yellow", "explanation": ""}'
+    assert extract_json(answer) == {"verdict": "yellow", "explanation": ""}
+
+
+def test_failure_is_counted():
+    before = _count("dict", "failed")
+    with pytest.raises(ValueError):
+        strategy._parse_answer("I cannot evaluate this project.")
+    assert _count("dict", "failed") == before + 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("hedged", [False, True])
+async def test_final_answer_counted_once(monkeypatch, hedged):
+    fenced = '```json\n{"verdict": "red", "explanation": "rug"}\n```'
+
+    async def fake_openai(prompt, max_tokens, model=None):
+        await asyncio.sleep(1 if hedged and model == strategy.MODEL else 0)
+        return fenced, 30
+
+    monkeypatch.setattr(strategy, "_call_openai", fake_openai)
+    monkeypatch.setattr(response_cache, "enabled", lambda: True)   # путь с validate перед кэшем
+    monkeypatch.setattr(response_cache, "get", AsyncMock(return_value=None))
+    monkeypatch.setattr(response_cache, "put", AsyncMock())
+    if hedged:                                                       # validate ещё и в гонке
+        monkeypatch.setattr(hedge, "ENABLED", True)
+        monkeypatch.setattr(hedge, "DEFAULT_DELAY", 0.01)
+        monkeypatch.setattr(hedge, "MAX_RATE", 1.0)
+        monkeypatch.setattr(hedge, "hedger", hedge.Hedger())
+        monkeypatch.setattr(hedge, "fallback_model", lambda: "gpt-4o-mini")
+
+    before = _count("dict", "extracted")
+    res = await strategy.analyze_project("Rug", "x")
+    assert res.verdict is Verdict.RED
+    assert _count("dict", "extracted") == before + 1
+
+
+def test_packed_accepts_object_and_bare_array():
+    items = [{"id": "0", "verdict": "red", "explanation": "x"}]
+    wrapped = "```\n" + json.dumps({"results": items}) + "\n```"
+    assert strategy._parse_packed(wrapped, ["0"])["0"][0] is Verdict.RED
+    assert strategy._parse_packed("Here: " + json.dumps(items), ["0"])["0"][0] is Verdict.RED
+
+
+def test_json_mode_kwargs(monkeypatch):
+    assert strategy._format_kwargs() == {"response_format": {"type": "json_object"}}
+    monkeypatch.setattr(strategy, "JSON_MODE", False)
+    assert strategy._format_kwargs() == {}
@@ -0,0 +1,38 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+import pytest
+from prometheus_client import REGISTRY
+
+from cryptozayka.core import gpt_client, llm_gateway, strategy
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_one_shared_openai_client():
+    client = llm_gateway.openai_client()
+    assert strategy.client is client
+    assert gpt_client.get_client() is client
+    assert client.timeout.connect == llm_gateway.OPENAI_CONNECT_TIMEOUT
+
+
+@pytest.mark.asyncio
+async def test_observe_records_tokens_and_errors():
+    before = _sample("llm_tokens_total", provider="openai", model="m-test")
+    async with llm_gateway.observe("openai", "m-test") as call:
+        call.tokens = 7
+    assert _sample("llm_tokens_total", provider="openai", model="m-test") == before + 7
+
+    with pytest.raises(TimeoutError):
+        async with llm_gateway.observe("llama", "m-test"):
+            raise TimeoutError
+    assert _sample("llm_errors_total", provider="llama", model="m-test", error="TimeoutError") == 1
@@ -0,0 +1,42 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+import pytest
+
+from cryptozayka.core import strategy
+from cryptozayka.core.prompts import TemplateRegistry
+
+
+def test_render_and_hot_reload(tmp_path):
+    tpl = tmp_path / "eval.md"
+    tpl.write_text('Input: {{ project_json }}\n{"verdict": "green"}', encoding="utf-8")
+    (tmp_path / "short.md").write_text("{{name}} / {{ name }}", encoding="utf-8")
+
+    reg = TemplateRegistry(tmp_path, check_every=0)
+    assert reg.names() == ["eval", "short"]
+    assert reg.render("eval", project_json="{}") == 'Input: {}\n{"verdict": "green"}'
+    assert reg.render("short", name="X") == "X / X"
+
+    v1 = reg.version("eval")
+    compiled = reg.get("eval")
+    assert reg.get("eval") is compiled          # без изменений — тот же объект
+
+    tpl.write_text("v2 {{ project_json }}", encoding="utf-8")
+    assert reg.render("eval", project_json="{}") == "v2 {}"
+    assert reg.version("eval") != v1
+
+    with pytest.raises(FileNotFoundError):
+        reg.get("missing")
+
+
+def test_build_prompt_uses_default_template():
+    prompt = strategy._build_prompt({"name": "A", "description": "B"})
+    assert '"name": "A"' in prompt
+    assert "{{" not in prompt
@@ -0,0 +1,163 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+os.environ.setdefault("POSTGRES_HOST", "localhost")
+
+import contextlib
+
+import pytest
+
+import cryptozayka.storage.pg as pg_mod
+from cryptozayka import api
+from cryptozayka.core import executor
+
+
+@contextlib.asynccontextmanager
+async def _pg():
+    """Пул на цикле текущего теста + чистая очередь; нет Postgres — skip."""
+    try:
+        pool = await pg_mod.get_pool()
+    except Exception as e:
+        pg_mod._POOL = None
+        pytest.skip(f"Postgres unavailable: {e}")
+    async with pool.acquire() as c:
+        await c.execute("TRUNCATE batches, queue_tenants CASCADE")
+        await c.execute("DELETE FROM stats WHERE metric = 'queue_vclock'")
+    try:
+        yield pool
+    finally:
+        await pg_mod.close_listener()
+        await pg_mod.close_pool()
+        pg_mod._NEW_BATCH = None   # Event привязан к циклу теста
+
+
+@pytest.mark.asyncio
+async def test_add_batch_wakes_waiting_worker():
+    async with _pg():
+        # первый вызов поднимает LISTEN и сразу будит (вдруг NOTIFY пропущен)
+        assert await pg_mod.wait_new_batch(1) is True
+        assert await pg_mod.wait_new_batch(0.05) is False
+
+        await pg_mod.add_batch([{"name": "Demo", "description": "Desc"}])
+        assert await pg_mod.wait_new_batch(5) is True
+        assert await pg_mod.wait_new_batch(0.05) is False
+
+
+@pytest.mark.asyncio
+async def test_commit_after_lost_lease_is_rolled_back():
+    async with _pg() as pool:
+        bid = await pg_mod.add_batch([{"name": "LeaseDemo", "description": "d"}])
+        assert await executor._claim_batches(1) == [(bid, [{"name": "LeaseDemo", "description": "d"}])]
+        async with pool.acquire() as c:
+            await c.execute("DELETE FROM gpt_judgements WHERE project = 'LeaseDemo'")
+            # reaper вернул batch в очередь, его забрал другой воркер
+            await c.execute("UPDATE batches SET lease_owner = 'other:1' WHERE id = $1", bid)
+
+        writer = executor._BatchWriter(bid)
+        verdict = {"name": "LeaseDemo", "verdict": "red", "tokens": 5, "explanation": "x"}
+        await writer.add(0, verdict, "answer")
+        with pytest.raises(executor.LeaseLost):
+            await writer.commit([verdict])
+
+        async with pool.acquire() as c:
+            row = await c.fetchrow("SELECT status, lease_owner FROM batches WHERE id = $1", bid)
+            judged = await c.fetchval("SELECT count(*) FROM gpt_judgements WHERE project = 'LeaseDemo'")
+        assert (row["status"], row["lease_owner"]) == ("process", "other:1")
+        assert judged == 0
+
+        async with pool.acquire() as c:
+            await c.execute("UPDATE batches SET lease_owner = $2 WHERE id = $1", bid, executor._owner())
+        await writer.add(0, verdict, "answer")
+        await writer.commit([verdict])
+        async with pool.acquire() as c:
+            assert await c.fetchval("SELECT status FROM batches WHERE id = $1", bid) == "done"
+            assert await c.fetchval(
+                "SELECT verdict FROM gpt_judgements WHERE project = 'LeaseDemo'"
+            ) == "red"
+
+
+@pytest.mark.asyncio
+async def test_resume_requeues_error_verdicts():
+    projects = [{"name": n, "description": "d"} for n in ("Ok", "Outage")]
+    async with _pg():
+        bid = await pg_mod.add_batch(projects)
+        writer = executor._BatchWriter(bid)
+        ok = {"name": "Ok", "verdict": "green", "tokens": 5, "explanation": "x"}
+        await writer.add(0, ok, "answer")
+        await writer.add(1, {"name": "Outage", "verdict": "error", "tokens": None, "explanation": "503"}, None)
+        await writer.flush()
+
+        assert await executor._load_progress(bid) == {0: ok}   # Outage оценим заново
+
+
+@pytest.mark.asyncio
+async def test_commit_reports_only_gpt_judgements():
+    projects = [{"name": n, "description": "d"} for n in ("Judged", "Shortcut", "Failed")]
+    names = [p["name"] for p in projects]
+    async with _pg() as pool:
+        bid = await pg_mod.add_batch(projects)
+        await executor._claim_batches(1)
+        async with pool.acquire() as c:
+            await c.execute("DELETE FROM gpt_judgements WHERE project = ANY($1::text[])", names)
+            await c.execute("INSERT INTO gpt_judgements(project, verdict, text) VALUES ('Failed', 'green', 'old')")
+
+        writer = executor._BatchWriter(bid)
+        verdicts = [{"name": n, "verdict": "red", "tokens": 0, "explanation": "x"} for n in names]
+        verdicts[2]["verdict"] = "error"
+        await writer.add(0, verdicts[0], "answer")
+        await writer.add(1, verdicts[1], None, gpt_call=False)   # вердикт локального скрининга
+        await writer.add(2, verdicts[2], "no result in OpenAI batch")
+        assert await writer.commit(verdicts) == {0}
+
+        async with pool.acquire() as c:
+            merged = await c.fetch(
+                "SELECT project, verdict FROM gpt_judgements WHERE project = ANY($1::text[]) ORDER BY project",
+                names,
+            )
+        # ошибка не затёрла прежний вердикт
+        assert [tuple(r) for r in merged] == [("Failed", "green"), ("Judged", "red")]
+
+
+@pytest.mark.asyncio
+async def test_fair_queue_vtime_and_vclock():
+    p = [{"name": "P", "description": "d"}] * 2          # cost = 2 · VT_UNIT
+    bulk = pg_mod.PRIORITY_BULK
+    async with _pg() as pool:
+        a1, a2, a3 = [await pg_mod.add_batch(p, submitter="A", priority=bulk) for _ in range(3)]
+        b1 = await pg_mod.add_batch(p, submitter="B", priority=bulk)
+        c1 = await pg_mod.add_batch(p[:1], submitter="C")  # одиночный → interactive
+
+        async with pool.acquire() as c:
+            vt = dict(await c.fetch("SELECT id, vtime FROM batches"))
+        assert [vt[a1], vt[a2], vt[a3], vt[b1]] == [0, 2000, 4000, 0]
+
+        # interactive раньше bulk; B не ждёт всю очередь A
+        assert [bid for bid, _ in await pg_mod.claim_batches(3)] == [c1, a1, b1]
+        assert [bid for bid, _ in await pg_mod.claim_batches(1)] == [a2]
+        async with pool.acquire() as c:
+            clock = await c.fetchval("SELECT value FROM stats WHERE metric = 'queue_vclock'")
+        assert clock == 2000
+
+        # новичок стартует с системных часов, а не с нуля — и обходит хвост A
+        d1 = await pg_mod.add_batch(p, submitter="D", priority=bulk)
+        async with pool.acquire() as c:
+            assert await c.fetchval("SELECT vtime FROM batches WHERE id = $1", d1) == 2000
+        assert [bid for bid, _ in await pg_mod.claim_batches(2)] == [d1, a3]
+
+
+@pytest.mark.asyncio
+async def test_early_verdicts_visible_in_batch_status():
+    async with _pg():
+        bid = await pg_mod.add_batch([{"name": "A", "description": "a"}, {"name": "B", "description": "b"}])
+        await pg_mod.notify_verdict(bid, 1, "B", "red")
+        await pg_mod.notify_verdict(bid, 0, "A", "green")
+
+        out = api.BatchStatus(**await api.batch_status(bid))
+        assert out.status == "new"
+        assert out.early_verdicts == {0: "green", 1: "red"}
@@ -0,0 +1,104 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from cryptozayka.core import rag
+
+
+def _llama_app(state: dict) -> web.Application:
+    """Заглушка llama.cpp: считает одновременные промпты и соединения."""
+
+    async def completion(req: web.Request) -> web.Response:
+        body = await req.json()
+        prompts = body["prompt"] if isinstance(body["prompt"], list) else [body["prompt"]]
+        state["cache_prompt"] = body.get("cache_prompt")
+        state["peers"].add(req.transport.get_extra_info("peername"))
+        state["busy"] += len(prompts)
+        state["peak"] = max(state["peak"], state["busy"])
+        await asyncio.sleep(0.02)
+        state["busy"] -= len(prompts)
+        out = [{"content": "YES rug" if "Rug" in p else "NO fine"} for p in prompts]
+        return web.json_response(out if isinstance(body["prompt"], list) else out[0])
+
+    app = web.Application()
+    app.router.add_post("/completion", completion)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_client_respects_slots_and_reuses_connections():
+    state = {"busy": 0, "peak": 0, "peers": set()}
+    async with TestServer(_llama_app(state)) as server:
+        client = rag.LlamaClient(str(server.make_url("/completion")), slots=2)
+        try:
+            replies = await asyncio.gather(*(client.complete(f"p{i}") for i in range(8)))
+            many = await client.complete_many(["Rug", "ok", "Rug"])
+        finally:
+            await client.close()
+
+    assert len(replies) == 8
+    assert state["peak"] == 2                 # не больше -np слотов разом
+    assert len(state["peers"]) <= 2           # keep-alive, а не соединение на промпт
+    assert state["cache_prompt"] is True
+    assert [r["content"] for r in many] == ["YES rug", "NO fine", "YES rug"]
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout(monkeypatch):
+    state = {"busy": 0, "peak": 0, "peers": set()}
+    monkeypatch.setattr(rag, "LLAMA_QUEUE_TIMEOUT", 0.005)
+    async with TestServer(_llama_app(state)) as server:
+        client = rag.LlamaClient(str(server.make_url("/completion")), slots=1)
+        try:
+            res = await asyncio.gather(client.complete("a"), client.complete("b"), return_exceptions=True)
+        finally:
+            await client.close()
+    assert sum(isinstance(r, rag.LlamaBusy) for r in res) == 1
+
+
+@pytest.mark.asyncio
+async def test_screen_score_sends_compressed_description(monkeypatch):
+    sent = []
+
+    async def fake_complete(prompt, **extra):
+        sent.append(prompt)
+        return {"content": "NO fine"}
+
+    monkeypatch.setattr(rag, "_complete", fake_complete)
+    monkeypatch.setattr(rag, "LLAMA_DESC_TOKENS", 20)
+    description = "Cross-chain messaging protocol. " + "Join our Telegram! " * 50 + "x" * 4000
+
+    assert await rag.screen_score("Proj", description) == (0.0, "NO fine")
+    assert "Join our Telegram" not in sent[0]
+    assert len(sent[0]) < 1000
+
+
+@pytest.mark.asyncio
+async def test_screen_many_fails_fast_when_busy(monkeypatch):
+    monkeypatch.setattr(rag.client, "complete_many", AsyncMock(side_effect=rag.LlamaBusy("no slot")))
+    single = AsyncMock()
+    monkeypatch.setattr(rag, "_complete", single)
+
+    assert await rag.screen_many([("A", "a"), ("B", "b")]) == [(None, ""), (None, "")]
+    single.assert_not_awaited()               # без второго круга по одному промпту
+
+
+@pytest.mark.asyncio
+async def test_screen_many_falls_back_when_multi_prompt_unsupported(monkeypatch):
+    monkeypatch.setattr(rag.client, "complete_many", AsyncMock(side_effect=ValueError("ignored")))
+    monkeypatch.setattr(rag, "_complete", AsyncMock(return_value={"content": "YES rug"}))
+
+    assert await rag.screen_many([("A", "a"), ("B", "b")]) == [(1.0, "YES rug")] * 2
@@ -0,0 +1,103 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+os.environ.setdefault("POSTGRES_HOST", "localhost")
+
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import httpx
+import openai
+import pytest
+
+import cryptozayka.storage.pg as pg_mod
+from cryptozayka.core import strategy
+from cryptozayka.core.ratelimit import PgTokenBucketLimiter, TokenBucketLimiter, parse_reset
+
+
+def test_parse_reset():
+    assert parse_reset("6m0s") == 360.0
+    assert parse_reset("20ms") == pytest.approx(0.02)
+    assert parse_reset("1h2m3.5s") == pytest.approx(3723.5)
+    assert parse_reset("") is None
+
+
+@pytest.mark.asyncio
+async def test_bucket_learns_limits_and_refunds():
+    lim = TokenBucketLimiter("t", rpm=60, tpm=1000)
+
+    assert await lim._reserve(800) == 0
+    # второй резерв уводит TPM-ведро в минус → ждать ~ 600 / (1000/60) с
+    assert await lim._reserve(800) == pytest.approx(36, rel=0.01)
+
+    headers = {
+        "x-ratelimit-limit-tokens": "6000",
+        "x-ratelimit-remaining-requests": "0",
+    }
+    await lim.observe(headers, reserved=800, used=200)
+    assert lim.tpm == 6000
+    assert lim._req == 0
+    assert lim._tok == pytest.approx(0, abs=1)     # -600 + 600 возврата
+
+    pause = await lim.penalize({"x-ratelimit-reset-tokens": "1s"})
+    assert pause == 1.0
+
+
+@pytest.mark.asyncio
+async def test_failed_call_releases_reservation(monkeypatch):
+    lim = TokenBucketLimiter("t", rpm=60, tpm=1000)
+    err = openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+    create = AsyncMock(side_effect=err)
+    fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        with_raw_response=SimpleNamespace(create=create))))
+    monkeypatch.setattr(strategy, "client", fake)
+    monkeypatch.setattr(strategy, "get_limiter", lambda model: lim)
+    monkeypatch.setattr(strategy, "RETRY_ATTEMPTS", 2)
+    monkeypatch.setattr(strategy, "RETRY_DELAY", 0)
+
+    with pytest.raises(openai.APIConnectionError):
+        await strategy._call_openai("prompt", 300)
+    assert create.await_count == 2
+    assert lim._tok == pytest.approx(1000, abs=1)   # оба резерва вернулись
+    assert lim._req == pytest.approx(58, abs=0.1)   # запросы — нет
+
+
+@pytest.mark.asyncio
+async def test_shared_bucket_sql():
+    try:
+        pool = await pg_mod.get_pool()
+    except Exception as e:
+        pg_mod._POOL = None
+        pytest.skip(f"Postgres unavailable: {e}")
+    try:
+        async with pool.acquire() as c:
+            await c.execute("DELETE FROM rate_limits WHERE key = 'test:pg'")
+        lim = PgTokenBucketLimiter("test:pg", rpm=60, tpm=1000)
+
+        assert await lim._reserve(800) == 0
+        assert await lim._reserve(800) == pytest.approx(36, rel=0.01)
+
+        await lim.observe({"x-ratelimit-limit-tokens": "6000"}, reserved=800, used=200)
+        await lim.release(100)
+        async with pool.acquire() as c:
+            row = await c.fetchrow("SELECT tpm, req_level, tok_level FROM rate_limits WHERE key = 'test:pg'")
+        assert row["tpm"] == 6000 and lim.tpm == 6000
+        assert row["req_level"] == pytest.approx(58, abs=0.1)
+        assert row["tok_level"] == pytest.approx(100, abs=2)   # -600 + 600 + 100
+
+        # пауза 30 с, потом заголовок remaining: уровень = remaining «сейчас»,
+        # следующий резерв не доливает те же 30 с поверх ещё раз
+        async with pool.acquire() as c:
+            await c.execute(
+                "UPDATE rate_limits SET updated_at = updated_at - interval '30 seconds' WHERE key = 'test:pg'"
+            )
+        await lim.observe({"x-ratelimit-remaining-tokens": "100"}, reserved=0, used=0)
+        assert await lim._reserve(700) == pytest.approx(6, rel=0.05)   # 600 / (6000/60)
+    finally:
+        await pg_mod.close_pool()
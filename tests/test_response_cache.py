@@ -0,0 +1,83 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+
+from cryptozayka.core import response_cache, strategy
+from cryptozayka.core.strategy import Verdict
+
+
+@pytest.fixture
+def tiers(monkeypatch):
+    response_cache.clear_memory()
+    pg: dict[str, str] = {}
+
+    async def pg_get(key):
+        return pg.get(key)
+
+    async def pg_put(key, model, answer, tokens):
+        pg[key] = answer
+
+    monkeypatch.setattr(response_cache, "_pg_get", pg_get)
+    monkeypatch.setattr(response_cache, "_pg_put", pg_put)
+    yield pg
+    response_cache.clear_memory()
+
+
+@pytest.mark.asyncio
+async def test_hits_cost_zero_tokens_and_bypass(monkeypatch, tiers):
+    answer = json.dumps({"verdict": "green", "explanation": "Ok"})
+    openai = AsyncMock(return_value=(answer, 100))
+    monkeypatch.setattr(strategy, "_call_openai", openai)
+
+    first = await strategy.analyze_project("A", "d")
+    second = await strategy.analyze_project("A", "d")
+    assert (first.tokens, second.tokens) == (100, 0)
+    assert second.verdict is Verdict.GREEN
+    assert openai.await_count == 1
+
+    response_cache.clear_memory()                  # L2 общий для воркеров
+    assert (await strategy.analyze_project("A", "d")).tokens == 0
+    assert openai.await_count == 1
+
+    await strategy.analyze_project("A", "d", cache=False)
+    assert openai.await_count == 2
+
+    monkeypatch.setattr(strategy, "MODEL", "gpt-4o")   # смена модели → новый ключ
+    await strategy.analyze_project("A", "d")
+    assert openai.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_malformed_answers_are_not_cached(monkeypatch, tiers):
+    openai = AsyncMock(return_value=("not json", 50))
+    monkeypatch.setattr(strategy, "_call_openai", openai)
+
+    await strategy.analyze_project("B", "d")
+    await strategy.analyze_project("B", "d")
+    assert openai.await_count == 2
+    assert tiers == {}
+
+
+def test_memory_tier_evicts_by_size_and_ttl(monkeypatch):
+    response_cache.clear_memory()
+    monkeypatch.setattr(response_cache, "MEM_SIZE", 2)
+    for k in "abc":
+        response_cache._mem_put(k, k)
+    assert response_cache._mem_get("a") is None
+    assert response_cache._mem_get("c") == "c"
+
+    monkeypatch.setattr(response_cache, "MEM_TTL", -1)
+    response_cache._mem_put("d", "d")
+    assert response_cache._mem_get("d") is None
+    response_cache.clear_memory()
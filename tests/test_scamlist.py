@@ -0,0 +1,62 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+import json
+import random
+
+from cryptozayka.core.scamlist import Automaton, ScamIndex
+
+
+def test_automaton_matches_naive_substring_search():
+    rnd = random.Random(7)
+    words = ["".join(rnd.choice("abc") for _ in range(rnd.randint(1, 5))) for _ in range(300)]
+    auto = Automaton((w, i) for i, w in enumerate(words))
+    for _ in range(200):
+        text = "".join(rnd.choice("abcd") for _ in range(rnd.randint(0, 30)))
+        assert auto.find(text) == {i for i, w in enumerate(words) if w in text}
+
+
+def test_index_reloads_when_file_changes(tmp_path):
+    path = tmp_path / "scamlist.json"
+    index = ScamIndex(path, check_every=0)
+    assert index.match("SafeMoon Inu") == []
+
+    path.write_text(json.dumps({"scams": [{"name": "Inu"}, {"name": "SafeMoon"}, {"name": ""}]}))
+    assert index.match("SafeMoon Inu") == []      # перестройка в фоне, пока — старый индекс
+    index.join()
+    assert [s["name"] for s in index.match("SafeMoon Inu")] == ["Inu", "SafeMoon"]
+
+    path.write_text(json.dumps({"scams": [{"name": "squid game"}]}))
+    os.utime(path, ns=(1, 1))
+    index.match("x")
+    index.join()
+    assert index.match("SafeMoon Inu") == []
+    assert index.match("Squid Game 2") == [{"name": "squid game"}]
+
+
+def test_broken_file_keeps_previous_index(tmp_path):
+    path = tmp_path / "scamlist.json"
+    path.write_text(json.dumps({"scams": [{"name": "Inu"}]}))
+    index = ScamIndex(path, check_every=0)
+    assert index.match("Shiba Inu") == [{"name": "Inu"}]
+
+    path.write_text('{"scams": [{"name": "In')  # файл дописывается
+    for _ in range(3):
+        index.match("x")
+        index.join()
+        assert index.match("Shiba Inu") == [{"name": "Inu"}]
+
+    path.write_text(json.dumps({"scams": [{"name": "Shiba"}]}))
+    index.match("x")
+    index.join()
+    assert index.match("Shiba Inu") == [{"name": "Shiba"}]
+
+    path.write_text("not json")
+    assert ScamIndex(path).match("Shiba Inu") == []   # битый с самого начала — пустой индекс
@@ -0,0 +1,69 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+
+from cryptozayka.core import similar, strategy
+from cryptozayka.core.similar import Match
+from cryptozayka.core.strategy import EvaluationResult, Verdict
+
+
+def _evaluator():
+    async def evaluate(name, description, similar=None):
+        return EvaluationResult(project=name, verdict=Verdict.GREEN, explanation="", raw_model_answer="")
+
+    return AsyncMock(side_effect=evaluate)
+
+
+@pytest.mark.asyncio
+async def test_near_duplicate_of_scam_short_circuits(monkeypatch):
+    monkeypatch.setattr(similar, "find", AsyncMock(return_value=[Match("SquidGame", "red", 0.86)]))
+    evaluate = _evaluator()
+
+    res = await similar.wrap(evaluate)("Squid Game", "play to earn")
+
+    evaluate.assert_not_awaited()
+    assert res.verdict is Verdict.RED and res.tokens == 0
+    assert "SquidGame" in res.explanation
+
+
+@pytest.mark.asyncio
+async def test_weaker_matches_go_to_prompt_context(monkeypatch):
+    matches = [Match("LayerZero", "green", 0.62), Match("SquidGame", "red", 0.55)]
+    monkeypatch.setattr(similar, "find", AsyncMock(return_value=matches))
+    evaluate = _evaluator()
+
+    await similar.wrap(evaluate)("LayerZer0", "omnichain")
+    evaluate.assert_awaited_once_with("LayerZer0", "omnichain", similar=similar.as_context(matches))
+
+    evaluate.reset_mock()
+    await similar.wrap(evaluate, with_context=False)("LayerZer0", "omnichain")
+    evaluate.assert_awaited_once_with("LayerZer0", "omnichain")
+
+
+@pytest.mark.asyncio
+async def test_lookup_failure_falls_through(monkeypatch):
+    monkeypatch.setattr(similar, "find", AsyncMock(side_effect=RuntimeError("no pg_trgm")))
+    evaluate = _evaluator()
+    res = await similar.wrap(evaluate)("X", "y")
+    assert res.verdict is Verdict.GREEN
+    evaluate.assert_awaited_once_with("X", "y")
+
+
+def test_similar_context_rendered_into_prompt():
+    prompt = strategy._prepare_prompt("LayerZer0", "omnichain", [Match("LayerZero", "green", 0.62)._asdict()])
+    body = prompt.split("## Input:\n", 1)[1].split("\n\n\"similar_judged\" lists", 1)[0]
+    assert json.loads(body)["similar_judged"] == [{"project": "LayerZero", "verdict": "green", "similarity": 0.62}]
+    assert "nearest_judged" not in prompt
+    assert "similar_judged" not in strategy._project_json("LayerZer0", "omnichain")
+    assert "similar_judged" not in strategy._prepare_prompt("LayerZer0", "omnichain")
@@ -10,10 +10,12 @@ os.environ.update(
     }
 )
 
+import asyncio
 import json
 import pytest
 from unittest.mock import AsyncMock, patch
 
+from cryptozayka.core import strategy
 from cryptozayka.core.strategy import analyze_project, Verdict
 
 
@@ -30,3 +32,74 @@ async def test_analyze_project_green():
 
     assert res.verdict is Verdict.GREEN
     assert res.tokens == 100
+
+
+def _packed_reply(prompt: str, verdict: str = "red") -> str:
+    """Ответ «модели» на packed-промпт: по элементу на каждый id из входа."""
+    body = prompt.split("## Input", 1)[1].split("\n", 1)[1].split("## Output", 1)[0]
+    items = json.loads(body)
+    return json.dumps([{"id": it["id"], "verdict": verdict, "explanation": it["name"]} for it in items])
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    from cryptozayka.core import response_cache
+
+    monkeypatch.setattr(response_cache, "TTL", 0)
+
+
+@pytest.mark.asyncio
+async def test_analyze_pack_maps_results_back(no_cache):
+    calls = []
+
+    async def fake_openai(prompt, max_tokens):
+        calls.append(max_tokens)
+        return _packed_reply(prompt), 90
+
+    with patch("cryptozayka.core.strategy._call_openai", new=fake_openai):
+        res = await strategy.analyze_pack([("A", "a"), ("B", "b"), ("C", "c")])
+
+    assert calls == [3 * strategy.PACK_ANSWER_TOKENS]
+    assert [r.project for r in res] == ["A", "B", "C"]
+    assert [r.explanation for r in res] == ["A", "B", "C"]
+    assert all(r.verdict is Verdict.RED and r.tokens == 30 for r in res)
+    assert [r.calls for r in res] == [1, 0, 0]          # пачка — один вызов
+
+
+@pytest.mark.asyncio
+async def test_analyze_pack_splits_malformed(no_cache):
+    sizes = []
+
+    async def fake_openai(prompt, max_tokens):
+        n = max_tokens // strategy.PACK_ANSWER_TOKENS
+        sizes.append(n)
+        return ("[{oops" if n == 4 else _packed_reply(prompt, "green")), 10
+
+    with patch("cryptozayka.core.strategy._call_openai", new=fake_openai):
+        res = await strategy.analyze_pack([(c, c) for c in "ABCD"])
+
+    assert sorted(sizes) == [2, 2, 4]
+    assert [r.project for r in res] == list("ABCD")
+    assert all(r.verdict is Verdict.GREEN for r in res)
+    # три запроса, включая битый; их 30 токенов разнесены по проектам без потерь
+    assert [r.calls for r in res] == [2, 0, 1, 0]
+    assert [r.tokens for r in res] == [8, 8, 7, 7]
+
+
+@pytest.mark.asyncio
+async def test_packer_groups_concurrent_calls(monkeypatch, no_cache):
+    monkeypatch.setattr(strategy, "PACK_SIZE", 3)
+    pack = AsyncMock(side_effect=_fake_results)
+    monkeypatch.setattr(strategy, "analyze_pack", pack)
+
+    res = await asyncio.gather(*(strategy.analyze_project_packed(c, "") for c in "XYZ"))
+
+    pack.assert_awaited_once()
+    assert [r.project for r in res] == ["X", "Y", "Z"]
+
+
+async def _fake_results(items):
+    return [
+        strategy.EvaluationResult(project=n, verdict=Verdict.YELLOW, explanation="", raw_model_answer="")
+        for n, _ in items
+    ]
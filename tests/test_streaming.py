@@ -0,0 +1,102 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+import asyncio
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from openai import AsyncOpenAI
+
+from cryptozayka.core import response_cache, strategy
+from cryptozayka.core.ratelimit import TokenBucketLimiter
+from cryptozayka.core.streaming import IncrementalAnswer
+from cryptozayka.core.strategy import Verdict
+
+ANSWER = '{"verdict": "red", "explanation": "Anonymous team, \\"guaranteed\\" 100x returns."}'
+
+
+def test_incremental_answer_split_chunks():
+    acc = IncrementalAnswer()
+    seen = [acc.feed(ANSWER[i:i + 3]) for i in range(0, len(ANSWER), 3)]
+    assert [v for v in seen if v] == ["red"]
+    assert acc.explanation() == ('Anonymous team, "guaranteed" 100x returns.', True)
+    assert acc.answer() == ANSWER
+
+    cut = IncrementalAnswer()
+    cut.feed(ANSWER[:55])
+    parsed = json.loads(cut.answer())             # оборванный стрим → валидный JSON
+    assert parsed["verdict"] == "red"
+    assert parsed["explanation"] and 'Anonymous team, "guaranteed"'.startswith(parsed["explanation"])
+
+
+def _sse_app(chunks: list[str], state: dict) -> web.Application:
+    async def completions(req: web.Request) -> web.StreamResponse:
+        body = await req.json()
+        state["stream"] = body.get("stream")
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(req)
+        for i, piece in enumerate(chunks):
+            event = {
+                "id": "c1", "object": "chat.completion.chunk", "created": 0, "model": "m",
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            await resp.write(f"data: {json.dumps(event)}\n\n".encode())
+            state["sent"] = i + 1
+            await asyncio.sleep(0.02)     # «модель» генерирует не мгновенно
+        usage = {
+            "id": "c1", "object": "chat.completion.chunk", "created": 0, "model": "m",
+            "choices": [], "usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30},
+        }
+        await resp.write(f"data: {json.dumps(usage)}\n\ndata: [DONE]\n\n".encode())
+        return resp
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    return app
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("limit", [0, 10])
+async def test_streaming_publishes_verdict_early(monkeypatch, limit):
+    chunks = [ANSWER[i:i + 8] for i in range(0, len(ANSWER), 8)]
+    state: dict = {}
+    async with TestServer(_sse_app(chunks, state)) as server:
+        client = AsyncOpenAI(api_key="sk-test", base_url=str(server.make_url("/v1")))
+        monkeypatch.setattr(strategy, "client", client)
+        monkeypatch.setattr(strategy, "get_limiter", lambda model: TokenBucketLimiter("t"))
+        monkeypatch.setattr(strategy, "STREAM_EXPLANATION_CHARS", limit)
+        put = AsyncMock()
+        monkeypatch.setattr(response_cache, "enabled", lambda: True)
+        monkeypatch.setattr(response_cache, "get", AsyncMock(return_value=None))
+        monkeypatch.setattr(response_cache, "put", put)
+
+        published = []
+
+        async def on_verdict(v):
+            published.append((v, state["sent"]))
+
+        res = await strategy.analyze_project("Rug", "x", on_verdict=on_verdict)
+        await client.close()
+
+    assert state["stream"] is True
+    assert published and published[0][0] is Verdict.RED
+    assert published[0][1] < len(chunks)            # раньше, чем пришёл весь ответ
+    assert res.verdict is Verdict.RED
+    assert res.truncated is bool(limit)
+    if limit:
+        assert 10 <= len(res.explanation) < len('Anonymous team, "guaranteed" 100x returns.')
+        put.assert_not_awaited()                    # обрезанный ответ не кэшируем
+    else:
+        assert res.explanation == 'Anonymous team, "guaranteed" 100x returns.'
+        assert res.tokens == 30
+        put.assert_awaited_once()
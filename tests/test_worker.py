@@ -0,0 +1,82 @@
+import os
+
+os.environ.update(
+    {
+        "ETH_RPC_URL": "https://dummy.rpc",
+        "OPENAI_API_KEY": "sk-test",
+        "TELEGRAM_ADMIN_CHAT": "0",
+    }
+)
+
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from cryptozayka import worker
+
+
+# ─── дети-заглушки (spawn: должны импортироваться по имени модуля) ───
+def _crash_once_then_drain(_log_level: str) -> None:
+    d = Path(os.environ["WORKER_TEST_DIR"])
+    with (d / "runs").open("a") as f:
+        f.write(f"{os.getpid()}\n")
+    if len((d / "runs").read_text().split()) == 1:
+        sys.exit(3)                       # первый запуск падает
+
+    def _drain(*_: object) -> None:
+        (d / "drained").write_text(str(os.getpid()))
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, _drain)
+    (d / "ready").write_text("1")
+    while True:
+        time.sleep(0.05)
+
+
+def _stuck(_log_level: str) -> None:
+    d = Path(os.environ["WORKER_TEST_DIR"])
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)   # не дренируется
+    (d / "ready").write_text(str(os.getpid()))
+    while True:
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def supervisor(tmp_path, monkeypatch):
+    monkeypatch.setenv("WORKER_TEST_DIR", str(tmp_path))
+    monkeypatch.setattr(worker, "SUPERVISE_EVERY", 0.05)
+    monkeypatch.setattr(worker, "RESTART_BACKOFF", 0.0)
+    handlers = signal.getsignal(signal.SIGTERM), signal.getsignal(signal.SIGINT)
+
+    def _term_when_ready() -> None:
+        deadline = time.monotonic() + 30
+        while not (tmp_path / "ready").exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    threading.Thread(target=_term_when_ready, daemon=True).start()
+    yield tmp_path
+    signal.signal(signal.SIGTERM, handlers[0])
+    signal.signal(signal.SIGINT, handlers[1])
+
+
+def test_crashed_child_restarted_and_sigterm_forwarded(supervisor):
+    worker.run_procs(1, target=_crash_once_then_drain, drain_timeout=30)
+
+    runs = (supervisor / "runs").read_text().split()
+    assert len(runs) == 2                                  # упал → перезапущен
+    assert (supervisor / "drained").read_text() == runs[1]  # SIGTERM дошёл до ребёнка
+
+
+def test_child_killed_after_drain_timeout(supervisor):
+    t0 = time.monotonic()
+    worker.run_procs(1, target=_stuck, drain_timeout=0.3)
+
+    assert time.monotonic() - t0 < 30
+    pid = int((supervisor / "ready").read_text())
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)